@@ -0,0 +1,127 @@
+import asyncio
+import time
+from collections import deque
+from typing import Any, Deque, Dict, Optional, Set, Tuple
+
+from metrics import LatencyHistogram
+from tracing import get_tracer
+
+# queue: 并发请求数达到上限后在有界队列中排队，队列满时拒绝；shed: 达到上限即拒绝
+ADMISSION_POLICIES = ("queue", "shed")
+
+
+class AdmissionRejected(Exception):
+    pass
+
+
+class AdmissionStats:
+    def __init__(self) -> None:
+        self.admitted = 0
+        self.queued = 0
+        self.rejected = 0
+        self.expired = 0
+        self.max_queue_depth = 0
+        self.queue_wait = LatencyHistogram()
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "admitted": self.admitted,
+            "queued": self.queued,
+            "rejected": self.rejected,
+            "expired": self.expired,
+            "max_queue_depth": self.max_queue_depth,
+            "queue_wait": self.queue_wait.summary(),
+        }
+
+
+# 编排入口前的准入控制：限制同时处理的请求（correlation）数量，超出的请求按策略排队或直接拒绝
+class AdmissionController:
+    def __init__(self, max_in_flight: int = 64, max_queue: int = 256, policy: str = "queue") -> None:
+        if max_in_flight < 1:
+            raise ValueError("max_in_flight must be at least 1")
+        if policy not in ADMISSION_POLICIES:
+            raise ValueError(f"Unknown admission policy: {policy}")
+        self.max_in_flight = max_in_flight
+        self.max_queue = max_queue
+        self.policy = policy
+        self.stats = AdmissionStats()
+        self._in_flight: Set[str] = set()
+        self._waiters: Deque[Tuple[str, asyncio.Future]] = deque()
+
+    @property
+    def in_flight(self) -> int:
+        return len(self._in_flight)
+
+    @property
+    def queue_depth(self) -> int:
+        return len(self._waiters)
+
+    def _reject(self, correlation_id: str, reason: str) -> AdmissionRejected:
+        self.stats.rejected += 1
+        get_tracer().count("admission.rejected")
+        return AdmissionRejected(f"Request {correlation_id} rejected: {reason}")
+
+    # 返回排队等待的秒数；deadline 为 wall-clock 时间戳，排队期间到期同样视为拒绝
+    async def acquire(self, correlation_id: str, deadline: Optional[float] = None) -> float:
+        if len(self._in_flight) < self.max_in_flight and not self._waiters:
+            self._admit(correlation_id)
+            self.stats.queue_wait.add(0.0)
+            return 0.0
+        if self.policy == "shed":
+            raise self._reject(correlation_id, "too many requests in flight")
+        if len(self._waiters) >= self.max_queue:
+            raise self._reject(correlation_id, "intake queue is full")
+
+        started = time.perf_counter()
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.append((correlation_id, future))
+        self.stats.queued += 1
+        self.stats.max_queue_depth = max(self.stats.max_queue_depth, len(self._waiters))
+        get_tracer().gauge("admission.queue_depth", len(self._waiters))
+        try:
+            if deadline is None:
+                await future
+            else:
+                await asyncio.wait_for(asyncio.shield(future), max(0.0, deadline - time.time()))
+        except BaseException as e:
+            if future.done() and not future.cancelled():
+                # 已经分到名额但调用方放弃等待，把名额交给下一个请求
+                self.release(correlation_id)
+            else:
+                future.cancel()
+                self._remove_waiter(future)
+            if isinstance(e, asyncio.TimeoutError):
+                self.stats.expired += 1
+                raise self._reject(correlation_id, "deadline expired while queued") from None
+            raise
+        wait = time.perf_counter() - started
+        self.stats.queue_wait.add(wait)
+        get_tracer().observe("admission.queue_wait", wait)
+        return wait
+
+    def _admit(self, correlation_id: str) -> None:
+        self._in_flight.add(correlation_id)
+        self.stats.admitted += 1
+        get_tracer().gauge("admission.in_flight", len(self._in_flight))
+
+    def _remove_waiter(self, future: asyncio.Future) -> None:
+        for index, (_, waiter) in enumerate(self._waiters):
+            if waiter is future:
+                del self._waiters[index]
+                return
+
+    def release(self, correlation_id: str) -> None:
+        if correlation_id not in self._in_flight:
+            return
+        self._in_flight.discard(correlation_id)
+        while self._waiters and len(self._in_flight) < self.max_in_flight:
+            waiting_id, future = self._waiters.popleft()
+            if future.done():
+                continue
+            self._admit(waiting_id)
+            future.set_result(None)
+        get_tracer().gauge("admission.in_flight", len(self._in_flight))
+        get_tracer().gauge("admission.queue_depth", len(self._waiters))
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {"in_flight": len(self._in_flight), "queue_depth": len(self._waiters), **self.stats.snapshot()}
@@ -1,86 +1,365 @@
 import asyncio
+import logging
+import os
+import time
+import uuid
 
-from autogen_core import SingleThreadedAgentRuntime, RoutedAgent, message_handler, TopicId, TypeSubscription
+from autogen_core import AgentId, AgentInstantiationContext, SingleThreadedAgentRuntime, RoutedAgent, message_handler, TopicId, TypeSubscription
 
-from typing import Any, Dict, Optional
-from agent_core.agents import Agent
+from typing import TYPE_CHECKING, Any, AsyncIterator, Callable, Dict, List, Optional, Set
 
-from base_agent import BaseAgent
-from evaluator import Evaluator
-from llm_client import LLMClient
+from admission import AdmissionController, AdmissionRejected
+from agent_pool import AgentPool
+from base_agent import BaseAgent, run_with_deadline
+from checkpoint import CheckpointStore, RetryPolicy
+from context_store import ContextStore, get_default_context_store, resolve_message_context
+from evaluator import EvaluationBatcher, Evaluator
+from executor import AgentExecutor
+from llm_cache import get_default_cache
+from llm_client import LLMClient, get_default_dispatcher, get_default_llm_client
+from manifest import AgentSpec, load_manifest
 from message import ErrorNotificationMessage, AgentTaskMessage, AgentResultMessage, UserRequestMessage
 from orchestrator import Orchestrator
+from prompt_builder import get_default_prompt_builder
 from register import DEFAULT_TOPIC, Register
+from tracing import get_tracer
+
+# agent_core 和多进程相关模块只在真正用到时才导入，缩短冷启动时间
+if TYPE_CHECKING:
+    from agent_core.agents import Agent
+    from transport import BrokerClient
+
+logger = logging.getLogger(__name__)
+
+
+def _new_default_agent() -> "Agent":
+    from agent_core.agents import Agent
+    return Agent()
+
+# 一个订阅覆盖所有批量注册的 agent：topic 类型为 agent 名称或直接消息前缀（"名称:"）时投递给同名 agent。
+# autogen 每次 add_subscription 都线性查重，逐个添加订阅会让注册上千个 agent 退化成 O(n²)
+class AgentTopicSubscription:
+    def __init__(self) -> None:
+        self._id = str(uuid.uuid4())
+        self.agent_types: Set[str] = set()
+
+    @property
+    def id(self) -> str:
+        return self._id
+
+    def _agent_type(self, topic_type: str) -> Optional[str]:
+        agent_type = topic_type.split(":", 1)[0]
+        return agent_type if agent_type in self.agent_types else None
+
+    def is_match(self, topic_id: TopicId) -> bool:
+        return self._agent_type(topic_id.type) is not None
+
+    def map_to_agent(self, topic_id: TopicId) -> AgentId:
+        return AgentId(type=self._agent_type(topic_id.type), key=topic_id.source)
+
+    def __eq__(self, other: object) -> bool:
+        return isinstance(other, AgentTopicSubscription) and other.id == self.id
 
-llm_client = LLMClient()
 
 class ExternalAgentWrapper(RoutedAgent):
-    def __init__(self, name: str, description: str, topic: Optional[str], external_agent: Any) -> None:
+    context_needs = ("original_request", "prev_result", "upstream_results")
+
+    def __init__(self, name: str, description: str, topic: Optional[str], external_agent: Any,
+                 executor: Optional[AgentExecutor] = None, context_store: Optional[ContextStore] = None) -> None:
         super().__init__(description)
         self.name = name
         self.description = description
         self.topic = topic if topic is not None else DEFAULT_TOPIC
         self.external_agent = external_agent
-        Register.register_external_agent(external_agent, self.name, self.description, self.topic)
+        self.executor = executor if executor is not None else AgentExecutor(external_agent)
+        self.context_store = context_store if context_store is not None else get_default_context_store()
+        Register.ensure_agent(self.name, self.description, self.topic)
 
     @message_handler
-    async def handle_task(self, message: AgentTaskMessage, ctx) -> None:
-        print(f"[ExternalAgentWrapper {self.name}] Received task: {message.payload['task']}")
+    async def handle_task(self, message: AgentTaskMessage, ctx) -> AgentResultMessage:
+        logger.info("%s received task: %s", self.name, message.payload['task'])
+        # 外部 agent 的返回文本格式不受控制，只有执行抛出异常或超过截止时间才算失败
+        success = True
         try:
-            result = self.external_agent.execute(message.payload['task'], message.payload.get("context", {}))
+            context = resolve_message_context(message.payload, self.context_needs, self.context_store)
+            result = await run_with_deadline(self.executor.run(message.payload['task'], context),
+                                             message.payload.get("deadline"), ctx.cancellation_token)
+        except asyncio.TimeoutError:
+            logger.warning("%s exceeded the deadline of task %s", self.name, message.header.correlation_id)
+            get_tracer().count("agent.deadline_exceeded")
+            result = "Execution error: deadline exceeded"
+            success = False
         except Exception as e:
-            error_msg = ErrorNotificationMessage.create(sender=self.name, error_info=str(e), correlation_id=message.header.correlation_id)
+            logger.exception("%s failed to execute task", self.name)
+            get_tracer().count("agent.failures")
+            error_msg = ErrorNotificationMessage.create(sender=self.name, error_info=str(e), correlation_id=message.header.correlation_id,
+                                                        trusted=True)
             await self.publish_message(error_msg, topic_id=TopicId("Error", source=self.name))
             result = f"Execution error: {str(e)}"
-        success = "success" in result.lower()
+            success = False
+        # 和 BaseAgent 一样把结果直接返回给 delegate_task，而不是发布到没有处理者的 Orchestrator 主题
         agent_result = AgentResultMessage.create(sender=self.name,
                                                  correlation_id=message.header.correlation_id,
                                                  result=result,
-                                                 success=success)
-        await self.publish_message(agent_result, topic_id=TopicId("Orchestrator", source=self.name))
-        print(f"[ExternalAgentWrapper {self.name}] Published result: {result}")
+                                                 context=message.payload.get("context"),
+                                                 context_ref=message.payload.get("context_ref"),
+                                                 success=success,
+                                                 trusted=True)
+        logger.debug("%s processed task '%s' with result: %s", self.name, message.payload["task"], result)
+        return agent_result
 
 
 class AgentController:
-    def __init__(self):
+    def __init__(self, max_parallel_subtasks: int = 4, context_store: Optional[ContextStore] = None,
+                 checkpoint_dir: Optional[str] = None, retry_policy: Optional[RetryPolicy] = None,
+                 broker_path: Optional[str] = None, evaluation_mode: str = "final",
+                 evaluation_batch_size: int = 1, evaluation_max_wait: float = 0.02,
+                 max_in_flight_requests: int = 64, intake_queue_size: int = 256, admission_policy: str = "queue",
+                 request_timeout: Optional[float] = None, llm_client: Optional[LLMClient] = None):
+        self.max_parallel_subtasks = max_parallel_subtasks
+        self.checkpoints = CheckpointStore(checkpoint_dir)
+        self.retry_policy = retry_policy if retry_policy is not None else RetryPolicy()
+        self.context_store = context_store if context_store is not None else get_default_context_store()
+        self.evaluation_mode = evaluation_mode
+        self.llm_client = llm_client if llm_client is not None else get_default_llm_client()
+        # 批大小大于 1 时，多个请求的评估合并成一次 LLM 调用
+        self.evaluation_batcher = EvaluationBatcher(self.llm_client, evaluation_batch_size, evaluation_max_wait) \
+            if evaluation_batch_size > 1 else None
+        # 同时编排的请求数超过 max_in_flight_requests 后，新请求进入有界队列等待（queue）或直接被拒绝（shed）
+        self.admission = AdmissionController(max_in_flight_requests, intake_queue_size, admission_policy)
+        self.request_timeout = request_timeout
         self.runtime = SingleThreadedAgentRuntime()
         self.agents: Dict[str, Any] = {}
+        self.executors: Dict[str, AgentExecutor] = {}
+        self.pools: Dict[str, AgentPool] = {}
         self.evaluator: Optional[Evaluator] = None
         self.orchestrator: Optional[Orchestrator] = None
+        self.pending_requests: Dict[str, asyncio.Future] = {}
+        self.streams: Dict[str, asyncio.Queue] = {}
+        # 设置 broker_path 后，其他 worker 进程托管的 agent 类型经 broker 发现，并以代理的形式注册到本地 runtime；
+        # 只有 agent 的执行被卸载，编排、评估、LLM 调用和上下文存储仍在本进程中
+        self.broker_path = broker_path
+        self.broker: Optional["BrokerClient"] = None
+        self.remote_agents: Set[str] = set()
+        self.bulk_subscription: Optional[AgentTopicSubscription] = None
 
-    async def register_components(self):
-        self.evaluator = await Evaluator.register(self.runtime, type="Evaluator", factory=lambda: Evaluator())
-        self.orchestrator = await Orchestrator.register(self.runtime, type="Orchestrator", factory=lambda: Orchestrator())
+    async def register_components(self, generic_agent: Optional["Agent"] = None):
+        self.evaluator = await Evaluator.register(self.runtime, type="Evaluator", factory=lambda: Evaluator(self.context_store, self.llm_client,
+                                                                                                  self.evaluation_batcher))
+        self.orchestrator = await Orchestrator.register(self.runtime, type="Orchestrator", factory=lambda: Orchestrator(self.max_parallel_subtasks, self.context_store,
+                                                                                                   self.checkpoints, self.retry_policy,
+                                                                                                   on_complete=self._complete_request,
+                                                                                                   pools=self.pools,
+                                                                                                   on_chunk=self._forward_chunk,
+                                                                                                   evaluation_mode=self.evaluation_mode,
+                                                                                                   admission=self.admission,
+                                                                                                   request_timeout=self.request_timeout,
+                                                                                                   on_reject=self._reject_request,
+                                                                                                   llm_client=self.llm_client))
         await self.runtime.add_subscription(TypeSubscription(topic_type="AgentResult", agent_type="*"))
         # 注册一个 GenericAgent，用于当 LLM 选择失败时的兜底方案
-        await BaseAgent.register(self.runtime, type="GenericAgent", factory=lambda: BaseAgent("GenericAgent", "Generic agent for common tasks", "GenericAgent", Agent()))
+        await BaseAgent.register(self.runtime, type="GenericAgent", factory=lambda: BaseAgent("GenericAgent", "Generic agent for common tasks", "GenericAgent",
+                                                                                              generic_agent if generic_agent is not None else _new_default_agent(),
+                                                                                              context_store=self.context_store))
         await self.runtime.add_subscription(TypeSubscription(topic_type="GenericAgent", agent_type="GenericAgent"))
 
-    async def register_user_agent(self, agent_name: str, description: str, topic: Optional[str], source_agent: Agent):
-        agent = await BaseAgent.register(self.runtime, type=agent_name, factory=lambda: BaseAgent(agent_name, description, topic, source_agent))
+    # 传入 agent_factory 时，agent、执行器和 runtime 中的 agent 实例都在第一次分发到该实例时才创建；
+    # pool_size 大于 1 时必须提供 agent_factory，池中每个实例各自调用一次
+    async def register_user_agent(self, agent_name: str, description: str, topic: Optional[str],
+                                  source_agent: Optional["Agent"] = None, execution_backend: str = "auto",
+                                  max_concurrency: int = 4, pool_size: int = 1, balancing: str = "least_outstanding",
+                                  agent_factory: Optional[Callable[[], "Agent"]] = None):
+        await self._register_user_agent(agent_name, description, topic, source_agent, agent_factory,
+                                        execution_backend, max_concurrency, pool_size, balancing)
         await self.runtime.add_subscription(TypeSubscription(topic_type=agent_name, agent_type=agent_name))
         Register.register_agent(agent_name, description, topic)
-        self.agents[agent_name] = agent
 
-    async def register_custom_agent(self, external_agent: Any, name: str, description: str, topic: Optional[str]):
-        wrapper = ExternalAgentWrapper(name, description, topic, external_agent)
-        await wrapper.register(self.runtime, type=wrapper.name)
-        await self.runtime.add_subscription(TypeSubscription(topic_type=wrapper.topic, agent_type=wrapper.name))
-        self.agents[name] = wrapper
+    async def _register_user_agent(self, agent_name: str, description: str, topic: Optional[str],
+                                   source_agent: Optional["Agent"], agent_factory: Optional[Callable[[], "Agent"]],
+                                   execution_backend: str, max_concurrency: int, pool_size: int, balancing: str,
+                                   skip_direct_message_subscription: bool = False) -> None:
+        if source_agent is None and agent_factory is None:
+            raise ValueError(f"Agent {agent_name} needs a source_agent or an agent_factory")
+        if pool_size > 1 and agent_factory is None:
+            raise ValueError(f"Agent {agent_name} has pool_size {pool_size} but only a single source_agent, "
+                             "pass agent_factory so that every pool instance gets its own agent")
+        pool = AgentPool(agent_name, size=pool_size, strategy=balancing)
+        self.pools[agent_name] = pool
+
+        def factory() -> BaseAgent:
+            key = AgentInstantiationContext.current_agent_id().key
+            key = key if key in pool.keys else pool.keys[0]
+            # 池中每个实例有自己的 agent 和执行器，健康状态和冷却按实例独立生效；总并发为 pool_size * max_concurrency
+            name = agent_name if key == "default" else f"{agent_name}/{key}"
+            executor = self.executors.get(name)
+            if executor is None:
+                agent = source_agent if source_agent is not None and pool_size == 1 else agent_factory()
+                executor = self.executors[name] = AgentExecutor(agent, backend=execution_backend,
+                                                                max_concurrency=max_concurrency, name=name)
+            return BaseAgent(agent_name, description, topic, executor.agent, executor, self.context_store)
+
+        self.agents[agent_name] = await BaseAgent.register(self.runtime, type=agent_name, factory=factory,
+                                                           skip_direct_message_subscription=skip_direct_message_subscription)
+
+    # 按清单批量注册：注册表只发布一次新快照，清单中的 agent 模块在第一次分发时才导入
+    async def register_manifest(self, path: str) -> List[str]:
+        specs = load_manifest(path)
+        await self.register_agent_specs(specs)
+        return [spec.name for spec in specs]
+
+    async def register_agent_specs(self, specs: List[AgentSpec]) -> None:
+        if self.bulk_subscription is None:
+            self.bulk_subscription = AgentTopicSubscription()
+            await self.runtime.add_subscription(self.bulk_subscription)
+        for spec in specs:
+            await self._register_user_agent(spec.name, spec.description, spec.topic, None, spec.agent_factory(),
+                                            spec.execution_backend, spec.max_concurrency, spec.pool_size, spec.balancing,
+                                            skip_direct_message_subscription=True)
+            self.bulk_subscription.agent_types.add(spec.name)
+        Register.register_agents([(spec.name, spec.description, spec.topic) for spec in specs])
+        logger.info("Registered %d agents from manifest", len(specs))
+
+    async def register_custom_agent(self, external_agent: Any, name: str, description: str, topic: Optional[str],
+                                    execution_backend: str = "auto", max_concurrency: int = 4):
+        executor = AgentExecutor(external_agent, backend=execution_backend, max_concurrency=max_concurrency, name=name)
+        self.executors[name] = executor
+        Register.register_external_agent(external_agent, name, description, topic)
+        self.agents[name] = await ExternalAgentWrapper.register(
+            self.runtime, type=name,
+            factory=lambda: ExternalAgentWrapper(name, description, topic, external_agent, executor, self.context_store))
+        await self.runtime.add_subscription(TypeSubscription(topic_type=topic if topic is not None else DEFAULT_TOPIC,
+                                                             agent_type=name))
 
     async def remove_agent(self, agent_name: str):
         Register.remove_agent(agent_name)
         if agent_name in self.agents:
             del self.agents[agent_name]
+        self.pools.pop(agent_name, None)
+        for name in [name for name in self.executors if name == agent_name or name.startswith(f"{agent_name}/")]:
+            self.executors.pop(name).shutdown()
+
+    async def _sync_remote_agents(self, version: int, agents: Dict[str, Dict[str, Any]]) -> None:
+        from worker import RemoteAgentProxy
+        remote = {name: info for name, info in agents.items() if name not in self.agents and name != "GenericAgent"}
+        for name in remote:
+            if name not in self.remote_agents:
+                await RemoteAgentProxy.register(self.runtime, type=name,
+                                                factory=lambda name=name: RemoteAgentProxy(name, self.broker, self.context_store))
+                self.remote_agents.add(name)
+        Register.sync_remote_agents(remote, version)
+
+    async def wait_for_agents(self, agent_names: List[str], timeout: float = 30.0) -> None:
+        if self.broker is not None:
+            await self.broker.wait_for_agents(agent_names, timeout)
+
+    def _complete_request(self, correlation_id: str, final_result: Optional[str], completed: bool) -> None:
+        future = self.pending_requests.pop(correlation_id, None)
+        if future is not None and not future.done():
+            future.set_result(final_result)
+        queue = self.streams.get(correlation_id)
+        if queue is not None:
+            queue.put_nowait({"final_result": final_result, "completed": completed})
+
+    def _reject_request(self, correlation_id: str, reason: str) -> None:
+        future = self.pending_requests.pop(correlation_id, None)
+        if future is not None and not future.done():
+            future.set_exception(AdmissionRejected(reason))
+        queue = self.streams.get(correlation_id)
+        if queue is not None:
+            queue.put_nowait(AdmissionRejected(reason))
+
+    def _forward_chunk(self, correlation_id: str, subtask_id: Optional[str], chunk: str) -> None:
+        queue = self.streams.get(correlation_id)
+        if queue is not None:
+            queue.put_nowait({"subtask_id": subtask_id, "chunk": chunk})
+
+    @staticmethod
+    def _deadline(timeout: Optional[float]) -> Optional[float]:
+        return time.time() + timeout if timeout is not None else None
+
+    # 发布用户请求并等待编排完成，返回最终结果；被准入控制拒绝时抛出 AdmissionRejected，超时返回 None
+    async def submit(self, request_content: str, sender: str = "User", timeout: Optional[float] = None) -> Optional[str]:
+        user_msg = UserRequestMessage.create(sender=sender, request_content=request_content, deadline=self._deadline(timeout))
+        future = asyncio.get_running_loop().create_future()
+        self.pending_requests[user_msg.header.message_id] = future
+        await self.runtime.publish_message(user_msg, topic_id=TopicId("Orchestrator", source=sender))
+        return await future
+
+    # 流式提交：依次产出 {"subtask_id", "chunk"} 片段，最后一项为 {"final_result", "completed"}
+    async def stream(self, request_content: str, sender: str = "User",
+                     timeout: Optional[float] = None) -> AsyncIterator[Dict[str, Any]]:
+        user_msg = UserRequestMessage.create(sender=sender, request_content=request_content, stream=True,
+                                             deadline=self._deadline(timeout))
+        correlation_id = user_msg.header.message_id
+        queue: asyncio.Queue = asyncio.Queue()
+        self.streams[correlation_id] = queue
+        try:
+            await self.runtime.publish_message(user_msg, topic_id=TopicId("Orchestrator", source=sender))
+            while True:
+                item = await queue.get()
+                if isinstance(item, AdmissionRejected):
+                    raise item
+                yield item
+                if "final_result" in item:
+                    return
+        finally:
+            self.streams.pop(correlation_id, None)
+
+    def get_routing_stats(self) -> Dict[str, float]:
+        return Register.get_routing_index().stats.snapshot()
+
+    def get_context_stats(self) -> Dict[str, Any]:
+        return self.context_store.stats()
+
+    def get_checkpoint_stats(self) -> Dict[str, Any]:
+        return self.checkpoints.stats()
+
+    def get_llm_cache_stats(self) -> Dict[str, Any]:
+        return get_default_cache().stats.snapshot()
+
+    def get_llm_dispatch_stats(self) -> Dict[str, Any]:
+        return get_default_dispatcher().stats.snapshot()
+
+    def get_evaluation_stats(self) -> Dict[str, Any]:
+        return self.evaluation_batcher.stats.snapshot() if self.evaluation_batcher is not None else {}
+
+    def get_prompt_stats(self) -> Dict[str, Any]:
+        return get_default_prompt_builder().stats.snapshot()
+
+    def get_trace_metrics(self) -> Dict[str, Any]:
+        return get_tracer().snapshot()
+
+    def get_admission_stats(self) -> Dict[str, Any]:
+        return self.admission.snapshot()
+
+    def get_pool_stats(self) -> Dict[str, Dict[str, Any]]:
+        return {name: pool.stats() for name, pool in self.pools.items()}
+
+    def get_execution_stats(self) -> Dict[str, Dict[str, Any]]:
+        return {name: executor.stats.snapshot() for name, executor in self.executors.items()}
 
     async def start(self):
         self.runtime.start()
+        # agent 经 DispatchedLLMChat 从执行器线程提交调用时需要调度器已绑定到 runtime 的事件循环
+        get_default_dispatcher().start()
+        if self.broker_path is not None:
+            from transport import BrokerClient
+            self.broker = BrokerClient(self.broker_path, f"controller-{os.getpid()}", on_registry=self._sync_remote_agents)
+            await self.broker.connect()
+            await self.broker.hello({})
 
     async def stop(self):
         await self.runtime.stop_when_idle()
+        if self.broker is not None:
+            await self.broker.close()
+        for executor in self.executors.values():
+            executor.shutdown()
+        await get_default_dispatcher().close()
 
 
 async def main():
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s %(levelname)s %(message)s")
+    from agent_core.agents import Agent
 
     manager = AgentController()
     await manager.register_components()
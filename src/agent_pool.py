@@ -0,0 +1,107 @@
+import bisect
+import hashlib
+import time
+from typing import Any, Dict, List, Optional
+
+BALANCING_STRATEGIES = ("least_outstanding", "consistent_hash")
+
+
+def _hash(value: str) -> int:
+    return int.from_bytes(hashlib.md5(value.encode("utf-8")).digest()[:8], "big")
+
+
+class InstanceState:
+    def __init__(self, key: str) -> None:
+        self.key = key
+        self.outstanding = 0
+        self.completed = 0
+        self.failed = 0
+        self.consecutive_failures = 0
+        self.unhealthy_until = 0.0
+
+    def healthy(self, now: float) -> bool:
+        return now >= self.unhealthy_until
+
+    def snapshot(self, now: float) -> Dict[str, Any]:
+        return {
+            "outstanding": self.outstanding,
+            "completed": self.completed,
+            "failed": self.failed,
+            "healthy": self.healthy(now),
+        }
+
+
+class AgentPool:
+    def __init__(self, agent_type: str, size: int = 1, strategy: str = "least_outstanding",
+                 failure_threshold: int = 3, cooldown: float = 30.0, virtual_nodes: int = 64) -> None:
+        if size < 1:
+            raise ValueError("pool size must be at least 1")
+        if strategy not in BALANCING_STRATEGIES:
+            raise ValueError(f"Unknown balancing strategy: {strategy}")
+        self.agent_type = agent_type
+        self.strategy = strategy
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        # 单实例时沿用原来的 "default" key，保持与未使用池时相同的 AgentId
+        self.keys = ["default"] if size == 1 else [str(i) for i in range(size)]
+        self.instances: Dict[str, InstanceState] = {key: InstanceState(key) for key in self.keys}
+        # 哈希环只在一致性哈希策略下使用，按需构建以减少注册大量 agent 时的开销
+        points = sorted((_hash(f"{agent_type}/{key}/{v}"), key) for key in self.keys for v in range(virtual_nodes)) \
+            if strategy == "consistent_hash" else []
+        self._ring: List[int] = [point for point, _ in points]
+        self._ring_keys: List[str] = [key for _, key in points]
+        self._next = 0
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def _candidates(self, now: float) -> List[str]:
+        healthy = [key for key in self.keys if self.instances[key].healthy(now)]
+        return healthy if healthy else self.keys
+
+    def _consistent_hash(self, correlation_id: str, candidates: List[str]) -> str:
+        allowed = set(candidates)
+        start = bisect.bisect(self._ring, _hash(correlation_id))
+        for offset in range(len(self._ring)):
+            key = self._ring_keys[(start + offset) % len(self._ring)]
+            if key in allowed:
+                return key
+        return candidates[0]
+
+    def _least_outstanding(self, candidates: List[str]) -> str:
+        # 从轮转位置开始比较，负载相同时在实例之间轮流分配
+        self._next = (self._next + 1) % len(self.keys)
+        rotated = candidates[self._next % len(candidates):] + candidates[:self._next % len(candidates)]
+        return min(rotated, key=lambda key: self.instances[key].outstanding)
+
+    def acquire(self, correlation_id: Optional[str] = None) -> str:
+        candidates = self._candidates(time.monotonic())
+        if len(candidates) == 1:
+            key = candidates[0]
+        elif self.strategy == "consistent_hash" and correlation_id is not None:
+            key = self._consistent_hash(correlation_id, candidates)
+        else:
+            key = self._least_outstanding(candidates)
+        self.instances[key].outstanding += 1
+        return key
+
+    def release(self, key: str, success: bool = True) -> None:
+        instance = self.instances[key]
+        instance.outstanding -= 1
+        if success:
+            instance.completed += 1
+            instance.consecutive_failures = 0
+            return
+        instance.failed += 1
+        instance.consecutive_failures += 1
+        if instance.consecutive_failures >= self.failure_threshold:
+            instance.unhealthy_until = time.monotonic() + self.cooldown
+            instance.consecutive_failures = 0
+
+    def stats(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        return {
+            "strategy": self.strategy,
+            "outstanding": sum(instance.outstanding for instance in self.instances.values()),
+            "instances": {key: instance.snapshot(now) for key, instance in self.instances.items()},
+        }
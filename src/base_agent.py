@@ -1,41 +1,111 @@
-from typing import Optional
-
-from agent_core.agents import Agent
+import asyncio
+import logging
+import time
+from typing import TYPE_CHECKING, Any, Awaitable, Dict, Optional
 
 from autogen_core import (
+    CancellationToken,
     RoutedAgent,
     TopicId,
     message_handler
 )
 
-from message import AgentTaskMessage, ErrorNotificationMessage, AgentResultMessage
+from context_store import ContextStore, get_default_context_store, resolve_message_context
+from executor import AgentExecutor
+from message import AgentTaskMessage, ErrorNotificationMessage, AgentResultMessage, AgentResultChunkMessage
 from register import DEFAULT_TOPIC, Register
+from tracing import get_tracer
+
+if TYPE_CHECKING:
+    from agent_core.agents import Agent
+
+logger = logging.getLogger(__name__)
+
+
+def build_task_input(task_content: str, context: Dict[str, Any]) -> str:
+    upstream_results = context.get("upstream_results") or {}
+    if not upstream_results:
+        return task_content
+    sections = "\n\n".join(f"[{task}]\n{result}" for task, result in upstream_results.items())
+    return f"{task_content}\n\nResults of the tasks this task depends on:\n{sections}"
+
+
+# 截止时间到达或编排者取消（请求超时）时中止执行；远端 worker 收不到取消信号，只按截止时间中止
+async def run_with_deadline(awaitable: Awaitable[Any], deadline: Optional[float],
+                            cancellation_token: Optional[CancellationToken] = None) -> Any:
+    task = asyncio.ensure_future(awaitable)
+    if cancellation_token is not None:
+        cancellation_token.link_future(task)
+    if deadline is None:
+        return await task
+    return await asyncio.wait_for(task, max(0.0, deadline - time.time()))
 
 
 class BaseAgent(RoutedAgent):
-    def __init__(self, name: str, description: str, topic: Optional[str], source_agent: Agent) -> None:
+    # 子类可以声明自己需要的上下文切片，例如 ("original_request", "prev_result")
+    context_needs = ("upstream_results",)
+
+    def __init__(self, name: str, description: str, topic: Optional[str], source_agent: "Agent",
+                 executor: Optional[AgentExecutor] = None, context_store: Optional[ContextStore] = None) -> None:
         super().__init__(description)
         self.name = name
         self.description = description
         self.topic = topic if topic is not None else DEFAULT_TOPIC
         self.source_agent = source_agent
-        Register.register_agent(self.name, self.description, self.topic)
+        self.executor = executor if executor is not None else AgentExecutor(source_agent)
+        self.context_store = context_store if context_store is not None else get_default_context_store()
+        Register.ensure_agent(self.name, self.description, self.topic)
 
     @message_handler
     async def handle_task(self, message: AgentTaskMessage, ctx) -> AgentResultMessage:
-        print(f"[BaseAgent {self.name}] Received task: {message.payload['task']}")
+        logger.info("%s received task: %s", self.name, message.payload['task'])
+        success = True
         try:
             task_content = message.payload["task"]
-            context = message.payload.get("context", {})
-            result = self.source_agent.execute(task_content)
+            with get_tracer().span("agent.execute", message.header.correlation_id, agent=self.name):
+                context = resolve_message_context(message.payload, self.context_needs, self.context_store)
+                task_input = build_task_input(task_content, context)
+                # 只有直接由编排者发来的任务才能把片段发布回同一个编排实例
+                if message.payload.get("stream") and ctx.sender is not None:
+                    execution = self.stream_result(message, task_input, ctx.sender.key)
+                else:
+                    execution = self.executor.run(task_input)
+                result = await run_with_deadline(execution, message.payload.get("deadline"), ctx.cancellation_token)
+        except asyncio.TimeoutError:
+            logger.warning("%s exceeded the deadline of task %s", self.name, message.header.correlation_id)
+            get_tracer().count("agent.deadline_exceeded")
+            result = "Execution error: deadline exceeded"
+            success = False
         except Exception as e:
-            error_msg = ErrorNotificationMessage.create(sender=self.name, error_info=str(e), correlation_id=message.header.correlation_id)
+            logger.exception("%s failed to execute task", self.name)
+            get_tracer().count("agent.failures")
+            error_msg = ErrorNotificationMessage.create(sender=self.name, error_info=str(e), correlation_id=message.header.correlation_id,
+                                                        trusted=True)
             await self.publish_message(error_msg, topic_id=TopicId("Error", source=self.name))
             result = f"Execution error: {str(e)}"
+            success = False
         agent_result = AgentResultMessage.create(sender=self.name,
                                                  correlation_id=message.header.correlation_id,
                                                  result=result,
-                                                 context=context)
-        print(f"[BaseAgent {self.name}] Processed task '{task_content}' with result: {result}")
+                                                 context=message.payload.get("context"),
+                                                 context_ref=message.payload.get("context_ref"),
+                                                 success=success,
+                                                 trusted=True)
+        logger.debug("%s processed task '%s' with result: %s", self.name, message.payload["task"], result)
         # await self.publish_message(agent_result, topic_id=TopicId("Orchestrator", source=self.name))
         return agent_result
+
+    async def stream_result(self, message: AgentTaskMessage, task_input: str, orchestrator_key: str) -> str:
+        subtask_id = (message.payload.get("context_ref") or {}).get("subtask_id")
+        chunks = []
+        async for chunk in self.executor.stream(task_input):
+            chunk = str(chunk)
+            await self.publish_message(AgentResultChunkMessage.create(sender=self.name,
+                                                                      correlation_id=message.header.correlation_id,
+                                                                      chunk=chunk,
+                                                                      index=len(chunks),
+                                                                      subtask_id=subtask_id,
+                                                                      trusted=True),
+                                       topic_id=TopicId("Orchestrator", source=orchestrator_key))
+            chunks.append(chunk)
+        return "".join(chunks)
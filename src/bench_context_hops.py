@@ -0,0 +1,68 @@
+import argparse
+
+from context_store import InMemoryContextStore
+from message import AgentResultMessage, AgentTaskMessage
+
+
+def message_bytes(message) -> int:
+    return len(message.model_dump_json().encode("utf-8"))
+
+
+# 旧方式：每一跳都内联完整且不断增长的上下文（包括之前所有的 AgentResultMessage）
+def run_inline(subtasks: int, result_size: int):
+    context = {"original_request": "benchmark request", "subtasks": [], "agent_results": [], "prev_result": None}
+    hops = []
+    for i in range(subtasks):
+        task_msg = AgentTaskMessage.create(sender="Orchestrator", recipient="BenchAgent", task_content=f"subtask {i}",
+                                           correlation_id="bench", context=context)
+        result = "x" * result_size
+        # 跨进程的 runtime 会在每一跳序列化上下文，这里用快照模拟，避免消息与上下文之间的循环引用
+        snapshot = dict(context, subtasks=list(context["subtasks"]), agent_results=list(context["agent_results"]))
+        result_msg = AgentResultMessage.create(sender="BenchAgent", correlation_id="bench", result=result, context=snapshot)
+        hops.append((message_bytes(task_msg) + message_bytes(result_msg), 0))
+        context["subtasks"].append({"task": f"subtask {i}", "is_completed": True})
+        context["prev_result"] = result
+        context["agent_results"].append(result_msg)
+    return hops
+
+
+# 新方式：消息只携带上下文引用，agent 按声明的切片从共享存储读取
+def run_by_reference(subtasks: int, result_size: int):
+    store = InMemoryContextStore()
+    store.open("bench", "benchmark request")
+    hops = []
+    for i in range(subtasks):
+        depends_on = [str(i - 1)] if i else []
+        context_ref = store.make_ref("bench", subtask_id=str(i), depends_on=depends_on)
+        task_msg = AgentTaskMessage.create(sender="Orchestrator", recipient="BenchAgent", task_content=f"subtask {i}",
+                                           correlation_id="bench", context_ref=context_ref)
+        slices = store.load_slices(context_ref, ("upstream_results",))
+        fetched = sum(len(task) + len(result) for task, result in slices["upstream_results"].items())
+        result = "x" * result_size
+        result_msg = AgentResultMessage.create(sender="BenchAgent", correlation_id="bench", result=result,
+                                               context_ref=context_ref)
+        hops.append((message_bytes(task_msg) + message_bytes(result_msg), fetched))
+        store.add_result("bench", f"subtask {i}", "BenchAgent", result, subtask_id=str(i))
+    store.close()
+    return hops
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bytes per hop with inline context vs context references")
+    parser.add_argument("--subtasks", type=int, default=10)
+    parser.add_argument("--result-size", type=int, default=4000)
+    args = parser.parse_args()
+
+    inline = run_inline(args.subtasks, args.result_size)
+    by_reference = run_by_reference(args.subtasks, args.result_size)
+    print(f"{'hop':>4} {'inline bytes':>14} {'ref bytes':>10} {'ref slice bytes':>16}")
+    for i, ((inline_bytes, _), (ref_bytes, fetched)) in enumerate(zip(inline, by_reference)):
+        print(f"{i:>4} {inline_bytes:>14} {ref_bytes:>10} {fetched:>16}")
+    inline_total = sum(hop[0] for hop in inline)
+    ref_total = sum(hop[0] + hop[1] for hop in by_reference)
+    print(f"total inline: {inline_total} bytes, total by reference (incl. slices): {ref_total} bytes, "
+          f"ratio: {inline_total / ref_total:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+import argparse
+import gc
+import time
+import uuid
+from datetime import datetime
+from typing import Any, Dict, Optional
+
+from pydantic import BaseModel, Field
+
+from message import AgentTaskMessage, MessageHeader, configure_messages, generate_id
+
+CONTEXT_REF = {"correlation_id": "bench", "version": 3, "subtask_id": "2", "depends_on": ["1"]}
+
+
+# 改动前 message.py 中的消息定义（uuid4 id、构造时格式化的字符串时间戳、全量校验），作为对照基线
+class BaselineHeader(BaseModel):
+    message_id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    sender: str
+    recipient: Optional[str] = None
+    timestamp: str = Field(default_factory=lambda: datetime.utcnow().isoformat() + "Z")
+    correlation_id: Optional[str] = None
+    message_type: str
+
+
+class BaselineTaskMessage(BaseModel):
+    header: BaselineHeader
+    payload: Dict[str, Any]
+    metadata: Dict[str, Any] = {}
+
+    @classmethod
+    def create(cls, sender: str, recipient: str, task_content: str, correlation_id: str,
+               context_ref: Dict[str, Any], **_: Any) -> "BaselineTaskMessage":
+        header = BaselineHeader(sender=sender, recipient=recipient, message_type="AgentTask",
+                                correlation_id=correlation_id)
+        return cls(header=header, payload={"task": task_content, "retry": 0, "stream": False, "deadline": None,
+                                           "context_ref": context_ref})
+
+
+# 受信任路径改用 pydantic 公开的 model_construct 时的构造方式，用来对照 message._construct
+class ModelConstructTaskMessage(AgentTaskMessage):
+    @classmethod
+    def build(cls, payload: Dict[str, Any], sender: str, recipient: Optional[str], message_type: str,
+              correlation_id: Optional[str] = None, trusted: bool = False):
+        header = MessageHeader.model_construct(message_id=generate_id(), sender=sender, recipient=recipient,
+                                               timestamp_ns=time.time_ns(), correlation_id=correlation_id,
+                                               message_type=message_type)
+        return cls.model_construct(header=header, payload=payload, metadata={})
+
+
+def create_messages(message_cls, count: int, trusted: bool):
+    return [message_cls.create(sender="Orchestrator", recipient="BenchAgent", task_content="benchmark subtask",
+                               correlation_id="bench", context_ref=CONTEXT_REF, trusted=trusted)
+            for _ in range(count)]
+
+
+# 每种方式重复 repeat 次取最快的一次，减少 GC 和调度抖动的影响
+def measure(label: str, count: int, repeat: int, id_strategy: str, trusted: bool, message_cls=AgentTaskMessage) -> None:
+    configure_messages(id_strategy=id_strategy)
+    create_time = serialize_time = float("inf")
+    for _ in range(repeat):
+        gc.collect()
+        started = time.perf_counter()
+        messages = create_messages(message_cls, count, trusted)
+        created = time.perf_counter()
+        for message in messages:
+            message.model_dump_json()
+        serialized = time.perf_counter()
+        create_time = min(create_time, created - started)
+        serialize_time = min(serialize_time, serialized - created)
+    print(f"{label:<30} create: {count / create_time:>12,.0f} msg/s   "
+          f"serialize: {count / serialize_time:>12,.0f} msg/s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Message create/serialize throughput")
+    parser.add_argument("--count", type=int, default=100000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    measure("baseline (pre-change)", args.count, args.repeat, "uuid", trusted=False, message_cls=BaselineTaskMessage)
+    measure("validated, uuid4 ids", args.count, args.repeat, "uuid", trusted=False)
+    measure("validated, counter ids", args.count, args.repeat, "counter", trusted=False)
+    measure("trusted, uuid4 ids", args.count, args.repeat, "uuid", trusted=True)
+    measure("trusted, ulid ids", args.count, args.repeat, "ulid", trusted=True)
+    measure("trusted, counter ids", args.count, args.repeat, "counter", trusted=True)
+    measure("model_construct, counter ids", args.count, args.repeat, "counter", trusted=True,
+            message_cls=ModelConstructTaskMessage)
+    configure_messages()
+
+
+if __name__ == "__main__":
+    main()
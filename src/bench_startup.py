@@ -0,0 +1,105 @@
+import argparse
+import asyncio
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+SKILLS = ["python code", "java services", "code review", "unit tests", "documentation", "sql queries",
+          "deployment scripts", "security audit", "performance profiling", "api design", "data cleaning", "ui layout"]
+
+
+def agent_entries(count: int):
+    for i in range(count):
+        skill = SKILLS[i % len(SKILLS)]
+        yield f"BenchAgent{i}", f"BenchAgent{i} handles {skill} for project {i // len(SKILLS)}."
+
+
+def write_manifest(path: str, count: int) -> None:
+    agents = [{"name": name, "description": description, "factory": "fake_llm:FakeAgent", "args": {"name": name}}
+              for name, description in agent_entries(count)]
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"agents": agents}, f)
+
+
+# 在独立进程中执行，保证每种方式都是冷启动
+async def run_scenario(mode: str, count: int, manifest_path: str) -> dict:
+    started = time.perf_counter()
+    from agent_controller import AgentController
+    imported = time.perf_counter()
+    from autogen_core import AgentId
+    from fake_llm import FakeAgent
+    from message import AgentTaskMessage
+    from register import Register
+
+    controller = AgentController()
+    await controller.register_components()
+    components = time.perf_counter()
+    if mode == "eager":
+        for name, description in agent_entries(count):
+            await controller.register_user_agent(name, description, name, FakeAgent(name))
+    else:
+        await controller.register_manifest(manifest_path)
+    registered = time.perf_counter()
+    await controller.start()
+
+    name = f"BenchAgent{count // 2}"
+    dispatch_started = time.perf_counter()
+    task_msg = AgentTaskMessage.create(sender="Bench", recipient=name, task_content="write unit tests",
+                                       correlation_id="bench", context={}, trusted=True)
+    await controller.runtime.send_message(task_msg, AgentId(type=name, key="default"))
+    dispatched = time.perf_counter()
+    Register.get_routing_index().route("profile the performance of the api")
+    routed = time.perf_counter()
+    Register.get_routing_index().route("review the java services code")
+    routed_again = time.perf_counter()
+    await controller.stop()
+    return {
+        "mode": mode,
+        "agents": len(Register.get_agents_desc()),
+        "registry_version": Register.snapshot().version,
+        "import_seconds": imported - started,
+        "components_seconds": components - imported,
+        "register_seconds": registered - components,
+        "first_dispatch_seconds": dispatched - dispatch_started,
+        "first_route_seconds": routed - dispatched,
+        "route_seconds": routed_again - routed,
+        "agent_core_loaded": "agent_core" in sys.modules,
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cold-start time of the controller with many registered agents")
+    parser.add_argument("--agents", type=int, default=1000)
+    parser.add_argument("--scenario", choices=["eager", "manifest"], default=None, help=argparse.SUPPRESS)
+    parser.add_argument("--manifest", default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.scenario is not None:
+        print(json.dumps(asyncio.run(run_scenario(args.scenario, args.agents, args.manifest))))
+        return
+
+    with tempfile.TemporaryDirectory(prefix="bench-startup-") as directory:
+        manifest_path = os.path.join(directory, "agents.json")
+        write_manifest(manifest_path, args.agents)
+        reports = []
+        for scenario in ("eager", "manifest"):
+            output = subprocess.run([sys.executable, __file__, "--agents", str(args.agents), "--scenario", scenario,
+                                     "--manifest", manifest_path], check=True, capture_output=True, text=True).stdout
+            reports.append(json.loads(output.strip().splitlines()[-1]))
+
+    print(f"{'mode':<10} {'agents':>7} {'import':>9} {'register':>10} {'1st dispatch':>13} {'1st route':>10} "
+          f"{'route':>8} {'rss MB':>7}")
+    for report in reports:
+        print(f"{report['mode']:<10} {report['agents']:>7} {report['import_seconds'] * 1000:>7.1f}ms "
+              f"{report['register_seconds'] * 1000:>8.1f}ms {report['first_dispatch_seconds'] * 1000:>11.1f}ms "
+              f"{report['first_route_seconds'] * 1000:>8.1f}ms {report['route_seconds'] * 1000:>6.1f}ms "
+              f"{report['peak_rss_mb']:>7.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,227 @@
+import argparse
+import asyncio
+import functools
+import json
+import logging
+import os
+import resource
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List, Optional
+
+import llm_client
+from admission import AdmissionRejected
+from agent_controller import AgentController
+from broker import start_broker_process
+from fake_llm import AsyncFakeAgent, FakeAgent, FakeLLMChat, LatencyModel
+from llm_cache import configure_cache
+from metrics import get_stage_metrics, percentile
+from tracing import configure_tracing, get_tracer
+from worker import AgentWorker, start_worker_processes, stop_processes
+
+BENCH_AGENTS = {
+    "DevAgent": "DevAgent generates the code implementation for the software system.",
+    "ReviewAgent": "ReviewAgent specialized in code review.",
+    "TestAgent": "TestAgent creates unit tests for the software system.",
+    "DocAgent": "DocAgent produces clear documentation for the software system.",
+}
+
+
+def peak_rss_mb() -> float:
+    # Linux 上 ru_maxrss 的单位是 KB
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+
+def make_agent(args: argparse.Namespace, name: str, seed_offset: int = 1) -> FakeAgent:
+    agent_cls = AsyncFakeAgent if args.async_agents else FakeAgent
+    return agent_cls(name, LatencyModel(args.agent_latency, seed=args.seed + seed_offset), cpu_time=args.agent_cpu,
+                     chat=llm_client.DispatchedLLMChat() if args.agent_llm else None)
+
+
+# 在 worker 进程中执行，注册与单进程模式相同的一组 agent
+async def setup_worker(args: argparse.Namespace, worker: AgentWorker) -> None:
+    if args.agent_llm:
+        fake_chat = FakeLLMChat(latency=LatencyModel(args.llm_latency, seed=os.getpid()))
+        llm_client.set_chat_factory(lambda: fake_chat)
+    for name, description in BENCH_AGENTS.items():
+        await worker.register_agent(name, description, name, make_agent(args, name, seed_offset=os.getpid()),
+                                    max_concurrency=args.agent_concurrency)
+
+
+async def run_benchmark(args: argparse.Namespace) -> Dict[str, Any]:
+    fake_chat = FakeLLMChat(latency=LatencyModel(args.llm_latency, seed=args.seed))
+    llm_client.set_chat_factory(lambda: fake_chat)
+    configure_cache(disabled_call_types=() if args.cache else ("select_agent", "evaluate_result", "breakdown_task"))
+    get_stage_metrics().reset()
+
+    processes = []
+    broker_path = None
+    if args.workers > 0:
+        broker_path = os.path.join(tempfile.mkdtemp(prefix="agent-broker-"), "broker.sock")
+        processes.append(start_broker_process(broker_path))
+        processes.extend(start_worker_processes(broker_path, functools.partial(setup_worker, args), args.workers))
+
+    controller = AgentController(max_parallel_subtasks=args.max_parallel_subtasks, broker_path=broker_path,
+                                 evaluation_mode="speculative" if args.speculative else "final",
+                                 evaluation_batch_size=args.eval_batch_size, evaluation_max_wait=args.eval_max_wait,
+                                 max_in_flight_requests=args.max_in_flight, intake_queue_size=args.intake_queue,
+                                 admission_policy="shed" if args.shed else "queue", request_timeout=args.deadline)
+    await controller.register_components(generic_agent=make_agent(args, "GenericAgent"))
+    if args.workers == 0:
+        for name, description in BENCH_AGENTS.items():
+            await controller.register_user_agent(name, description, name,
+                                                 agent_factory=functools.partial(make_agent, args, name),
+                                                 max_concurrency=args.agent_concurrency, pool_size=args.pool_size,
+                                                 balancing=args.balancing)
+    await controller.start()
+    await controller.wait_for_agents(list(BENCH_AGENTS))
+
+    limit = asyncio.Semaphore(args.concurrency)
+    latencies: List[float] = []
+    outcomes = {"completed": 0, "failed": 0, "rejected": 0}
+
+    async def consume_stream(content: str) -> Optional[str]:
+        async for item in controller.stream(content):
+            if "final_result" in item:
+                return item["final_result"]
+        return None
+
+    async def one_request(index: int) -> None:
+        async with limit:
+            started = time.perf_counter()
+            content = f"Benchmark request {index}: implement feature {index}"
+            request = consume_stream(content) if args.stream else controller.submit(content)
+            try:
+                result = await asyncio.wait_for(request, timeout=args.timeout)
+            except AdmissionRejected:
+                outcomes["rejected"] += 1
+                return
+            latencies.append(time.perf_counter() - started)
+            outcomes["completed" if result is not None else "failed"] += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one_request(i) for i in range(args.requests)))
+    elapsed = time.perf_counter() - started
+    await controller.stop()
+    stop_processes(processes)
+    llm_client.set_chat_factory(None)
+
+    return {
+        "requests": args.requests,
+        "concurrency": args.concurrency,
+        "workers": args.workers,
+        "elapsed_seconds": elapsed,
+        "throughput_rps": args.requests / elapsed if elapsed else 0.0,
+        "outcomes": outcomes,
+        "end_to_end": {
+            "p50": percentile(latencies, 50),
+            "p95": percentile(latencies, 95),
+            "p99": percentile(latencies, 99),
+            "max": max(latencies) if latencies else 0.0,
+        },
+        "stages": get_stage_metrics().snapshot(),
+        "llm_calls": dict(fake_chat.calls),
+        "llm_dispatch": controller.get_llm_dispatch_stats(),
+        "routing": controller.get_routing_stats(),
+        "pools": controller.get_pool_stats(),
+        "evaluation": controller.get_evaluation_stats(),
+        "prompts": controller.get_prompt_stats()["call_types"],
+        "admission": controller.get_admission_stats(),
+        "trace": controller.get_trace_metrics() if get_tracer().enabled else {},
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def print_report(report: Dict[str, Any]) -> None:
+    print(f"requests: {report['requests']}  concurrency: {report['concurrency']}  "
+          f"elapsed: {report['elapsed_seconds']:.2f}s  throughput: {report['throughput_rps']:.2f} req/s")
+    e2e = report["end_to_end"]
+    print(f"end-to-end latency  p50 {e2e['p50'] * 1000:9.1f} ms  p95 {e2e['p95'] * 1000:9.1f} ms  "
+          f"p99 {e2e['p99'] * 1000:9.1f} ms")
+    for stage, summary in sorted(report["stages"].items()):
+        print(f"{stage:<18}  p50 {summary['p50'] * 1000:9.1f} ms  p95 {summary['p95'] * 1000:9.1f} ms  "
+              f"p99 {summary['p99'] * 1000:9.1f} ms  count {summary['count']}")
+    print(f"outcomes: {report['outcomes']}")
+    print(f"llm calls: {report['llm_calls']}  routing: {report['routing']}")
+    dispatch = report["llm_dispatch"]
+    print(f"llm dispatch: submitted {dispatch['submitted']}  coalesced {dispatch['coalesced']}  "
+          f"max queue depth {dispatch['max_queue_depth']}  throttled {dispatch['throttled_time']:.2f}s")
+    for call_type, prompts in sorted(report["prompts"].items()):
+        print(f"prompt tokens {call_type:<16} sent {prompts['prompt_tokens']}  saved {prompts['tokens_saved']}  "
+              f"compacted {prompts['compacted']}/{prompts['calls']}")
+    admission = report["admission"]
+    print(f"outcomes: {report['outcomes']}  admission queued {admission['queued']}  "
+          f"rejected {admission['rejected']}  queue wait p95 {admission['queue_wait']['p95'] * 1000:.1f} ms")
+    print(f"peak RSS: {report['peak_rss_mb']:.1f} MB")
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Offline load test of the orchestrator with a fake LLM backend")
+    parser.add_argument("--requests", type=int, default=50)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--llm-latency", default="lognormal:0.02,0.3",
+                        help="constant:S, uniform:LOW,HIGH or lognormal:MEDIAN,SIGMA (seconds)")
+    parser.add_argument("--agent-latency", default="lognormal:0.05,0.3")
+    parser.add_argument("--agent-cpu", type=float, default=0.0, help="seconds of GIL-holding CPU work per agent task")
+    parser.add_argument("--workers", type=int, default=0,
+                        help="offload agent execution to this many worker processes behind a local broker (0 = in-process); "
+                             "orchestration, evaluation and LLM calls stay in this process")
+    parser.add_argument("--agent-concurrency", type=int, default=8)
+    parser.add_argument("--pool-size", type=int, default=1, help="instances per registered agent type")
+    parser.add_argument("--balancing", default="least_outstanding", choices=["least_outstanding", "consistent_hash"])
+    parser.add_argument("--max-parallel-subtasks", type=int, default=4)
+    parser.add_argument("--async-agents", action="store_true", help="use coroutine agents instead of thread-pool agents")
+    parser.add_argument("--agent-llm", action="store_true",
+                        help="agents make one LLM call per task through the shared dispatcher (bulk lane)")
+    parser.add_argument("--stream", action="store_true", help="submit requests in streaming mode")
+    parser.add_argument("--eval-batch-size", type=int, default=1, help="evaluate up to this many results per LLM call")
+    parser.add_argument("--eval-max-wait", type=float, default=0.02, help="seconds to wait for an evaluation batch to fill")
+    parser.add_argument("--speculative", action="store_true", help="evaluate subtasks in the background and roll back on failure")
+    parser.add_argument("--cache", action="store_true", help="enable the LLM response cache")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--timeout", type=float, default=120.0, help="per-request timeout in seconds")
+    parser.add_argument("--max-in-flight", type=int, default=64, help="requests orchestrated at the same time")
+    parser.add_argument("--intake-queue", type=int, default=256, help="requests allowed to wait for admission")
+    parser.add_argument("--shed", action="store_true", help="reject requests instead of queueing them when full")
+    parser.add_argument("--deadline", type=float, default=None,
+                        help="per-request deadline in seconds, propagated to subtasks and LLM calls")
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    parser.add_argument("--verbose", action="store_true", help="log component activity at INFO level")
+    parser.add_argument("--trace", default=None, metavar="PATH",
+                        help="enable tracing and write spans to this JSON-lines file")
+    parser.add_argument("--max-p95", type=float, default=None, help="fail if end-to-end p95 exceeds this many seconds")
+    parser.add_argument("--min-throughput", type=float, default=None, help="fail if throughput falls below this req/s")
+    return parser
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = build_parser().parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING,
+                        format="%(asctime)s %(processName)s %(name)s %(levelname)s %(message)s")
+    configure_tracing(enabled=args.trace is not None, path=args.trace)
+    try:
+        report = asyncio.run(run_benchmark(args))
+    finally:
+        get_tracer().close()
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report)
+
+    failures = []
+    if report["outcomes"]["failed"]:
+        failures.append(f"{report['outcomes']['failed']} of {report['requests']} requests returned no result")
+    if args.max_p95 is not None and report["end_to_end"]["p95"] > args.max_p95:
+        failures.append(f"p95 {report['end_to_end']['p95']:.3f}s exceeds {args.max_p95:.3f}s")
+    if args.min_throughput is not None and report["throughput_rps"] < args.min_throughput:
+        failures.append(f"throughput {report['throughput_rps']:.2f} req/s below {args.min_throughput:.2f} req/s")
+    for failure in failures:
+        print(f"FAIL: {failure}", file=sys.stderr)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,163 @@
+import argparse
+import asyncio
+import itertools
+import logging
+import multiprocessing
+import os
+import time
+from typing import Any, Dict, Optional, Tuple
+
+from transport import read_frame, write_frame
+
+logger = logging.getLogger(__name__)
+
+
+class WorkerConnection:
+    def __init__(self, writer: asyncio.StreamWriter) -> None:
+        self.writer = writer
+        self.worker_id: Optional[str] = None
+        self.agents: Dict[str, Dict[str, Any]] = {}
+        self.outstanding = 0
+        self.delivered = 0
+
+
+# 本机消息中转：进程通过 Unix socket 连接，broker 负责 agent 发现（共享注册表）并把消息转发到托管该 agent 类型的 worker；
+# 所有任务和结果都经这一个进程转发
+class Broker:
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.connections: Dict[int, WorkerConnection] = {}
+        self.version = 0
+        self._ids = itertools.count(1)
+        # broker 分配的投递 id -> (发起方连接, 发起方请求 id, 目标连接)
+        self._pending: Dict[int, Tuple[WorkerConnection, int, WorkerConnection]] = {}
+        self._server: Optional[asyncio.AbstractServer] = None
+
+    def registry(self) -> Dict[str, Dict[str, Any]]:
+        agents: Dict[str, Dict[str, Any]] = {}
+        for connection in self.connections.values():
+            for name, info in connection.agents.items():
+                entry = agents.setdefault(name, dict(info, workers=[]))
+                entry["workers"].append(connection.worker_id)
+        return agents
+
+    async def _broadcast_registry(self) -> None:
+        self.version += 1
+        frame = {"op": "registry", "version": self.version, "agents": self.registry()}
+        for connection in list(self.connections.values()):
+            if not connection.writer.is_closing():
+                write_frame(connection.writer, frame)
+
+    def _pick_worker(self, agent_type: str) -> Optional[WorkerConnection]:
+        candidates = [connection for connection in self.connections.values() if agent_type in connection.agents]
+        if not candidates:
+            return None
+        return min(candidates, key=lambda connection: connection.outstanding)
+
+    def _route(self, origin: WorkerConnection, frame: Dict[str, Any]) -> None:
+        target = self._pick_worker(frame["agent_type"])
+        if target is None:
+            write_frame(origin.writer, {"op": "error", "id": frame["id"],
+                                        "error": f"No worker hosts agent type {frame['agent_type']}"})
+            return
+        delivery_id = next(self._ids)
+        self._pending[delivery_id] = (origin, frame["id"], target)
+        target.outstanding += 1
+        write_frame(target.writer, {"op": "deliver", "id": delivery_id, "agent_type": frame["agent_type"],
+                                    "key": frame["key"], "message": frame["message"]})
+
+    def _complete(self, frame: Dict[str, Any]) -> None:
+        pending = self._pending.pop(frame["id"], None)
+        if pending is None:
+            return
+        origin, request_id, target = pending
+        target.outstanding -= 1
+        target.delivered += 1
+        if not origin.writer.is_closing():
+            write_frame(origin.writer, dict(frame, id=request_id))
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        connection = WorkerConnection(writer)
+        self.connections[id(connection)] = connection
+        try:
+            while True:
+                frame = await read_frame(reader)
+                if frame is None:
+                    break
+                op = frame["op"]
+                if op == "send":
+                    self._route(connection, frame)
+                elif op in ("reply", "error"):
+                    self._complete(frame)
+                elif op == "hello":
+                    connection.worker_id = frame["worker_id"]
+                    connection.agents = frame.get("agents") or {}
+                    logger.info("Worker %s joined with agents: %s", connection.worker_id, list(connection.agents))
+                    await self._broadcast_registry()
+                await writer.drain()
+        finally:
+            del self.connections[id(connection)]
+            # worker 断开后，发往它但尚未回复的请求直接以错误返回给发起方
+            for delivery_id, (origin, request_id, target) in list(self._pending.items()):
+                if target is connection:
+                    del self._pending[delivery_id]
+                    if not origin.writer.is_closing():
+                        write_frame(origin.writer, {"op": "error", "id": request_id,
+                                                    "error": f"Worker {connection.worker_id} disconnected"})
+            if connection.agents:
+                await self._broadcast_registry()
+            writer.close()
+
+    async def start(self) -> None:
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        self._server = await asyncio.start_unix_server(self._handle_connection, path=self.path)
+
+    async def serve_forever(self) -> None:
+        await self.start()
+        async with self._server:
+            await self._server.serve_forever()
+
+    async def stop(self) -> None:
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+        for connection in list(self.connections.values()):
+            connection.writer.close()
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "version": self.version,
+            "pending": len(self._pending),
+            "workers": {connection.worker_id: {"outstanding": connection.outstanding, "delivered": connection.delivered}
+                        for connection in self.connections.values() if connection.worker_id is not None},
+        }
+
+
+def run_broker(path: str) -> None:
+    try:
+        asyncio.run(Broker(path).serve_forever())
+    except KeyboardInterrupt:
+        pass
+
+
+def start_broker_process(path: str, timeout: float = 10.0) -> multiprocessing.Process:
+    if os.path.exists(path):
+        os.unlink(path)
+    process = multiprocessing.get_context("spawn").Process(target=run_broker, args=(path,), daemon=True,
+                                                          name="agent-broker")
+    process.start()
+    deadline = time.monotonic() + timeout
+    while not os.path.exists(path):
+        if not process.is_alive() or time.monotonic() > deadline:
+            raise RuntimeError(f"Broker failed to start on {path}")
+        time.sleep(0.01)
+    return process
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local message broker for multi-process agent runtimes")
+    parser.add_argument("--socket", default="/tmp/agent-broker.sock")
+    run_broker(parser.parse_args().socket)
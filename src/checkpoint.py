@@ -0,0 +1,103 @@
+import hashlib
+import json
+import os
+import random
+from typing import Any, Dict, Iterable, Optional
+
+from task_graph import TaskGraph, TaskNode
+
+
+def subtask_key(node: TaskNode) -> str:
+    raw = json.dumps([node.id, node.task, sorted(node.depends_on)], ensure_ascii=False)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()[:16]
+
+
+class RetryPolicy:
+    def __init__(self, max_retries: int = 2, base_delay: float = 1.0, max_delay: float = 30.0, jitter: float = 0.1) -> None:
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.jitter = jitter
+
+    def delay(self, attempt: int) -> float:
+        delay = min(self.max_delay, self.base_delay * (2 ** max(attempt - 1, 0)))
+        return delay * (1 + random.uniform(-self.jitter, self.jitter))
+
+
+class CheckpointStore:
+    def __init__(self, path: Optional[str] = None) -> None:
+        self.path = path
+        self._records: Dict[str, Dict[str, Any]] = {}
+        self.hits = 0
+        self.saves = 0
+        if path is not None:
+            os.makedirs(path, exist_ok=True)
+
+    def _file(self, correlation_id: str) -> str:
+        return os.path.join(self.path, hashlib.sha1(correlation_id.encode("utf-8")).hexdigest() + ".json")
+
+    def _record(self, correlation_id: str) -> Dict[str, Any]:
+        record = self._records.get(correlation_id)
+        if record is None:
+            record = {"plan": None, "subtasks": {}, "attempts": 0}
+            if self.path is not None and os.path.exists(self._file(correlation_id)):
+                with open(self._file(correlation_id), "r", encoding="utf-8") as f:
+                    record = json.load(f)
+            self._records[correlation_id] = record
+        return record
+
+    # 先写临时文件再原子替换，进程中途退出也不会留下半个检查点
+    def _flush(self, correlation_id: str) -> None:
+        if self.path is None:
+            return
+        path = self._file(correlation_id)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self._records[correlation_id], f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    def save_plan(self, correlation_id: str, graph: TaskGraph) -> None:
+        record = self._record(correlation_id)
+        record["plan"] = [{"id": node.id, "task": node.task, "depends_on": node.depends_on}
+                          for node in (graph.nodes[node_id] for node_id in graph.order)]
+        self._flush(correlation_id)
+
+    def load_plan(self, correlation_id: str) -> Optional[TaskGraph]:
+        plan = self._record(correlation_id)["plan"]
+        if plan is None:
+            return None
+        return TaskGraph([TaskNode(item["id"], item["task"], item["depends_on"]) for item in plan])
+
+    def save(self, correlation_id: str, key: str, agent: str, result: str) -> None:
+        self._record(correlation_id)["subtasks"][key] = {"agent": agent, "result": result}
+        self.saves += 1
+        self._flush(correlation_id)
+
+    def load(self, correlation_id: str, key: str) -> Optional[Dict[str, Any]]:
+        checkpoint = self._record(correlation_id)["subtasks"].get(key)
+        if checkpoint is not None:
+            self.hits += 1
+        return checkpoint
+
+    def invalidate(self, correlation_id: str, keys: Iterable[str]) -> None:
+        subtasks = self._record(correlation_id)["subtasks"]
+        for key in keys:
+            subtasks.pop(key, None)
+        self._flush(correlation_id)
+
+    def record_attempt(self, correlation_id: str) -> int:
+        record = self._record(correlation_id)
+        record["attempts"] += 1
+        self._flush(correlation_id)
+        return record["attempts"]
+
+    def clear(self, correlation_id: str) -> None:
+        self._records.pop(correlation_id, None)
+        if self.path is not None:
+            try:
+                os.remove(self._file(correlation_id))
+            except OSError:
+                pass
+
+    def stats(self) -> Dict[str, Any]:
+        return {"correlations": len(self._records), "hits": self.hits, "saves": self.saves}
@@ -0,0 +1,310 @@
+import hashlib
+import os
+import shutil
+import tempfile
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Optional, Set
+
+ENTRY_OVERHEAD = 512
+
+CONTEXT_SLICES = ("original_request", "subtask", "prev_result", "upstream_results", "agent_results", "final_result")
+
+
+class SpilledValue:
+    __slots__ = ("path", "size")
+
+    def __init__(self, path: str, size: int) -> None:
+        self.path = path
+        self.size = size
+
+    def load(self) -> str:
+        with open(self.path, "r", encoding="utf-8") as f:
+            return f.read()
+
+    def __repr__(self) -> str:
+        return f"SpilledValue(size={self.size})"
+
+
+# 上下文存储的接口，自定义实现必须提供全部抽象方法，缺少时在实例化阶段就会失败
+class ContextStore(ABC):
+    # pin=True 的上下文在 finalize 之前不会因容量或内存预算被淘汰
+    @abstractmethod
+    def open(self, correlation_id: str, original_request: str, pin: bool = True) -> Dict[str, Any]:
+        ...
+
+    @abstractmethod
+    def get(self, correlation_id: str) -> Optional[Dict[str, Any]]:
+        ...
+
+    @abstractmethod
+    def add_result(self, correlation_id: str, task: str, agent: str, result: str,
+                   subtask_id: Optional[str] = None) -> None:
+        ...
+
+    @abstractmethod
+    def set_final_result(self, correlation_id: str, final_result: str) -> None:
+        ...
+
+    @abstractmethod
+    def finalize(self, correlation_id: str) -> Optional[Dict[str, Any]]:
+        ...
+
+    @abstractmethod
+    def stats(self) -> Dict[str, Any]:
+        ...
+
+    def __contains__(self, correlation_id: str) -> bool:
+        return self.get(correlation_id) is not None
+
+    @staticmethod
+    def resolve(value: Any) -> Any:
+        return value.load() if isinstance(value, SpilledValue) else value
+
+    def results(self, correlation_id: str) -> List[Dict[str, Any]]:
+        context = self.get(correlation_id)
+        if context is None:
+            return []
+        return [dict(entry, result=self.resolve(entry["result"])) for entry in context["agent_results"]]
+
+    def make_ref(self, correlation_id: str, subtask_id: Optional[str] = None,
+                 depends_on: Optional[List[str]] = None) -> Dict[str, Any]:
+        context = self.get(correlation_id)
+        if context is None:
+            raise KeyError(f"No context for correlation_id {correlation_id}")
+        return {"correlation_id": correlation_id, "version": context["version"],
+                "subtask_id": subtask_id, "depends_on": list(depends_on or [])}
+
+    # 只加载消费方声明需要的那部分上下文，避免整段历史在每一跳中被复制
+    def load_slices(self, ref: Dict[str, Any], needs: Iterable[str]) -> Dict[str, Any]:
+        correlation_id = ref["correlation_id"]
+        context = self.get(correlation_id)
+        if context is None:
+            raise KeyError(f"No context for correlation_id {correlation_id}")
+        if context["version"] < ref.get("version", 0):
+            raise ValueError(f"Context for correlation_id {correlation_id} is older than the referenced version")
+        slices: Dict[str, Any] = {}
+        depends_on = ref.get("depends_on") or []
+        for need in needs:
+            if need == "original_request":
+                slices[need] = context["original_request"]
+            elif need == "subtask":
+                subtasks = [entry for entry in context["subtasks"] if entry["id"] == ref.get("subtask_id")]
+                slices[need] = subtasks[-1]["task"] if subtasks else None
+            elif need == "final_result":
+                slices[need] = self.resolve(context["final_result"])
+            elif need == "agent_results":
+                slices[need] = self.results(correlation_id)
+            elif need == "upstream_results":
+                slices[need] = {entry["task"]: self.resolve(entry["result"])
+                                for entry in context["agent_results"] if entry.get("subtask_id") in depends_on}
+            elif need == "prev_result":
+                if ref.get("subtask_id") is None:
+                    slices[need] = self.resolve(context["prev_result"])
+                else:
+                    upstream = [entry for entry in context["agent_results"]
+                                if depends_on and entry.get("subtask_id") == depends_on[-1]]
+                    slices[need] = self.resolve(upstream[-1]["result"]) if upstream else None
+            else:
+                raise ValueError(f"Unknown context slice: {need}")
+        return slices
+
+
+class InMemoryContextStore(ContextStore):
+    def __init__(self, max_entries: int = 10000, ttl: Optional[float] = 3600,
+                 memory_budget: int = 256 * 1024 * 1024, spill_threshold: int = 64 * 1024,
+                 spill_dir: Optional[str] = None) -> None:
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.memory_budget = memory_budget
+        self.spill_threshold = spill_threshold
+        self.spill_dir = spill_dir
+        self._owns_spill_dir = spill_dir is None
+        self._contexts: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._accessed_at: Dict[str, float] = {}
+        self._sizes: Dict[str, int] = {}
+        self._spilled: Dict[str, List[SpilledValue]] = {}
+        self._pinned: Set[str] = set()
+        self.memory_bytes = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.spills = 0
+        self.finalized = 0
+
+    def _touch(self, correlation_id: str) -> None:
+        self._contexts.move_to_end(correlation_id)
+        self._accessed_at[correlation_id] = time.monotonic()
+
+    def _resize(self, correlation_id: str, delta: int) -> None:
+        self._sizes[correlation_id] += delta
+        self.memory_bytes += delta
+
+    def _spill(self, correlation_id: str, value: str) -> SpilledValue:
+        if self.spill_dir is None:
+            self.spill_dir = tempfile.mkdtemp(prefix="orchestrator-contexts-")
+        spilled = self._spilled.setdefault(correlation_id, [])
+        name = hashlib.sha1(correlation_id.encode("utf-8")).hexdigest()
+        path = os.path.join(self.spill_dir, f"{name}-{len(spilled)}.txt")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(value)
+        spilled_value = SpilledValue(path, len(value))
+        spilled.append(spilled_value)
+        self.spills += 1
+        return spilled_value
+
+    def _store_value(self, correlation_id: str, value: Optional[str]) -> Any:
+        if value is not None and len(value) >= self.spill_threshold:
+            return self._spill(correlation_id, value)
+        if value is not None:
+            self._resize(correlation_id, len(value))
+        return value
+
+    def _drop(self, correlation_id: str) -> Optional[Dict[str, Any]]:
+        context = self._contexts.pop(correlation_id, None)
+        if context is None:
+            return None
+        self._accessed_at.pop(correlation_id, None)
+        self._pinned.discard(correlation_id)
+        self.memory_bytes -= self._sizes.pop(correlation_id, 0)
+        for spilled_value in self._spilled.pop(correlation_id, []):
+            try:
+                os.remove(spilled_value.path)
+            except OSError:
+                pass
+        return context
+
+    def _spill_in_memory_results(self, correlation_id: str) -> None:
+        context = self._contexts[correlation_id]
+        for entry in context["agent_results"]:
+            if isinstance(entry["result"], str) and entry["result"]:
+                self._resize(correlation_id, -len(entry["result"]))
+                entry["result"] = self._spill(correlation_id, entry["result"])
+        if context["agent_results"]:
+            context["prev_result"] = context["agent_results"][-1]["result"]
+
+    # 先淘汰空闲超过 ttl 的上下文（请求已被放弃），再把最久未访问上下文中的结果写到磁盘，最后才按 LRU 淘汰整个上下文。
+    # 执行中（已固定）的上下文只会过期或写到磁盘，不会被 LRU 淘汰；全部固定时条目数可以暂时超过 max_entries
+    def _enforce_limits(self) -> None:
+        if self.ttl is not None:
+            deadline = time.monotonic() - self.ttl
+            while self._contexts:
+                oldest = next(iter(self._contexts))
+                if self._accessed_at[oldest] > deadline:
+                    break
+                self._drop(oldest)
+                self.expirations += 1
+        if self.memory_bytes > self.memory_budget:
+            for correlation_id in list(self._contexts):
+                if self.memory_bytes <= self.memory_budget:
+                    break
+                self._spill_in_memory_results(correlation_id)
+        if len(self._contexts) <= self.max_entries and self.memory_bytes <= self.memory_budget:
+            return
+        # 刚写入的上下文不参与本轮淘汰
+        for correlation_id in list(self._contexts)[:-1]:
+            if len(self._contexts) <= self.max_entries and self.memory_bytes <= self.memory_budget:
+                break
+            if correlation_id not in self._pinned:
+                self._drop(correlation_id)
+                self.evictions += 1
+
+    def open(self, correlation_id: str, original_request: str, pin: bool = True) -> Dict[str, Any]:
+        self._drop(correlation_id)
+        context = {
+            "original_request": original_request,
+            "subtasks": [],
+            "agent_results": [],
+            "prev_result": None,
+            "final_result": None,
+            "version": 0
+        }
+        self._contexts[correlation_id] = context
+        if pin:
+            self._pinned.add(correlation_id)
+        self._sizes[correlation_id] = 0
+        self._resize(correlation_id, ENTRY_OVERHEAD + len(original_request))
+        self._touch(correlation_id)
+        self._enforce_limits()
+        return context
+
+    def get(self, correlation_id: str) -> Optional[Dict[str, Any]]:
+        context = self._contexts.get(correlation_id)
+        if context is not None:
+            self._touch(correlation_id)
+        return context
+
+    def add_result(self, correlation_id: str, task: str, agent: str, result: str,
+                   subtask_id: Optional[str] = None) -> None:
+        context = self._contexts[correlation_id]
+        stored = self._store_value(correlation_id, result)
+        context["agent_results"].append({"task": task, "agent": agent, "result": stored, "subtask_id": subtask_id})
+        context["prev_result"] = stored
+        context["version"] += 1
+        self._touch(correlation_id)
+        self._enforce_limits()
+
+    def set_final_result(self, correlation_id: str, final_result: str) -> None:
+        context = self._contexts[correlation_id]
+        previous = context.get("final_result")
+        if isinstance(previous, str):
+            self._resize(correlation_id, -len(previous))
+        context["final_result"] = self._store_value(correlation_id, final_result)
+        context["version"] += 1
+        self._touch(correlation_id)
+        self._enforce_limits()
+
+    def finalize(self, correlation_id: str) -> Optional[Dict[str, Any]]:
+        context = self._contexts.get(correlation_id)
+        if context is None:
+            return None
+        finalized = dict(context,
+                         prev_result=self.resolve(context["prev_result"]),
+                         final_result=self.resolve(context["final_result"]),
+                         agent_results=self.results(correlation_id))
+        self._drop(correlation_id)
+        self.finalized += 1
+        return finalized
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "entries": len(self._contexts),
+            "pinned": len(self._pinned),
+            "memory_bytes": self.memory_bytes,
+            "memory_budget": self.memory_budget,
+            "spills": self.spills,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "finalized": self.finalized,
+        }
+
+    def close(self) -> None:
+        for correlation_id in list(self._contexts):
+            self._drop(correlation_id)
+        if self._owns_spill_dir and self.spill_dir is not None:
+            shutil.rmtree(self.spill_dir, ignore_errors=True)
+            self.spill_dir = None
+
+
+_default_store: Optional[ContextStore] = None
+
+
+def configure_context_store(store: ContextStore) -> ContextStore:
+    global _default_store
+    _default_store = store
+    return _default_store
+
+
+def get_default_context_store() -> ContextStore:
+    global _default_store
+    if _default_store is None:
+        _default_store = InMemoryContextStore()
+    return _default_store
+
+
+def resolve_message_context(payload: Dict[str, Any], needs: Iterable[str],
+                            store: Optional[ContextStore] = None) -> Dict[str, Any]:
+    if payload.get("context_ref") is None:
+        return payload.get("context") or {}
+    store = store if store is not None else get_default_context_store()
+    return store.load_slices(payload["context_ref"], needs)
@@ -1,3 +1,6 @@
+import asyncio
+import logging
+
 from autogen_core import (
     RoutedAgent,
     TopicId,
@@ -5,29 +8,108 @@ from autogen_core import (
     type_subscription,
 )
 
-from llm_client import LLMClient
+from typing import Any, Dict, List, Optional, Tuple
+
+from context_store import ContextStore, get_default_context_store, resolve_message_context
+from llm_client import LLMClient, get_default_llm_client
 from message import AgentResultMessage, EvaluationResultMessage
+from tracing import get_tracer
+
+logger = logging.getLogger(__name__)
+
+
+class EvaluationStats:
+    def __init__(self) -> None:
+        self.items = 0
+        self.batches = 0
+        self.max_batch_size = 0
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "items": self.items,
+            "batches": self.batches,
+            "max_batch_size": self.max_batch_size,
+            "avg_batch_size": self.items / self.batches if self.batches else 0.0,
+        }
+
+
+# 把来自不同请求的待评估结果攒成一批，合并成一次多条目的评估调用；攒满 max_batch_size 或等待超过 max_wait 即发出
+class EvaluationBatcher:
+    def __init__(self, llm_client: LLMClient, max_batch_size: int = 8, max_wait: float = 0.02) -> None:
+        if max_batch_size < 1:
+            raise ValueError("max_batch_size must be at least 1")
+        self.llm_client = llm_client
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.stats = EvaluationStats()
+        self._pending: List[Tuple[str, str, asyncio.Future]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+
+    async def evaluate(self, original_request: str, agent_result: str) -> bool:
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((original_request, agent_result, future))
+        if len(self._pending) >= self.max_batch_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(self.max_wait, self._flush)
+        return await future
+
+    def _flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if batch:
+            asyncio.ensure_future(self._run(batch))
+
+    async def _run(self, batch: List[Tuple[str, str, asyncio.Future]]) -> None:
+        self.stats.items += len(batch)
+        self.stats.batches += 1
+        self.stats.max_batch_size = max(self.stats.max_batch_size, len(batch))
+        get_tracer().observe("evaluation.batch_size", len(batch))
+        try:
+            verdicts = await self.llm_client.aevaluate_results([(request, result) for request, result, _ in batch])
+        except Exception as e:
+            for _, _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (_, _, future), verdict in zip(batch, verdicts):
+            if not future.done():
+                future.set_result(verdict)
 
 
 @type_subscription(topic_type="Evaluator")
 class Evaluator(RoutedAgent):
-    def __init__(self) -> None:
+    def __init__(self, context_store: Optional[ContextStore] = None, llm_client: Optional[LLMClient] = None,
+                 batcher: Optional[EvaluationBatcher] = None) -> None:
         super().__init__("Evaluator")
+        self.context_store = context_store if context_store is not None else get_default_context_store()
+        self.llm_client = llm_client if llm_client is not None else get_default_llm_client()
+        self.batcher = batcher
 
     @message_handler
     async def handle_agent_result(self, message: AgentResultMessage, ctx) -> EvaluationResultMessage:
-        print(f"[Evaluator] Received agent result from: {message.header.sender}")
+        logger.debug("Received agent result from: %s", message.header.sender)
         correlation_id = message.header.correlation_id
 
-        original_request = message.payload["context"].get("original_request", "No original request")
-        completed = LLMClient().evaluate_result(original_request, message.payload["result"])
+        # 引用指向某个子任务时按该子任务评估，否则按原始请求评估最终结果
+        context = resolve_message_context(message.payload, ("original_request", "subtask"), self.context_store)
+        original_request = context.get("subtask") or context.get("original_request", "No original request")
+        if self.batcher is not None:
+            completed = await self.batcher.evaluate(original_request, message.payload["result"])
+        else:
+            completed = await self.llm_client.aevaluate_result(original_request, message.payload["result"])
 
         final_result = message.payload["result"] if completed else None
         eval_msg = EvaluationResultMessage.create(sender="Evaluator",
                                                    correlation_id=correlation_id,
                                                    final_result=final_result,
                                                    completed=completed,
-                                                   context=message.payload["context"])
+                                                   context=message.payload.get("context"),
+                                                   context_ref=message.payload.get("context_ref"),
+                                                   trusted=True)
         # await self.publish_message(eval_msg, topic_id=TopicId("Orchestrator", source="Evaluator"))
-        print(f"[Evaluator] Evaluation for correlation_id {correlation_id} completed: {completed}")
+        logger.info("Evaluation for correlation_id %s completed: %s", correlation_id, completed)
+        get_tracer().count("evaluation.passed" if completed else "evaluation.failed")
         return eval_msg
@@ -0,0 +1,179 @@
+import asyncio
+import inspect
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, Optional
+
+from tracing import get_tracer
+
+EXECUTION_BACKENDS = ("auto", "inline", "thread", "process", "async")
+
+# 进程池中每个 worker 只反序列化一次 agent
+_worker_agent: Any = None
+
+
+def _init_process_worker(agent: Any) -> None:
+    global _worker_agent
+    _worker_agent = agent
+
+
+def _execute_in_process(*args: Any) -> Any:
+    return _worker_agent.execute(*args)
+
+
+def _execute_in_thread(agent: Any, *args: Any) -> Any:
+    return agent.execute(*args)
+
+
+class _StreamFailure:
+    def __init__(self, error: BaseException) -> None:
+        self.error = error
+
+
+_STREAM_END = object()
+
+
+class ExecutionStats:
+    def __init__(self) -> None:
+        self.queued = 0
+        self.running = 0
+        self.completed = 0
+        self.failed = 0
+        self.max_queue_depth = 0
+        self.total_wait_time = 0.0
+        self.total_run_time = 0.0
+
+    def snapshot(self) -> Dict[str, Any]:
+        finished = self.completed + self.failed
+        return {
+            "queued": self.queued,
+            "running": self.running,
+            "completed": self.completed,
+            "failed": self.failed,
+            "max_queue_depth": self.max_queue_depth,
+            "avg_wait_time": self.total_wait_time / finished if finished else 0.0,
+            "avg_run_time": self.total_run_time / finished if finished else 0.0,
+        }
+
+
+class AgentExecutor:
+    def __init__(self, agent: Any, backend: str = "auto", max_concurrency: int = 4, name: Optional[str] = None) -> None:
+        if backend not in EXECUTION_BACKENDS:
+            raise ValueError(f"Unknown execution backend: {backend}")
+        if max_concurrency < 1:
+            raise ValueError("max_concurrency must be at least 1")
+        if backend == "auto":
+            backend = "async" if inspect.iscoroutinefunction(agent.execute) else "thread"
+        elif backend == "async" and not inspect.iscoroutinefunction(agent.execute):
+            raise ValueError("async backend requires an agent with a coroutine execute method")
+        self.agent = agent
+        self.name = name if name is not None else type(agent).__name__
+        self._queue_depth_metric = f"executor.queue_depth.{self.name}"
+        self.backend = backend
+        self.max_concurrency = max_concurrency
+        self.stats = ExecutionStats()
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._pool: Optional[Executor] = None
+
+    def _get_pool(self) -> Executor:
+        if self._pool is None:
+            if self.backend == "process":
+                self._pool = ProcessPoolExecutor(max_workers=self.max_concurrency,
+                                                 initializer=_init_process_worker,
+                                                 initargs=(self.agent,))
+            else:
+                self._pool = ThreadPoolExecutor(max_workers=self.max_concurrency,
+                                                thread_name_prefix=f"agent-{type(self.agent).__name__}")
+        return self._pool
+
+    async def _invoke(self, *args: Any) -> Any:
+        if self.backend == "async":
+            return await self.agent.execute(*args)
+        if self.backend == "inline":
+            return self.agent.execute(*args)
+        loop = asyncio.get_running_loop()
+        if self.backend == "process":
+            return await loop.run_in_executor(self._get_pool(), _execute_in_process, *args)
+        return await loop.run_in_executor(self._get_pool(), _execute_in_thread, self.agent, *args)
+
+    @asynccontextmanager
+    async def _slot(self):
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        stats = self.stats
+        stats.queued += 1
+        stats.max_queue_depth = max(stats.max_queue_depth, stats.queued)
+        tracer = get_tracer()
+        if tracer.enabled:
+            tracer.gauge(self._queue_depth_metric, stats.queued)
+        enqueued_at = time.perf_counter()
+        async with self._semaphore:
+            started_at = time.perf_counter()
+            stats.queued -= 1
+            stats.running += 1
+            stats.total_wait_time += started_at - enqueued_at
+            try:
+                yield
+            except BaseException:
+                stats.failed += 1
+                raise
+            else:
+                stats.completed += 1
+            finally:
+                stats.running -= 1
+                stats.total_run_time += time.perf_counter() - started_at
+
+    async def run(self, *args: Any) -> Any:
+        async with self._slot():
+            return await self._invoke(*args)
+
+    # agent 提供 stream 方法（同步生成器或异步生成器）时才能逐块产出；进程池后端无法跨进程传递生成器
+    def supports_streaming(self) -> bool:
+        return self.backend != "process" and callable(getattr(self.agent, "stream", None))
+
+    async def _iterate(self, *args: Any) -> AsyncIterator[Any]:
+        produced = self.agent.stream(*args)
+        if hasattr(produced, "__aiter__"):
+            async for chunk in produced:
+                yield chunk
+            return
+        if self.backend == "inline":
+            for chunk in produced:
+                yield chunk
+            return
+        # 同步生成器在线程池中推进，产出的块通过队列交回事件循环
+        loop = asyncio.get_running_loop()
+        queue: asyncio.Queue = asyncio.Queue()
+
+        def drain() -> None:
+            try:
+                for chunk in produced:
+                    loop.call_soon_threadsafe(queue.put_nowait, chunk)
+            except BaseException as e:
+                loop.call_soon_threadsafe(queue.put_nowait, _StreamFailure(e))
+            finally:
+                loop.call_soon_threadsafe(queue.put_nowait, _STREAM_END)
+
+        drained = loop.run_in_executor(self._get_pool(), drain)
+        while True:
+            item = await queue.get()
+            if item is _STREAM_END:
+                break
+            if isinstance(item, _StreamFailure):
+                raise item.error
+            yield item
+        await drained
+
+    async def stream(self, *args: Any) -> AsyncIterator[Any]:
+        if not self.supports_streaming():
+            yield await self.run(*args)
+            return
+        async with self._slot():
+            async for chunk in self._iterate(*args):
+                yield chunk
+
+    def shutdown(self, wait: bool = False) -> None:
+        if self._pool is not None:
+            self._pool.shutdown(wait=wait)
+            self._pool = None
@@ -0,0 +1,143 @@
+import asyncio
+import random
+import re
+import threading
+import time
+from typing import Any, Dict, Optional
+
+DEFAULT_BREAKDOWN = (
+    "1 | Implement the requested feature | none\n"
+    "2 | Perform code review of the implementation | 1\n"
+    "3 | Write unit tests for the implementation | 1\n"
+    "4 | Create documentation for the implementation | 1,2,3"
+)
+
+DEFAULT_ROUTES = {
+    "review": "ReviewAgent",
+    "test": "TestAgent",
+    "document": "DocAgent",
+    "implement": "DevAgent",
+}
+
+_QUESTION = re.compile(r"Analyze the question: '(.*?)' and the following agent descriptions", re.S)
+_BATCH_ITEM = re.compile(r"^\[(\d+)\] Original request:", re.M)
+
+
+class LatencyModel:
+    # spec 形如 "0.05"、"constant:0.05"、"uniform:0.01,0.1" 或 "lognormal:0.05,0.5"（中位数，sigma）
+    def __init__(self, spec: str = "0", seed: Optional[int] = None) -> None:
+        kind, _, args = spec.partition(":") if ":" in spec else ("constant", "", spec)
+        self.kind = kind
+        self.params = [float(arg) for arg in args.split(",") if arg]
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        if kind not in ("constant", "uniform", "lognormal"):
+            raise ValueError(f"Unknown latency distribution: {kind}")
+
+    def sample(self) -> float:
+        with self._lock:
+            if self.kind == "uniform":
+                return self._random.uniform(self.params[0], self.params[1])
+            if self.kind == "lognormal":
+                median, sigma = self.params
+                return median * self._random.lognormvariate(0.0, sigma) if median > 0 else 0.0
+            return self.params[0] if self.params else 0.0
+
+
+class FakeLLMChat:
+    def __init__(self, latency: Optional[LatencyModel] = None, breakdown: str = DEFAULT_BREAKDOWN,
+                 routes: Optional[Dict[str, str]] = None, evaluation: str = "True",
+                 default_agent: str = "GenericAgent") -> None:
+        self.latency = latency if latency is not None else LatencyModel()
+        self.breakdown = breakdown
+        self.routes = routes if routes is not None else DEFAULT_ROUTES
+        self.evaluation = evaluation
+        self.default_agent = default_agent
+        self.calls: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def _respond(self, prompt: str) -> str:
+        if prompt.startswith("Break down"):
+            return self.breakdown
+        if prompt.startswith("Analyze the question"):
+            match = _QUESTION.search(prompt)
+            question = match.group(1).lower() if match else prompt.lower()
+            for keyword, agent in self.routes.items():
+                if keyword in question:
+                    return agent
+            return self.default_agent
+        if prompt.startswith("Given the original request"):
+            return self.evaluation
+        if prompt.startswith("Given the following"):
+            return "\n".join(f"{index}: {self.evaluation}" for index in _BATCH_ITEM.findall(prompt))
+        return "ok"
+
+    def process(self, prompt: str) -> str:
+        kind = prompt.split(" ", 1)[0]
+        with self._lock:
+            self.calls[kind] = self.calls.get(kind, 0) + 1
+        time.sleep(self.latency.sample())
+        return self._respond(prompt)
+
+
+def burn_cpu(seconds: float) -> None:
+    # 按线程 CPU 时间计，多线程争抢 GIL 时不会提前结束
+    deadline = time.thread_time() + seconds
+    while time.thread_time() < deadline:
+        pass
+
+
+class FakeAgent:
+    # cpu_time 模拟持有 GIL 的本地计算（解析、打分等），用于观察多进程部署的扩展性；
+    # 传入 chat（例如 llm_client.DispatchedLLMChat）时每个任务额外发出一次 LLM 调用
+    def __init__(self, name: str, latency: Optional[LatencyModel] = None, output_size: int = 200,
+                 cpu_time: float = 0.0, chat: Optional[Any] = None) -> None:
+        self.name = name
+        self.latency = latency if latency is not None else LatencyModel()
+        self.output_size = output_size
+        self.cpu_time = cpu_time
+        self.chat = chat
+
+    def prompt(self, task: str) -> str:
+        return f"Complete the task as {self.name}: {task}"
+
+    def output(self, task: str) -> str:
+        header = f"[{self.name}] completed: {task.splitlines()[0]}\n"
+        return header + "x" * max(0, self.output_size - len(header))
+
+    def execute(self, task: str, context: Optional[dict] = None) -> str:
+        if self.chat is not None:
+            self.chat.process(self.prompt(task))
+        time.sleep(self.latency.sample())
+        burn_cpu(self.cpu_time)
+        return self.output(task)
+
+    # 把延迟平均分摊到各个片段上，模拟逐 token 输出的 agent
+    def stream(self, task: str, context: Optional[dict] = None, chunks: int = 8):
+        if self.chat is not None:
+            self.chat.process(self.prompt(task))
+        output, latency = self.output(task), self.latency.sample()
+        step = max(1, -(-len(output) // chunks))
+        for start in range(0, len(output), step):
+            time.sleep(latency / chunks)
+            yield output[start:start + step]
+        burn_cpu(self.cpu_time)
+
+
+class AsyncFakeAgent(FakeAgent):
+    async def execute(self, task: str, context: Optional[dict] = None) -> str:
+        if self.chat is not None:
+            await self.chat.aprocess(self.prompt(task))
+        await asyncio.sleep(self.latency.sample())
+        burn_cpu(self.cpu_time)
+        return self.output(task)
+
+    async def stream(self, task: str, context: Optional[dict] = None, chunks: int = 8):
+        if self.chat is not None:
+            await self.chat.aprocess(self.prompt(task))
+        output, latency = self.output(task), self.latency.sample()
+        step = max(1, -(-len(output) // chunks))
+        for start in range(0, len(output), step):
+            await asyncio.sleep(latency / chunks)
+            yield output[start:start + step]
+        burn_cpu(self.cpu_time)
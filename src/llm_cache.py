@@ -0,0 +1,240 @@
+import asyncio
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_prompt(prompt: str) -> str:
+    return _WHITESPACE.sub(" ", prompt).strip()
+
+
+def make_cache_key(call_type: str, prompt: str) -> str:
+    return hashlib.sha256(f"{call_type}\0{normalize_prompt(prompt)}".encode("utf-8")).hexdigest()
+
+
+class CacheStats:
+    def __init__(self) -> None:
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+        self.bytes_read = 0
+        self.bytes_written = 0
+
+    def snapshot(self) -> Dict[str, Any]:
+        lookups = self.memory_hits + self.disk_hits + self.misses
+        return {
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": (self.memory_hits + self.disk_hits) / lookups if lookups else 0.0,
+            "stores": self.stores,
+            "evictions": self.evictions,
+            "bytes_read": self.bytes_read,
+            "bytes_written": self.bytes_written,
+        }
+
+
+class LLMCache:
+    def __init__(self, path: Optional[str] = None, memory_entries: int = 1024, ttl: Optional[float] = 24 * 3600,
+                 max_disk_bytes: int = 64 * 1024 * 1024, disabled_call_types: Iterable[str] = ()) -> None:
+        self.path = path
+        self.memory_entries = memory_entries
+        self.ttl = ttl
+        self.max_disk_bytes = max_disk_bytes
+        self.disabled_call_types = set(disabled_call_types)
+        self.stats = CacheStats()
+        self._memory: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()
+        # 内存层和磁盘层分开加锁，线程中的磁盘读写不会卡住事件循环中的内存查询
+        self._lock = threading.Lock()
+        self._db_lock = threading.Lock()
+        self._connection: Optional[sqlite3.Connection] = None
+        self._connection_pid: Optional[int] = None
+        self._writes_since_eviction = 0
+
+    def enabled_for(self, call_type: str) -> bool:
+        return call_type not in self.disabled_call_types
+
+    def _expired(self, created_at: float) -> bool:
+        return self.ttl is not None and time.time() - created_at > self.ttl
+
+    # 连接在 fork 之后重新打开，WAL 模式允许同一台机器上的多个进程并发读写
+    def _db(self) -> sqlite3.Connection:
+        if self._connection is None or self._connection_pid != os.getpid():
+            directory = os.path.dirname(os.path.abspath(self.path))
+            os.makedirs(directory, exist_ok=True)
+            connection = sqlite3.connect(self.path, timeout=10.0, isolation_level=None, check_same_thread=False)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS llm_cache ("
+                "key TEXT PRIMARY KEY, call_type TEXT NOT NULL, response TEXT NOT NULL, "
+                "size INTEGER NOT NULL, created_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+            )
+            connection.execute("CREATE INDEX IF NOT EXISTS llm_cache_accessed_at ON llm_cache (accessed_at)")
+            self._connection = connection
+            self._connection_pid = os.getpid()
+        return self._connection
+
+    def _remember(self, key: str, response: str, created_at: float) -> None:
+        self._memory[key] = (response, created_at)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+            self.stats.evictions += 1
+
+    def _get_memory(self, key: str) -> Optional[str]:
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is None:
+                return None
+            if not self._expired(entry[1]):
+                self._memory.move_to_end(key)
+                self.stats.memory_hits += 1
+                return entry[0]
+            del self._memory[key]
+            return None
+
+    def _get_disk(self, key: str) -> Optional[str]:
+        with self._db_lock:
+            db = self._db()
+            row = db.execute("SELECT response, created_at FROM llm_cache WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            response, created_at = row
+            if self._expired(created_at):
+                db.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+                return None
+            db.execute("UPDATE llm_cache SET accessed_at = ? WHERE key = ?", (time.time(), key))
+        with self._lock:
+            self._remember(key, response, created_at)
+            self.stats.disk_hits += 1
+            self.stats.bytes_read += len(response.encode("utf-8"))
+        return response
+
+    def _miss(self) -> None:
+        with self._lock:
+            self.stats.misses += 1
+
+    def get(self, call_type: str, prompt: str) -> Optional[str]:
+        if not self.enabled_for(call_type):
+            return None
+        key = make_cache_key(call_type, prompt)
+        response = self._get_memory(key)
+        if response is None and self.path is not None:
+            response = self._get_disk(key)
+        if response is None:
+            self._miss()
+        return response
+
+    # 异步路径：内存层在事件循环中直接查询，磁盘层放到线程中执行，SQLite 等锁时不阻塞 runtime
+    async def aget(self, call_type: str, prompt: str) -> Optional[str]:
+        if not self.enabled_for(call_type):
+            return None
+        key = make_cache_key(call_type, prompt)
+        response = self._get_memory(key)
+        if response is None and self.path is not None:
+            response = await asyncio.to_thread(self._get_disk, key)
+        if response is None:
+            self._miss()
+        return response
+
+    def _put_memory(self, key: str, response: str, now: float) -> None:
+        with self._lock:
+            self._remember(key, response, now)
+            self.stats.stores += 1
+
+    def _put_disk(self, key: str, call_type: str, response: str, now: float) -> None:
+        size = len(response.encode("utf-8"))
+        with self._db_lock:
+            self._db().execute(
+                "INSERT OR REPLACE INTO llm_cache (key, call_type, response, size, created_at, accessed_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (key, call_type, response, size, now, now),
+            )
+            self._writes_since_eviction += 1
+            if self._writes_since_eviction >= 32:
+                self._evict_disk()
+        with self._lock:
+            self.stats.bytes_written += size
+
+    def put(self, call_type: str, prompt: str, response: str) -> None:
+        if not self.enabled_for(call_type):
+            return
+        key = make_cache_key(call_type, prompt)
+        now = time.time()
+        self._put_memory(key, response, now)
+        if self.path is not None:
+            self._put_disk(key, call_type, response, now)
+
+    async def aput(self, call_type: str, prompt: str, response: str) -> None:
+        if not self.enabled_for(call_type):
+            return
+        key = make_cache_key(call_type, prompt)
+        now = time.time()
+        self._put_memory(key, response, now)
+        if self.path is not None:
+            await asyncio.to_thread(self._put_disk, key, call_type, response, now)
+
+    def _evict_disk(self) -> None:
+        self._writes_since_eviction = 0
+        db = self._db()
+        evicted = 0
+        if self.ttl is not None:
+            cursor = db.execute("DELETE FROM llm_cache WHERE created_at < ?", (time.time() - self.ttl,))
+            evicted += max(cursor.rowcount, 0)
+        total = db.execute("SELECT COALESCE(SUM(size), 0) FROM llm_cache").fetchone()[0]
+        if total > self.max_disk_bytes:
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                for key, size in db.execute("SELECT key, size FROM llm_cache ORDER BY accessed_at").fetchall():
+                    if total <= self.max_disk_bytes:
+                        break
+                    db.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+                    total -= size
+                    evicted += 1
+                db.execute("COMMIT")
+            except BaseException:
+                db.execute("ROLLBACK")
+                raise
+        with self._lock:
+            self.stats.evictions += evicted
+
+    def clear(self) -> None:
+        with self._lock:
+            self._memory.clear()
+        if self.path is not None:
+            with self._db_lock:
+                self._db().execute("DELETE FROM llm_cache")
+
+    def close(self) -> None:
+        with self._db_lock:
+            if self._connection is not None and self._connection_pid == os.getpid():
+                self._connection.close()
+            self._connection = None
+
+
+_default_cache: Optional[LLMCache] = None
+
+
+def configure_cache(**kwargs: Any) -> LLMCache:
+    global _default_cache
+    if _default_cache is not None:
+        _default_cache.close()
+    _default_cache = LLMCache(**kwargs)
+    return _default_cache
+
+
+def get_default_cache() -> LLMCache:
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = LLMCache()
+    return _default_cache
@@ -1,45 +1,317 @@
-from typing import Any, Dict, Optional, List, Set, Tuple
+import logging
+import re
+import time
+from typing import Any, Callable, Dict, Optional, List, Set, Tuple
+
+from llm_cache import LLMCache, get_default_cache
+from llm_dispatcher import LLMDispatcher, estimate_tokens
+from prompt_builder import PromptBuilder, get_default_prompt_builder
+from tracing import get_tracer
+from task_graph import TaskGraph, parse_task_graph
+
+
+logger = logging.getLogger(__name__)
+_chat_factory: Optional[Callable[[], Any]] = None
+_VERDICT = re.compile(r"^\s*\[?(\d+)\]?\s*[:.)-]\s*(true|false)\b", re.I | re.M)
+
+
+# agent_core 导入较慢，第一次真正调用 LLM 时才加载
+def _default_chat() -> Any:
+    from agent_core.utils.llm_chat import LLMChat
+    return LLMChat()
+
+
+# 基准测试和离线 CI 用它替换成 fake_llm.FakeLLMChat
+def set_chat_factory(factory: Optional[Callable[[], Any]]) -> None:
+    global _chat_factory
+    _chat_factory = factory
+
+
+def process_prompt(prompt: str) -> str:
+    factory = _chat_factory if _chat_factory is not None else _default_chat
+    return factory().process(prompt)
+
+
+_default_dispatcher: Optional[LLMDispatcher] = None
+
+
+def configure_dispatcher(**kwargs: Any) -> LLMDispatcher:
+    global _default_dispatcher
+    _default_dispatcher = LLMDispatcher(process_prompt, **kwargs)
+    return _default_dispatcher
+
+
+def get_default_dispatcher() -> LLMDispatcher:
+    global _default_dispatcher
+    if _default_dispatcher is None:
+        _default_dispatcher = LLMDispatcher(process_prompt)
+    return _default_dispatcher
+
+
+# 交给 agent 使用的 chat，接口与 LLMChat 相同：调用经默认调度器的 bulk 通道发出，与编排调用共用限流和合并，不经过响应缓存。
+# 同步 agent 在执行器线程中调用 process，协程 agent 调用 aprocess；进程池后端的子进程中没有调度器，不能使用
+class DispatchedLLMChat:
+    def __init__(self, dispatcher: Optional[LLMDispatcher] = None, call_type: str = "agent") -> None:
+        self._dispatcher = dispatcher
+        self.call_type = call_type
+
+    @property
+    def dispatcher(self) -> LLMDispatcher:
+        return self._dispatcher if self._dispatcher is not None else get_default_dispatcher()
+
+    def process(self, prompt: str) -> str:
+        started = time.perf_counter()
+        response = self.dispatcher.submit_threadsafe(prompt, call_type=self.call_type)
+        LLMClient._record_call(self.call_type, prompt, response, started)
+        return response
+
+    async def aprocess(self, prompt: str) -> str:
+        started = time.perf_counter()
+        response = await self.dispatcher.submit(prompt, call_type=self.call_type)
+        LLMClient._record_call(self.call_type, prompt, response, started)
+        return response
 
-from agent_core.utils.llm_chat import LLMChat
 
 class LLMClient:
+    def __init__(self, cache: Optional[LLMCache] = None, dispatcher: Optional[LLMDispatcher] = None,
+                 prompt_builder: Optional[PromptBuilder] = None) -> None:
+        self._cache = cache
+        self._dispatcher = dispatcher
+        self._prompt_builder = prompt_builder
+        self._template_token_counts: Dict[Tuple[Callable[[str], int], str], int] = {}
 
-    def select_agent(self, agent_descriptions: str, question: str, exclude: Set[str] = None) -> str:
-        if exclude is None:
-            exclude = set()
-        prompt = (
+    @property
+    def cache(self) -> LLMCache:
+        return self._cache if self._cache is not None else get_default_cache()
+
+    @property
+    def dispatcher(self) -> LLMDispatcher:
+        return self._dispatcher if self._dispatcher is not None else get_default_dispatcher()
+
+    @property
+    def prompt_builder(self) -> PromptBuilder:
+        return self._prompt_builder if self._prompt_builder is not None else get_default_prompt_builder()
+
+    @staticmethod
+    def _record_call(call_type: str, prompt: str, response: Optional[str], started: float) -> None:
+        tracer = get_tracer()
+        if not tracer.enabled:
+            return
+        if response is None:
+            tracer.count(f"llm.cache_hits.{call_type}")
+            return
+        tracer.count(f"llm.calls.{call_type}")
+        tracer.count(f"llm.prompt_tokens.{call_type}", estimate_tokens(prompt))
+        tracer.count(f"llm.completion_tokens.{call_type}", estimate_tokens(response))
+        tracer.observe(f"llm.latency.{call_type}", time.perf_counter() - started)
+
+    # cacheable 返回 False 的响应不写入缓存，例如未通过的评估结论，重试时需要重新询问 LLM
+    def _complete(self, call_type: str, prompt: str, cacheable: Optional[Callable[[str], bool]] = None) -> str:
+        cached = self.cache.get(call_type, prompt)
+        if cached is not None:
+            self._record_call(call_type, prompt, None, 0.0)
+            return cached
+        started = time.perf_counter()
+        with get_tracer().span("llm", call_type=call_type):
+            response = process_prompt(prompt)
+        self._record_call(call_type, prompt, response, started)
+        if cacheable is None or cacheable(response):
+            self.cache.put(call_type, prompt, response)
+        return response
+
+    async def _acomplete(self, call_type: str, prompt: str, cacheable: Optional[Callable[[str], bool]] = None) -> str:
+        cached = await self.cache.aget(call_type, prompt)
+        if cached is not None:
+            self._record_call(call_type, prompt, None, 0.0)
+            return cached
+        started = time.perf_counter()
+        with get_tracer().span("llm", call_type=call_type):
+            response = await self.dispatcher.submit(prompt, call_type=call_type)
+        self._record_call(call_type, prompt, response, started)
+        if cacheable is None or cacheable(response):
+            await self.cache.aput(call_type, prompt, response)
+        return response
+
+    # 模板中固定文字（说明、示例）占用的 token 数，按当前 prompt builder 的计数器计算一次后缓存
+    def _template_tokens(self, name: str, template: str) -> int:
+        counter = self.prompt_builder.count_tokens
+        key = (counter, name)
+        tokens = self._template_token_counts.get(key)
+        if tokens is None:
+            tokens = self._template_token_counts[key] = counter(template)
+        return tokens
+
+    def _select_agent_prompt(self, agent_descriptions: str, question: str, exclude: Optional[Set[str]]) -> str:
+        return (
             f"Analyze the question: '{question}' and the following agent descriptions: {agent_descriptions}.\n"
             f"Exclude: {','.join(exclude) if exclude else 'none'}.\n"
             "Return only the agent name, return no_agent if none selected"
         )
-        response = LLMChat().process(prompt)
+
+    def _parse_selected_agent(self, prompt: str, response: str) -> str:
         selected = response.strip()
-        print(f"[LLMClient] select_agent prompt:\n{prompt}\nResponse: {selected}")
+        logger.debug("select_agent prompt:\n%s\nResponse: %s", prompt, selected)
         return selected
 
-    def evaluate_result(self, original_request: str, agent_result: str) -> bool:
-        prompt = (
+    def select_agent(self, agent_descriptions: str, question: str, exclude: Set[str] = None) -> str:
+        prompt = self._select_agent_prompt(agent_descriptions, question, exclude)
+        return self._parse_selected_agent(prompt, self._complete("select_agent", prompt))
+
+    async def aselect_agent(self, agent_descriptions: str, question: str, exclude: Set[str] = None) -> str:
+        prompt = self._select_agent_prompt(agent_descriptions, question, exclude)
+        return self._parse_selected_agent(prompt, await self._acomplete("select_agent", prompt))
+
+    # 请求最多占预算的四分之一，其余留给结果；超出部分替换为摘要或首尾摘录
+    def _fit_evaluation_item(self, original_request: str, agent_result: str, budget: Optional[int]) -> Tuple[str, str]:
+        if budget is None:
+            return original_request, agent_result
+        builder = self.prompt_builder
+        original_request = builder.fit_text(original_request, budget // 4)
+        return original_request, builder.fit_text(agent_result, budget - builder.count_tokens(original_request))
+
+    def _evaluate_result_prompt(self, original_request: str, agent_result: str) -> str:
+        builder = self.prompt_builder
+        original_tokens = builder.count_tokens(original_request) + builder.count_tokens(agent_result)
+        original_request, agent_result = self._fit_evaluation_item(original_request, agent_result,
+                                                                   builder.budget("evaluate_result"))
+        prompt = self._evaluate_result_text(original_request, agent_result)
+        builder.record("evaluate_result",
+                       original_tokens + self._template_tokens("evaluate_result", self._evaluate_result_text("", "")), prompt)
+        return prompt
+
+    @staticmethod
+    def _evaluate_result_text(original_request: str, agent_result: str) -> str:
+        return (
             f"Given the original request: '{original_request}' and the agent result: '{agent_result}',\n"
             "determine if the task was successfully completed. Return True if successful, else False."
         )
-        response = LLMChat().process(prompt)
-        result = response.strip().lower()
-        print(f"[LLMClient] evaluate_result prompt:\n{prompt}\nResponse: {result}")
-        return True
-
-    def breakdown_task(self, request_content: str, context: Dict[str, Any]) -> Tuple[List[str], str]:
-        prompt = (
-            f"Break down the task: '{request_content}' with context: {context}.\n"
-            "Return subtasks separated by semicolons and execution mode serial or parallel separated by a pipe symbol.\n"
-            "Example: task1; task2 | serial"
+
+    # 与批量评估保持一致：只有明确回答 False 才算未完成
+    @staticmethod
+    def _passed(response: str) -> bool:
+        return not response.strip().lower().startswith("false")
+
+    def _parse_evaluation(self, prompt: str, response: str) -> bool:
+        logger.debug("evaluate_result prompt:\n%s\nResponse: %s", prompt, response.strip())
+        return self._passed(response)
+
+    # 只缓存通过的结论：未通过的结论如果被缓存，重试后同样的评估提示会直接重放 False
+    def evaluate_result(self, original_request: str, agent_result: str) -> bool:
+        prompt = self._evaluate_result_prompt(original_request, agent_result)
+        return self._parse_evaluation(prompt, self._complete("evaluate_result", prompt, cacheable=self._passed))
+
+    async def aevaluate_result(self, original_request: str, agent_result: str) -> bool:
+        prompt = self._evaluate_result_prompt(original_request, agent_result)
+        return self._parse_evaluation(prompt, await self._acomplete("evaluate_result", prompt, cacheable=self._passed))
+
+    def _evaluate_results_prompt(self, items: List[Tuple[str, str]]) -> str:
+        builder = self.prompt_builder
+        item_tokens = self._template_tokens("evaluate_results.item", self._evaluation_section(1, "", ""))
+        original_tokens = sum(builder.count_tokens(request) + builder.count_tokens(result) + item_tokens
+                              for request, result in items)
+        original_tokens += self._template_tokens("evaluate_results", self._evaluate_results_text(""))
+        budget = builder.budget("evaluate_result")
+        # 批量评估时预算按条目平分，但每条至少保留 256 个 token
+        item_budget = max(256, budget // len(items)) if budget is not None else None
+        items = [self._fit_evaluation_item(request, result, item_budget) for request, result in items]
+        sections = "\n".join(self._evaluation_section(index, request, result)
+                              for index, (request, result) in enumerate(items, 1))
+        prompt = self._evaluate_results_text(sections)
+        builder.record("evaluate_result", original_tokens, prompt)
+        return prompt
+
+    @staticmethod
+    def _evaluation_section(index: int, original_request: str, agent_result: str) -> str:
+        return f"[{index}] Original request: '{original_request}'\nAgent result: '{agent_result}'"
+
+    @staticmethod
+    def _evaluate_results_text(sections: str) -> str:
+        return (
+            "Given the following numbered pairs of original request and agent result, determine for each pair "
+            "if the task was successfully completed.\n"
+            f"{sections}\n"
+            "Return one line per pair as: number: True or False."
         )
-        response = LLMChat().process(prompt)
+
+    # 缺失或无法解析的条目按通过处理
+    @staticmethod
+    def _verdicts(response: str, count: int) -> List[bool]:
+        verdicts = [True] * count
+        for match in _VERDICT.finditer(response):
+            index = int(match.group(1)) - 1
+            if 0 <= index < count:
+                verdicts[index] = match.group(2).lower() == "true"
+        return verdicts
+
+    def _parse_evaluations(self, prompt: str, response: str, count: int) -> List[bool]:
+        logger.debug("evaluate_results prompt:\n%s\nResponse: %s", prompt, response)
+        return self._verdicts(response, count)
+
+    async def aevaluate_results(self, items: List[Tuple[str, str]]) -> List[bool]:
+        if len(items) == 1:
+            return [await self.aevaluate_result(*items[0])]
+        prompt = self._evaluate_results_prompt(items)
+        response = await self._acomplete("evaluate_result", prompt,
+                                         cacheable=lambda response: all(self._verdicts(response, len(items))))
+        return self._parse_evaluations(prompt, response, len(items))
+
+    def _breakdown_task_prompt(self, request_content: str, context: Dict[str, Any]) -> str:
+        builder = self.prompt_builder
+        budget = builder.budget("breakdown_task")
+        template_tokens = self._template_tokens("breakdown_task", self._breakdown_instructions("", ""))
+        original_tokens = builder.count_tokens(request_content) + builder.raw_context_tokens(context) + template_tokens
+        if budget is None:
+            context_text = str(context)
+        else:
+            request_content = builder.fit_text(request_content, budget // 4)
+            context_budget = budget - builder.count_tokens(request_content) - template_tokens
+            context_text = builder.render_context(context, max(64, context_budget))
+        prompt = self._breakdown_instructions(request_content, context_text)
+        builder.record("breakdown_task", original_tokens, prompt)
+        return prompt
+
+    def _breakdown_instructions(self, request_content: str, context_text: str) -> str:
+        return (
+            f"Break down the task: '{request_content}' with context: {context_text}.\n"
+            "Return one subtask per line as: id | subtask | comma separated ids of the subtasks it depends on, or none.\n"
+            "Subtasks that do not depend on each other will be executed in parallel.\n"
+            "Example:\n"
+            "1 | Implement the feature | none\n"
+            "2 | Review the implementation | 1\n"
+            "3 | Write tests for the implementation | 1\n"
+            "4 | Write documentation for the feature | 1,2,3"
+        )
+
+    def _parse_breakdown(self, request_content: str, prompt: str, response: str) -> TaskGraph:
         response = response.strip()
-        print(f"[LLMClient] breakdown_task prompt:\n{prompt}\nResponse: {response}")
+        logger.debug("breakdown_task prompt:\n%s\nResponse: %s", prompt, response)
         try:
-            tasks_part, mode = response.split("|")
-            subtasks = [s.strip() for s in tasks_part.split(";") if s.strip()]
+            graph = parse_task_graph(response)
         except Exception as e:
-            subtasks = [request_content]
-            mode = "serial"
-        return subtasks, "serial"
\ No newline at end of file
+            logger.warning("Failed to parse breakdown response: %s", e)
+            graph = TaskGraph.serial([request_content])
+        return graph
+
+    def breakdown_task(self, request_content: str, context: Dict[str, Any]) -> TaskGraph:
+        prompt = self._breakdown_task_prompt(request_content, context)
+        return self._parse_breakdown(request_content, prompt, self._complete("breakdown_task", prompt))
+
+    async def abreakdown_task(self, request_content: str, context: Dict[str, Any]) -> TaskGraph:
+        prompt = self._breakdown_task_prompt(request_content, context)
+        return self._parse_breakdown(request_content, prompt, await self._acomplete("breakdown_task", prompt))
+
+
+_default_client: Optional[LLMClient] = None
+
+
+def configure_llm_client(**kwargs: Any) -> LLMClient:
+    global _default_client
+    _default_client = LLMClient(**kwargs)
+    return _default_client
+
+
+def get_default_llm_client() -> LLMClient:
+    global _default_client
+    if _default_client is None:
+        _default_client = LLMClient()
+    return _default_client
@@ -0,0 +1,233 @@
+import asyncio
+import itertools
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+
+from llm_cache import make_cache_key
+from tracing import get_tracer
+
+PRIORITY_HIGH = 0
+PRIORITY_NORMAL = 1
+PRIORITY_BULK = 2
+
+# 路由和评估调用优先于任务拆解，agent 自身的批量调用排在最后。agent 的调用只有经 llm_client.DispatchedLLMChat
+# 发出时才进入调度器；自行创建 LLMChat 的 agent 绕过这里的限流。限流范围是单个进程，多进程部署时每个 worker 各自计数
+CALL_PRIORITIES = {
+    "select_agent": PRIORITY_HIGH,
+    "evaluate_result": PRIORITY_HIGH,
+    "breakdown_task": PRIORITY_NORMAL,
+    "agent": PRIORITY_BULK,
+}
+
+
+def estimate_tokens(text: str) -> int:
+    return max(1, len(text) // 4)
+
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: float) -> None:
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+
+    def refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def wait_time(self, amount: float) -> float:
+        self.refill()
+        amount = min(amount, self.capacity)
+        return 0.0 if self.tokens >= amount else (amount - self.tokens) / self.rate
+
+    def consume(self, amount: float) -> None:
+        self.tokens -= min(amount, self.capacity)
+
+
+class DispatcherStats:
+    def __init__(self) -> None:
+        self.submitted = 0
+        self.coalesced = 0
+        self.dispatched = 0
+        self.failed = 0
+        self.cancelled = 0
+        self.queue_depth = 0
+        self.max_queue_depth = 0
+        self.throttled_time = 0.0
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "submitted": self.submitted,
+            "coalesced": self.coalesced,
+            "dispatched": self.dispatched,
+            "failed": self.failed,
+            "cancelled": self.cancelled,
+            "queue_depth": self.queue_depth,
+            "max_queue_depth": self.max_queue_depth,
+            "throttled_time": self.throttled_time,
+        }
+
+
+class LLMDispatcher:
+    def __init__(self, process: Callable[[str], str], max_workers: int = 8,
+                 requests_per_second: Optional[float] = None, tokens_per_minute: Optional[float] = None) -> None:
+        self.process = process
+        self.max_workers = max_workers
+        self.request_bucket = TokenBucket(requests_per_second, max(1.0, requests_per_second)) if requests_per_second else None
+        self.token_bucket = TokenBucket(tokens_per_minute / 60.0, tokens_per_minute) if tokens_per_minute else None
+        self.stats = DispatcherStats()
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._sequence = itertools.count()
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._waiters: Dict[asyncio.Future, int] = {}
+        self._queue: Optional[asyncio.PriorityQueue] = None
+        self._workers: List[asyncio.Task] = []
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    # 调度器同一时间只绑定一个事件循环：旧循环还可能继续运行时拒绝换绑，否则旧 worker 和等待中的调用会被悄悄丢下；
+    # 旧循环已经关闭时（例如 asyncio.run 结束而没有调用 close），其中的 worker 和等待方都已被取消，剩余状态直接丢弃
+    def _ensure_workers(self) -> None:
+        loop = asyncio.get_running_loop()
+        if self._loop is loop:
+            return
+        if self._loop is not None:
+            if not self._loop.is_closed():
+                raise RuntimeError("LLM dispatcher is bound to another event loop, close() it on that loop first")
+            self._discard_queued()
+        self._loop = loop
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="llm-dispatch")
+        self._inflight = {}
+        self._waiters = {}
+        self._queue = asyncio.PriorityQueue()
+        self._workers = [loop.create_task(self._worker()) for _ in range(self.max_workers)]
+
+    # 把调度器绑定到当前事件循环；执行器线程中的同步 agent 通过 submit_threadsafe 提交前，runtime 启动时先调用一次
+    def start(self) -> None:
+        self._ensure_workers()
+
+    async def submit(self, prompt: str, call_type: str = "agent", priority: Optional[int] = None) -> str:
+        self._ensure_workers()
+        self.stats.submitted += 1
+        key = make_cache_key(call_type, prompt)
+        future = self._inflight.get(key)
+        if future is not None:
+            self.stats.coalesced += 1
+            get_tracer().count("llm.coalesced")
+            return await self._wait(key, future)
+        if priority is None:
+            priority = CALL_PRIORITIES.get(call_type, PRIORITY_BULK)
+        future = self._loop.create_future()
+        self._inflight[key] = future
+        self._queue.put_nowait((priority, next(self._sequence), key, prompt, future))
+        self.stats.queue_depth += 1
+        self.stats.max_queue_depth = max(self.stats.max_queue_depth, self.stats.queue_depth)
+        get_tracer().gauge("llm.queue_depth", self.stats.queue_depth)
+        return await self._wait(key, future)
+
+    # 供执行器线程中的同步 agent 调用：调用交给调度器所在的事件循环排队，当前线程阻塞等待结果
+    def submit_threadsafe(self, prompt: str, call_type: str = "agent", priority: Optional[int] = None) -> str:
+        loop = self._loop
+        if loop is None or loop.is_closed():
+            raise RuntimeError("LLM dispatcher is not bound to an event loop, call start() on the runtime loop first")
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is loop:
+            raise RuntimeError("submit_threadsafe would block the dispatcher's own event loop, await submit() instead")
+        return asyncio.run_coroutine_threadsafe(self.submit(prompt, call_type, priority), loop).result()
+
+    # 合并的调用共享同一个 future；所有等待方都被取消（例如请求超时）后，尚未发出的调用直接作废
+    async def _wait(self, key: str, future: asyncio.Future) -> str:
+        self._waiters[future] = self._waiters.get(future, 0) + 1
+        try:
+            return await asyncio.shield(future)
+        except asyncio.CancelledError:
+            if self._waiters.get(future) == 1 and not future.done():
+                future.cancel()
+                self.stats.cancelled += 1
+                get_tracer().count("llm.cancelled")
+                if self._inflight.get(key) is future:
+                    del self._inflight[key]
+            raise
+        finally:
+            remaining = self._waiters.pop(future, 1) - 1
+            if remaining:
+                self._waiters[future] = remaining
+
+    async def _throttle(self, prompt: str) -> None:
+        tokens = estimate_tokens(prompt)
+        while True:
+            wait = 0.0
+            if self.request_bucket is not None:
+                wait = max(wait, self.request_bucket.wait_time(1))
+            if self.token_bucket is not None:
+                wait = max(wait, self.token_bucket.wait_time(tokens))
+            if wait <= 0:
+                break
+            self.stats.throttled_time += wait
+            await asyncio.sleep(wait)
+        if self.request_bucket is not None:
+            self.request_bucket.consume(1)
+        if self.token_bucket is not None:
+            self.token_bucket.consume(tokens)
+
+    async def _worker(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            priority, _, key, prompt, future = await self._queue.get()
+            self.stats.queue_depth -= 1
+            if future.done():
+                self._queue.task_done()
+                continue
+            try:
+                await self._throttle(prompt)
+                if future.done():
+                    continue
+                response = await loop.run_in_executor(self._executor, self.process, prompt)
+            except asyncio.CancelledError:
+                if not future.done():
+                    future.cancel()
+                raise
+            except Exception as e:
+                self.stats.failed += 1
+                if not future.done():
+                    future.set_exception(e)
+            else:
+                self.stats.dispatched += 1
+                if not future.done():
+                    future.set_result(response)
+            finally:
+                if self._inflight.get(key) is future:
+                    del self._inflight[key]
+                self._queue.task_done()
+
+    # 还在排队的调用不会再发出：取消它们的 future，等待方收到 CancelledError 而不是一直挂起
+    def _discard_queued(self) -> None:
+        while self._queue is not None and not self._queue.empty():
+            _, _, _, _, future = self._queue.get_nowait()
+            self.stats.queue_depth -= 1
+            if not future.done():
+                if not future.get_loop().is_closed():
+                    future.cancel()
+                self.stats.cancelled += 1
+        self._queue = None
+        self._inflight = {}
+        self._waiters = {}
+        self._workers = []
+
+    async def close(self) -> None:
+        if self._loop is not None and not self._loop.is_closed():
+            if self._loop is not asyncio.get_running_loop():
+                raise RuntimeError("LLM dispatcher must be closed on the event loop it is bound to")
+            for worker in self._workers:
+                worker.cancel()
+            await asyncio.gather(*self._workers, return_exceptions=True)
+        self._discard_queued()
+        self._loop = None
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
@@ -0,0 +1,64 @@
+import importlib
+import json
+from typing import Any, Callable, Dict, List, Optional
+
+# 清单为 JSON 文件：{"agents": [{"name", "description", "factory", ...}]}，factory 形如 "package.module:callable"，
+# 调用时传入 args 中的关键字参数；模块只在第一次分发到该 agent 时才导入
+MANIFEST_FIELDS = {"name", "description", "factory", "topic", "args", "execution_backend", "max_concurrency",
+                   "pool_size", "balancing"}
+
+
+def resolve_factory(path: str) -> Callable[..., Any]:
+    module_name, _, attribute = path.partition(":")
+    if not module_name or not attribute:
+        raise ValueError(f"Agent factory must look like 'module:callable', got {path!r}")
+    target: Any = importlib.import_module(module_name)
+    for part in attribute.split("."):
+        target = getattr(target, part)
+    return target
+
+
+class AgentSpec:
+    def __init__(self, name: str, description: str, factory: str, topic: Optional[str] = None,
+                 args: Optional[Dict[str, Any]] = None, execution_backend: str = "auto", max_concurrency: int = 4,
+                 pool_size: int = 1, balancing: str = "least_outstanding") -> None:
+        self.name = name
+        self.description = description
+        self.factory = factory
+        self.topic = topic
+        self.args = dict(args or {})
+        self.execution_backend = execution_backend
+        self.max_concurrency = max_concurrency
+        self.pool_size = pool_size
+        self.balancing = balancing
+
+    def agent_factory(self) -> Callable[[], Any]:
+        return lambda: resolve_factory(self.factory)(**self.args)
+
+    def __repr__(self) -> str:
+        return f"AgentSpec(name={self.name!r}, factory={self.factory!r})"
+
+
+def parse_manifest(data: Dict[str, Any]) -> List[AgentSpec]:
+    entries = data.get("agents")
+    if not isinstance(entries, list):
+        raise ValueError("Agent manifest must contain an 'agents' list")
+    specs: List[AgentSpec] = []
+    seen = set()
+    for index, entry in enumerate(entries):
+        missing = {"name", "description", "factory"} - set(entry)
+        if missing:
+            raise ValueError(f"Agent manifest entry {index} is missing {sorted(missing)}")
+        unknown = set(entry) - MANIFEST_FIELDS
+        if unknown:
+            raise ValueError(f"Agent manifest entry {entry['name']!r} has unknown fields {sorted(unknown)}")
+        if entry["name"] in seen:
+            raise ValueError(f"Agent {entry['name']!r} appears more than once in the manifest")
+        seen.add(entry["name"])
+        specs.append(AgentSpec(**entry))
+    return specs
+
+
+def load_manifest(path: str) -> List[AgentSpec]:
+    with open(path, "r", encoding="utf-8") as f:
+        return parse_manifest(json.load(f))
@@ -1,81 +1,158 @@
+import itertools
+import os
+import time
 import uuid
-from datetime import datetime
+from datetime import datetime, timezone
 from typing import Any, Dict, Optional
 from pydantic import BaseModel, Field
 
+_CROCKFORD_BASE32 = "0123456789ABCDEFGHJKMNPQRSTVWXYZ"
+_id_counter = itertools.count(1)
+_id_prefix = f"{os.getpid():x}{uuid.uuid4().hex[:6]}"
+_id_strategy = "uuid"
+_validate_messages = True
+
+def format_timestamp(timestamp_ns: int) -> str:
+    return datetime.fromtimestamp(timestamp_ns / 1e9, tz=timezone.utc).replace(tzinfo=None).isoformat() + "Z"
+
 def current_timestamp() -> str:
-    return datetime.utcnow().isoformat() + "Z"
+    return format_timestamp(time.time_ns())
+
+def generate_ulid() -> str:
+    value = (time.time_ns() // 1_000_000) << 80 | int.from_bytes(os.urandom(10), "big")
+    chars = []
+    for _ in range(26):
+        value, index = divmod(value, 32)
+        chars.append(_CROCKFORD_BASE32[index])
+    return "".join(reversed(chars))
+
+# 与 str(uuid.uuid4()) 格式相同的随机 UUID，省去构造 UUID 对象的开销
+def generate_uuid4() -> str:
+    value = bytearray(os.urandom(16))
+    value[6] = value[6] & 0x0F | 0x40
+    value[8] = value[8] & 0x3F | 0x80
+    h = value.hex()
+    return f"{h[:8]}-{h[8:12]}-{h[12:16]}-{h[16:20]}-{h[20:]}"
 
 def generate_id() -> str:
-    return str(uuid.uuid4())
+    if _id_strategy == "counter":
+        return f"{_id_prefix}-{next(_id_counter)}"
+    if _id_strategy == "ulid":
+        return generate_ulid()
+    return generate_uuid4()
+
+# id_strategy: uuid（默认）、counter（进程内单调递增）或 ulid；validate=False 时所有消息都走快速路径
+def configure_messages(id_strategy: str = "uuid", validate: bool = True) -> None:
+    global _id_strategy, _validate_messages
+    if id_strategy not in ("uuid", "counter", "ulid"):
+        raise ValueError(f"Unknown message id strategy: {id_strategy}")
+    _id_strategy = id_strategy
+    _validate_messages = validate
+
+# 与 model_construct 等价但没有逐字段处理默认值的开销，调用方必须提供全部字段。直接写入 pydantic v2 的内部属性
+# （__pydantic_fields_set__/__pydantic_extra__/__pydantic_private__），按 pydantic 2.14 验证；升级 pydantic 后用
+# bench_messages.py 和测试重新确认。bench_messages.py 的 model_construct 一行实测只有这里的一半左右，不比校验路径快，
+# 所以保留这个模块私有的实现
+def _construct(model_cls, values: Dict[str, Any]):
+    instance = model_cls.__new__(model_cls)
+    object.__setattr__(instance, "__dict__", values)
+    object.__setattr__(instance, "__pydantic_fields_set__", set(values))
+    object.__setattr__(instance, "__pydantic_extra__", None)
+    object.__setattr__(instance, "__pydantic_private__", None)
+    return instance
 
 class MessageHeader(BaseModel):
     message_id: str = Field(default_factory=generate_id)
     sender: str
     recipient: Optional[str] = None
-    timestamp: str = Field(default_factory=current_timestamp)
+    timestamp_ns: int = Field(default_factory=time.time_ns)
     correlation_id: Optional[str] = None
     message_type: str
 
+    # 时间戳以整数纳秒保存，只在读取时格式化；默认序列化只输出 timestamp_ns，需要字符串时由调用方读取此属性
+    @property
+    def timestamp(self) -> str:
+        return format_timestamp(self.timestamp_ns)
+
+# 优先携带上下文引用（correlation id + version），只有旧调用方才内联完整上下文
+def context_payload(context: Optional[Dict[str, Any]], context_ref: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    if context_ref is not None:
+        return {"context_ref": context_ref}
+    return {"context": context if context is not None else {}}
+
 class BaseMessage(BaseModel):
     header: MessageHeader
     payload: Dict[str, Any]
     metadata: Dict[str, Any] = {}
 
-class UserRequestMessage(BaseMessage):
+    # 受信任的内部消息跳过 pydantic 校验，仍然是同一个消息类，runtime 的类型路由不受影响
     @classmethod
-    def create(cls, sender: str, request_content: str, correlation_id: Optional[str] = None) -> "UserRequestMessage":
+    def build(cls, payload: Dict[str, Any], sender: str, recipient: Optional[str], message_type: str,
+              correlation_id: Optional[str] = None, trusted: bool = False):
+        if trusted or not _validate_messages:
+            header = _construct(MessageHeader, {"message_id": generate_id(), "sender": sender, "recipient": recipient,
+                                                "timestamp_ns": time.time_ns(), "correlation_id": correlation_id,
+                                                "message_type": message_type})
+            return _construct(cls, {"header": header, "payload": payload, "metadata": {}})
         header = MessageHeader(
             sender=sender,
-            recipient="Orchestrator",
-            message_type="UserRequest",
+            recipient=recipient,
+            message_type=message_type,
             correlation_id=correlation_id
         )
-        return cls(header=header, payload={"content": request_content})
+        return cls(header=header, payload=payload)
+
+    # 把受信任来源（例如本机 broker 转发的帧）中的普通字典重建为消息，不走 pydantic 校验；header 必须包含全部字段
+    @classmethod
+    def restore(cls, header: Dict[str, Any], payload: Dict[str, Any], metadata: Optional[Dict[str, Any]] = None):
+        return _construct(cls, {"header": _construct(MessageHeader, header), "payload": payload, "metadata": metadata or {}})
+
+# deadline 为 wall-clock 时间戳（time.time()），跨进程传递后仍然有效；None 表示不限时。
+# retry 只由编排者在评估未通过后重新发起请求时设置，外部请求不应携带
+class UserRequestMessage(BaseMessage):
+    @classmethod
+    def create(cls, sender: str, request_content: str, correlation_id: Optional[str] = None, stream: bool = False,
+               deadline: Optional[float] = None, retry: bool = False, trusted: bool = False) -> "UserRequestMessage":
+        return cls.build({"content": request_content, "stream": stream, "deadline": deadline, "retry": retry}, sender=sender,
+                         recipient="Orchestrator", message_type="UserRequest", correlation_id=correlation_id, trusted=trusted)
 
 
 class AgentTaskMessage(BaseMessage):
     @classmethod
-    def create(cls, sender: str, recipient: str, task_content: str, correlation_id: str, context: Dict[str, Any], retry: int = 0) -> "AgentTaskMessage":
-        header = MessageHeader(
-            sender=sender,
-            recipient=recipient,
-            message_type="AgentTask",
-            correlation_id=correlation_id
-        )
-        return cls(header=header, payload={"task": task_content, "retry": retry, "context": context})
+    def create(cls, sender: str, recipient: str, task_content: str, correlation_id: str, context: Optional[Dict[str, Any]] = None, retry: int = 0,
+               context_ref: Optional[Dict[str, Any]] = None, stream: bool = False, deadline: Optional[float] = None,
+               trusted: bool = False) -> "AgentTaskMessage":
+        return cls.build({"task": task_content, "retry": retry, "stream": stream, "deadline": deadline,
+                          **context_payload(context, context_ref)}, sender=sender,
+                         recipient=recipient, message_type="AgentTask", correlation_id=correlation_id, trusted=trusted)
 
 
 class AgentResultMessage(BaseMessage):
     @classmethod
-    def create(cls, sender: str, correlation_id: str, result: str, context: Dict[str, Any]) -> "AgentResultMessage":
-        header = MessageHeader(
-            sender=sender,
-            recipient="Orchestrator",
-            message_type="AgentResult",
-            correlation_id=correlation_id
-        )
-        return cls(header=header, payload={"result": result, "context": context})
+    def create(cls, sender: str, correlation_id: str, result: str, context: Optional[Dict[str, Any]] = None,
+               context_ref: Optional[Dict[str, Any]] = None, success: bool = True, trusted: bool = False) -> "AgentResultMessage":
+        return cls.build({"result": result, "success": success, **context_payload(context, context_ref)}, sender=sender,
+                         recipient="Orchestrator", message_type="AgentResult", correlation_id=correlation_id, trusted=trusted)
+
+# 流式模式下 agent 在完整结果之前逐块发布的片段，index 从 0 开始
+class AgentResultChunkMessage(BaseMessage):
+    @classmethod
+    def create(cls, sender: str, correlation_id: str, chunk: str, index: int, subtask_id: Optional[str] = None,
+               trusted: bool = False) -> "AgentResultChunkMessage":
+        return cls.build({"chunk": chunk, "index": index, "subtask_id": subtask_id}, sender=sender,
+                         recipient="Orchestrator", message_type="AgentResultChunk", correlation_id=correlation_id, trusted=trusted)
 
 class EvaluationResultMessage(BaseMessage):
     @classmethod
-    def create(cls, sender: str, correlation_id: str, final_result: Optional[str], context: Dict[str, Any], completed: bool) -> "EvaluationResultMessage":
-        header = MessageHeader(
-            sender=sender,
-            recipient="Orchestrator",
-            message_type="EvaluationResult",
-            correlation_id=correlation_id
-        )
-        return cls(header=header, payload={"final_result": final_result, "context": context, "completed": completed})
+    def create(cls, sender: str, correlation_id: str, final_result: Optional[str], context: Optional[Dict[str, Any]] = None, completed: bool = False,
+               context_ref: Optional[Dict[str, Any]] = None, trusted: bool = False) -> "EvaluationResultMessage":
+        return cls.build({"final_result": final_result, "completed": completed, **context_payload(context, context_ref)}, sender=sender,
+                         recipient="Orchestrator", message_type="EvaluationResult", correlation_id=correlation_id, trusted=trusted)
 
 
 class ErrorNotificationMessage(BaseMessage):
     @classmethod
-    def create(cls, sender: str, error_info: str, correlation_id: Optional[str] = None) -> "ErrorNotificationMessage":
-        header = MessageHeader(
-            sender=sender,
-            recipient="Orchestrator",
-            message_type="ErrorNotification",
-            correlation_id=correlation_id
-        )
-        return cls(header=header, payload={"error": error_info})
+    def create(cls, sender: str, error_info: str, correlation_id: Optional[str] = None,
+               trusted: bool = False) -> "ErrorNotificationMessage":
+        return cls.build({"error": error_info}, sender=sender, recipient="Orchestrator",
+                         message_type="ErrorNotification", correlation_id=correlation_id, trusted=trusted)
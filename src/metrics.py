@@ -0,0 +1,70 @@
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+
+def percentile(samples: List[float], p: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, int(round(p / 100.0 * (len(ordered) - 1)))))
+    return ordered[index]
+
+
+class LatencyHistogram:
+    def __init__(self, max_samples: int = 100000) -> None:
+        self.max_samples = max_samples
+        self.samples: List[float] = []
+        self.count = 0
+        self.total = 0.0
+
+    def add(self, value: float) -> None:
+        self.count += 1
+        self.total += value
+        if len(self.samples) < self.max_samples:
+            self.samples.append(value)
+
+    def summary(self) -> Dict[str, float]:
+        return {
+            "count": self.count,
+            "mean": self.total / self.count if self.count else 0.0,
+            "p50": percentile(self.samples, 50),
+            "p95": percentile(self.samples, 95),
+            "p99": percentile(self.samples, 99),
+            "max": max(self.samples) if self.samples else 0.0,
+        }
+
+
+class StageMetrics:
+    def __init__(self) -> None:
+        self.histograms: Dict[str, LatencyHistogram] = {}
+
+    def record(self, stage: str, seconds: float) -> None:
+        histogram = self.histograms.get(stage)
+        if histogram is None:
+            histogram = self.histograms[stage] = LatencyHistogram()
+        histogram.add(seconds)
+
+    @contextmanager
+    def timer(self, stage: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(stage, time.perf_counter() - started)
+
+    def snapshot(self) -> Dict[str, Dict[str, float]]:
+        return {stage: histogram.summary() for stage, histogram in self.histograms.items()}
+
+    def reset(self) -> None:
+        self.histograms = {}
+
+
+_stage_metrics: Optional[StageMetrics] = None
+
+
+def get_stage_metrics() -> StageMetrics:
+    global _stage_metrics
+    if _stage_metrics is None:
+        _stage_metrics = StageMetrics()
+    return _stage_metrics
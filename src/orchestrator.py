@@ -1,118 +1,328 @@
 import asyncio
+import logging
+import time
 
-from typing import Any, Dict, Set
+from typing import Any, Callable, Dict, Optional, Set
 from autogen_core import (
+    CancellationToken,
     RoutedAgent,
     TopicId,
     message_handler,
     type_subscription, AgentId,
 )
 
-from llm_client import LLMClient
-from message import EvaluationResultMessage, UserRequestMessage, AgentResultMessage, AgentTaskMessage
+from admission import AdmissionController, AdmissionRejected
+from agent_pool import AgentPool
+from checkpoint import CheckpointStore, RetryPolicy, subtask_key
+from context_store import ContextStore, get_default_context_store
+from llm_client import LLMClient, get_default_llm_client
+from tracing import get_tracer
+from message import EvaluationResultMessage, UserRequestMessage, AgentResultMessage, AgentResultChunkMessage, AgentTaskMessage
 from register import Register
+from task_graph import DagScheduler, TaskGraph, TaskNode
+
+logger = logging.getLogger(__name__)
+# final: 所有子任务完成后评估汇总结果；speculative: 每个子任务完成后在后台评估，下游子任务不等待，评估失败时回滚
+EVALUATION_MODES = ("final", "speculative")
 
-llm_client = LLMClient()
 @type_subscription(topic_type="Orchestrator")
 class Orchestrator(RoutedAgent):
     instance = None
 
-    def __init__(self) -> None:
+    def __init__(self, max_parallel_subtasks: int = 4, context_store: Optional[ContextStore] = None,
+                 checkpoints: Optional[CheckpointStore] = None, retry_policy: Optional[RetryPolicy] = None,
+                 on_complete: Optional[Callable[[str, Optional[str], bool], None]] = None,
+                 pools: Optional[Dict[str, AgentPool]] = None,
+                 on_chunk: Optional[Callable[[str, Optional[str], str], None]] = None,
+                 evaluation_mode: str = "final", admission: Optional[AdmissionController] = None,
+                 request_timeout: Optional[float] = None,
+                 on_reject: Optional[Callable[[str, str], None]] = None,
+                 llm_client: Optional[LLMClient] = None) -> None:
         super().__init__("Orchestrator")
-        self.contexts: Dict[str, Dict[str, Any]] = {}
+        if evaluation_mode not in EVALUATION_MODES:
+            raise ValueError(f"Unknown evaluation mode: {evaluation_mode}")
+        self.llm_client = llm_client if llm_client is not None else get_default_llm_client()
+        self.contexts: ContextStore = context_store if context_store is not None else get_default_context_store()
+        self.scheduler = DagScheduler(max_concurrency=max_parallel_subtasks)
+        self.checkpoints = checkpoints if checkpoints is not None else CheckpointStore()
+        self.retry_policy = retry_policy if retry_policy is not None else RetryPolicy()
+        self.on_complete = on_complete
+        self.pools = pools if pools is not None else {}
+        self.on_chunk = on_chunk
+        self.evaluation_mode = evaluation_mode
+        self.streaming: Set[str] = set()
+        # 尚未产出第一个结果片段的请求及其开始时间，用于统计首个输出的耗时（ttft）
+        self.awaiting_first_output: Dict[str, float] = {}
+        self.active: Set[str] = set()
+        # 正在准入队列中等待的请求，用于识别重复的 correlation id
+        self.admitting: Set[str] = set()
+        self.admission = admission
+        # 请求未携带截止时间时使用的默认时限（秒），None 表示不限时
+        self.request_timeout = request_timeout
+        self.on_reject = on_reject
+        self.deadlines: Dict[str, Optional[float]] = {}
+        self.cancellations: Dict[str, CancellationToken] = {}
 
     @message_handler
     async def handle_user_request(self, message: UserRequestMessage, ctx) -> None:
+        correlation_id = message.header.correlation_id or message.header.message_id
+        tracer = get_tracer()
+        if message.payload.get("retry"):
+            # 重试只由编排者在评估未通过后直接调用 retry_request 发起，不接受经 runtime 发布的重试消息
+            logger.warning("Dropping externally published retry of request %s", correlation_id)
+            return
+        if correlation_id in self.active or correlation_id in self.admitting:
+            # 同一 correlation id 的请求已在处理中，再次执行会覆盖它的上下文；直接丢弃，
+            # 不经 on_reject 通知，因为调用方按 correlation id 登记的是正在处理的那个请求
+            logger.warning("Request %s rejected: correlation id is already in flight", correlation_id)
+            tracer.count("orchestrator.duplicate_requests")
+            return
+
+        started = time.perf_counter()
+        deadline = message.payload.get("deadline")
+        if deadline is None and self.request_timeout is not None:
+            deadline = time.time() + self.request_timeout
+        self.admitting.add(correlation_id)
+        try:
+            queue_wait = await self.admission.acquire(correlation_id, deadline) if self.admission is not None else 0.0
+        except AdmissionRejected as e:
+            logger.warning("%s", e)
+            if self.on_reject is not None:
+                self.on_reject(correlation_id, str(e))
+            return
+        finally:
+            self.admitting.discard(correlation_id)
+        self.active.add(correlation_id)
+        self.awaiting_first_output[correlation_id] = started
+        self.deadlines[correlation_id] = deadline
+        self.cancellations[correlation_id] = CancellationToken()
+        tracer.count("orchestrator.requests")
+        tracer.gauge("orchestrator.active_requests", len(self.active))
+        try:
+            with tracer.span("request", correlation_id, retry=False, queue_wait=queue_wait):
+                if deadline is None:
+                    await self.run_request(correlation_id, message, ctx)
+                else:
+                    await asyncio.wait_for(self.run_request(correlation_id, message, ctx), max(0.0, deadline - time.time()))
+        except asyncio.TimeoutError:
+            logger.warning("Request %s exceeded its deadline, cancelling outstanding subtasks", correlation_id)
+            tracer.count("orchestrator.deadline_exceeded")
+        finally:
+            # 超时或异常退出时取消仍在执行的子任务和评估，调用方拿到失败结果，名额交还准入控制
+            if correlation_id in self.active:
+                self.cancellations[correlation_id].cancel()
+                tracer.count("orchestrator.failed")
+                self.finish(correlation_id, None, False)
+
+    # 重试沿用首次准入时的名额和截止时间
+    async def retry_request(self, message: UserRequestMessage, ctx) -> None:
+        correlation_id = message.header.correlation_id
+        if correlation_id not in self.active:
+            logger.warning("Dropping retry of request %s that is no longer active", correlation_id)
+            return
+        with get_tracer().span("request", correlation_id, retry=True):
+            await self.run_request(correlation_id, message, ctx)
+
+    async def run_request(self, correlation_id: str, message: UserRequestMessage, ctx) -> None:
+        tracer = get_tracer()
         user_question = message.payload['content']
-        print(f"[Orchestrator] Received user request: {user_question}")
-        correlation_id = message.header.message_id
-        self.contexts[correlation_id] = {
-            "original_request": user_question,
-            "subtasks": [],
-            "agent_results": [],
-            "prev_result": None
-        }
-
-        subtasks, execution_mode = llm_client.breakdown_task(user_question, self.contexts[correlation_id])
-        print(f"[Orchestrator] Breakdown results: {subtasks}, mode: {execution_mode}")
-        current_context = self.contexts[correlation_id]
-        if execution_mode.strip() == "serial":
-
-            for subtask in subtasks:
-                agent_result = await self.delegate_task(correlation_id, subtask, current_context)
-                current_context["subtasks"].append({"task": subtask, "is_completed": True})
-                current_context["prev_result"] = agent_result.payload["result"]
-                current_context["agent_results"].append(agent_result)
-
-        elif execution_mode == "parallel":
-            tasks = []
-
-            for subtask in subtasks:
-                current_context["subtasks"].append({"task": subtask, "is_completed": False})
-                tasks.append(self.delegate_task(correlation_id, subtask, current_context))
-
-            results = await asyncio.gather(*tasks)
-            current_context["agent_results"].append(results)
-            for result in results:
-                print(result)
-
-            final_result = "\n".join(results)
-            print(f"[Orchestrator] Parallel subtask results: {final_result}")
+        logger.info("Received user request %s: %s", correlation_id, user_question)
+        current_context = self.contexts.open(correlation_id, user_question)
+        if message.payload.get("stream"):
+            self.streaming.add(correlation_id)
 
-        else:
+        # 重试时复用已保存的拆解结果，不再重新调用 LLM
+        graph = self.checkpoints.load_plan(correlation_id)
+        if graph is None:
+            with tracer.stage("breakdown", correlation_id):
+                graph = await self.llm_client.abreakdown_task(user_question, current_context)
+            self.checkpoints.save_plan(correlation_id, graph)
+        logger.debug("Breakdown results for %s: %s", correlation_id, graph)
+        subtask_states = {}
+        for node_id in graph.order:
+            node = graph.nodes[node_id]
+            subtask_states[node_id] = {"id": node_id, "task": node.task, "depends_on": node.depends_on, "is_completed": False}
+            current_context["subtasks"].append(subtask_states[node_id])
+
+        async def run_subtask(node: TaskNode, upstream: Dict[str, str]) -> str:
+            key = subtask_key(node)
+            checkpoint = self.checkpoints.load(correlation_id, key)
+            if checkpoint is not None:
+                logger.info("Reusing checkpointed result for subtask %s: %s", node.id, node.task)
+                tracer.count("orchestrator.checkpoint_hits")
+                agent, result = checkpoint["agent"], checkpoint["result"]
+            else:
+                context_ref = self.contexts.make_ref(correlation_id, subtask_id=node.id, depends_on=node.depends_on)
+                with tracer.span("dispatch", correlation_id, subtask_id=node.id):
+                    agent_result = await self.delegate_task(correlation_id, node.task, context_ref)
+                agent, result = agent_result.header.sender, agent_result.payload["result"]
+                if agent_result.payload.get("success", True):
+                    self.checkpoints.save(correlation_id, key, agent, result)
+                else:
+                    tracer.count("orchestrator.subtask_failures")
+            subtask_states[node.id]["is_completed"] = True
+            self.contexts.add_result(correlation_id, node.task, agent, result, subtask_id=node.id)
+            # 检查点复用的结果在之前的尝试中已经评估通过
+            if self.evaluation_mode == "speculative" and checkpoint is None:
+                evaluations[node.id] = asyncio.ensure_future(self.evaluate(correlation_id, result, subtask_id=node.id))
+            return result
+
+        evaluations: Dict[str, asyncio.Future] = {}
+        try:
+            results = await self.scheduler.run(graph, run_subtask)
+        except BaseException:
+            for evaluation in evaluations.values():
+                evaluation.cancel()
+            raise
 
-            response = await self.delegate_task(correlation_id, user_question, current_context)
-            current_context["subtasks"].append({"task": user_question, "is_completed": True})
-            current_context["agent_results"].append(response)
+        final_result = "\n\n".join(results[node_id] for node_id in graph.order)
+        self.contexts.set_final_result(correlation_id, final_result)
+        logger.info("All subtasks executed for correlation_id %s", correlation_id)
+        logger.debug("Final result for %s: %s", correlation_id, final_result)
+        if self.evaluation_mode == "speculative":
+            evaluate_result = await self.collect_speculative_evaluations(correlation_id, graph, evaluations, final_result)
+        else:
+            # Send final aggregated result to Evaluator for final evaluation
+            with tracer.stage("evaluation", correlation_id):
+                evaluate_result = await self.evaluate(correlation_id, final_result)
+        await self.handle_evaluation_result(evaluate_result, ctx)
 
-        final_result = self.contexts[correlation_id]["final_result"]
-        print(f"[Orchestrator] All subtasks executed for correlation_id {correlation_id}. Final result: {final_result}")
-        # Broadcast final aggregated result to Evaluator for final evaluation
-        evaluate_result = await self.send_message(AgentResultMessage.create(
+    async def evaluate(self, correlation_id: str, result: str, subtask_id: Optional[str] = None) -> EvaluationResultMessage:
+        return await self.send_message(AgentResultMessage.create(
             sender="Orchestrator",
             correlation_id=correlation_id,
-            result=final_result,
-            success=True
-        ), recipient=AgentId("Evaluator", "Orchestrator"))
-
-    async def delegate_task(self, correlation_id: str, task_content: str, context: Dict[str, Any]) -> AgentResultMessage:
-        agents = Register.get_agents_desc()
-        descriptions = "\n".join([f"AgentName: {name}, Description: {info['description']}" for name, info in agents.items()])
-        selected_agent = llm_client.select_agent(descriptions, task_content)
-        print(f"[Orchestrator] LLM selected agent: {selected_agent}")
+            result=result,
+            context_ref=self.contexts.make_ref(correlation_id, subtask_id=subtask_id),
+            trusted=True
+        ), recipient=AgentId("Evaluator", "Orchestrator"), cancellation_token=self.cancellations.get(correlation_id))
+
+    # 子任务评估与下游执行重叠进行，这里只等待尚未返回的部分；有子任务未通过时作废它及其全部下游的检查点，交给重试流程重跑
+    async def collect_speculative_evaluations(self, correlation_id: str, graph: TaskGraph,
+                                              evaluations: Dict[str, asyncio.Future],
+                                              final_result: str) -> EvaluationResultMessage:
+        with get_tracer().stage("evaluation", correlation_id, speculative=True):
+            verdicts = dict(zip(evaluations, await asyncio.gather(*evaluations.values())))
+        failed = [node_id for node_id, verdict in verdicts.items() if not verdict.payload["completed"]]
+        if failed:
+            rollback: Set[str] = set()
+            pending = list(failed)
+            while pending:
+                node_id = pending.pop()
+                if node_id not in rollback:
+                    rollback.add(node_id)
+                    pending.extend(graph.dependents(node_id))
+            logger.info("Speculative evaluation failed for subtasks %s of %s, rolling back %s",
+                        failed, correlation_id, sorted(rollback))
+            get_tracer().count("orchestrator.rollbacks")
+            self.checkpoints.invalidate(correlation_id, [subtask_key(graph.nodes[node_id]) for node_id in rollback])
+        return EvaluationResultMessage.create(sender="Orchestrator",
+                                              correlation_id=correlation_id,
+                                              final_result=None if failed else final_result,
+                                              completed=not failed,
+                                              context_ref=self.contexts.make_ref(correlation_id),
+                                              trusted=True)
+
+    async def delegate_task(self, correlation_id: str, task_content: str, context_ref: Dict[str, Any]) -> AgentResultMessage:
+        tracer = get_tracer()
+        # 同一次路由只读取一个注册表快照，agent 列表与提示词保持一致
+        registry = Register.snapshot()
+        agents = registry.agents
+        with tracer.stage("routing", correlation_id) as span:
+            selected_agent = Register.get_routing_index().route(task_content)
+            if selected_agent is not None:
+                logger.debug("Routing index selected agent: %s", selected_agent)
+                span.set("source", "index")
+            else:
+                selected_agent = await self.llm_client.aselect_agent(registry.prompt, task_content)
+                logger.debug("LLM selected agent: %s", selected_agent)
+                span.set("source", "llm")
         if selected_agent not in agents.keys():
             selected_agent = "GenericAgent"
-            print(f"[Orchestrator] Using GenericAgent as fallback")
+            logger.info("Using GenericAgent as fallback for task: %s", task_content)
+            tracer.count("orchestrator.generic_fallbacks")
         task_msg = AgentTaskMessage.create(sender="Orchestrator",
                                            recipient=selected_agent,
                                            task_content=task_content,
                                            correlation_id=correlation_id,
-                                           context=context)
+                                           context_ref=context_ref,
+                                           stream=correlation_id in self.streaming,
+                                           deadline=self.deadlines.get(correlation_id),
+                                           trusted=True)
+
+        pool = self.pools.get(selected_agent)
+        key = pool.acquire(correlation_id) if pool is not None else "default"
+        success = False
+        try:
+            with tracer.stage("execution", correlation_id, agent=selected_agent, instance=key):
+                agent_result = await self.send_message(task_msg, recipient=AgentId(type=selected_agent, key=key),
+                                                       cancellation_token=self.cancellations.get(correlation_id))
+            success = agent_result.payload.get("success", True)
+            self.mark_first_output(correlation_id)
+            return agent_result
+        finally:
+            if pool is not None:
+                pool.release(key, success)
+
+    def mark_first_output(self, correlation_id: str) -> None:
+        started = self.awaiting_first_output.pop(correlation_id, None)
+        if started is not None:
+            get_tracer().record_stage("ttft", time.perf_counter() - started)
+
+    # 片段到达即转发给调用方；下游子任务仍以上游的完整结果为输入，不等待评估
+    @message_handler
+    async def handle_result_chunk(self, message: AgentResultChunkMessage, ctx) -> None:
+        correlation_id = message.header.correlation_id
+        self.mark_first_output(correlation_id)
+        if self.on_chunk is not None and correlation_id in self.streaming:
+            self.on_chunk(correlation_id, message.payload.get("subtask_id"), message.payload["chunk"])
 
-        return await self.send_message(task_msg, recipient=AgentId(type=selected_agent, key="default"))
+    def finish(self, correlation_id: str, final_result: Optional[str], completed: bool) -> None:
+        self.contexts.finalize(correlation_id)
+        self.checkpoints.clear(correlation_id)
+        self.streaming.discard(correlation_id)
+        self.active.discard(correlation_id)
+        self.awaiting_first_output.pop(correlation_id, None)
+        self.deadlines.pop(correlation_id, None)
+        self.cancellations.pop(correlation_id, None)
+        if self.admission is not None:
+            self.admission.release(correlation_id)
+        if self.on_complete is not None:
+            self.on_complete(correlation_id, final_result, completed)
 
     @message_handler
     async def handle_evaluation_result(self, message: EvaluationResultMessage, ctx) -> None:
         correlation_id = message.header.correlation_id
-        self.contexts[correlation_id] = message.payload["context"]
+        context = self.contexts.get(correlation_id)
+        if context is None:
+            logger.warning("Context for correlation_id %s was evicted, dropping evaluation result", correlation_id)
+            return
         completed = message.payload["completed"]
         final_result = message.payload.get("final_result")
-        if not final_result and correlation_id in self.contexts:
-            final_result = "\n".join(self.contexts[correlation_id].get("agent_results", []))
+        if not final_result:
+            final_result = self.contexts.resolve(context.get("final_result"))
         if completed:
-            print(f"[Orchestrator] Final result returned to user: {final_result}")
+            logger.info("Final result returned to user for correlation_id %s", correlation_id)
+            get_tracer().count("orchestrator.completed")
             # Clear context and related states
-            self.contexts[correlation_id].get("subtasks")[0]["is_completed"] = True
-
-            user_msg = UserRequestMessage.create(sender="User", request_content=self.contexts[correlation_id].get("subtasks")[1],
-                                                 correlation_id=correlation_id)
-            await self.handle_user_request(user_msg, ctx)
-            # self.tried_topics.pop(correlation_id, None)
-            # self.contexts.pop(correlation_id, None)
-            # if correlation_id in self.result_futures:
-            #     self.result_futures.pop(correlation_id, None)
+            self.finish(correlation_id, final_result, True)
         else:
-            print(f"[Orchestrator] Evaluation indicates task not completed. Retrying.")
-            original_request = self.contexts.get(correlation_id, {}).get("original_request", "")
-            user_msg = UserRequestMessage.create(sender="User", request_content=original_request, correlation_id=correlation_id)
-            await self.handle_user_request(user_msg, ctx)
+            attempt = self.checkpoints.record_attempt(correlation_id)
+            if attempt > self.retry_policy.max_retries:
+                logger.warning("Retry budget exhausted for correlation_id %s, returning last result", correlation_id)
+                get_tracer().count("orchestrator.failed")
+                self.finish(correlation_id, final_result, False)
+                return
+            # 评估只覆盖最终阶段，因此只作废汇聚节点的检查点，上游结果在重试时直接复用
+            graph = self.checkpoints.load_plan(correlation_id)
+            if graph is not None:
+                self.checkpoints.invalidate(correlation_id, [subtask_key(graph.nodes[node_id]) for node_id in graph.sinks()])
+            delay = self.retry_policy.delay(attempt)
+            logger.info("Evaluation indicates task %s not completed. Retrying (attempt %d) in %.1fs.",
+                        correlation_id, attempt, delay)
+            get_tracer().count("orchestrator.retries")
+            await asyncio.sleep(delay)
+            original_request = context.get("original_request", "")
+            user_msg = UserRequestMessage.create(sender="User", request_content=original_request, correlation_id=correlation_id,
+                                                 stream=correlation_id in self.streaming,
+                                                 deadline=self.deadlines.get(correlation_id), retry=True, trusted=True)
+            await self.retry_request(user_msg, ctx)
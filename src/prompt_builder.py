@@ -0,0 +1,175 @@
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from context_store import ContextStore, SpilledValue
+from llm_dispatcher import estimate_tokens
+from routing_index import tokenize
+
+# 每类调用的提示词 token 上限（按 estimate_tokens 估算），未列出的调用类型不做压缩
+DEFAULT_BUDGETS = {
+    "breakdown_task": 2000,
+    "evaluate_result": 3000,
+}
+
+
+class PromptStats:
+    def __init__(self) -> None:
+        self.calls: Dict[str, int] = {}
+        self.prompt_tokens: Dict[str, int] = {}
+        self.tokens_saved: Dict[str, int] = {}
+        self.compacted: Dict[str, int] = {}
+        self.summary_hits = 0
+        self.summary_misses = 0
+
+    def record(self, call_type: str, original_tokens: int, prompt_tokens: int) -> None:
+        self.calls[call_type] = self.calls.get(call_type, 0) + 1
+        self.prompt_tokens[call_type] = self.prompt_tokens.get(call_type, 0) + prompt_tokens
+        saved = max(0, original_tokens - prompt_tokens)
+        self.tokens_saved[call_type] = self.tokens_saved.get(call_type, 0) + saved
+        if saved:
+            self.compacted[call_type] = self.compacted.get(call_type, 0) + 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "call_types": {
+                call_type: {
+                    "calls": calls,
+                    "prompt_tokens": self.prompt_tokens.get(call_type, 0),
+                    "tokens_saved": self.tokens_saved.get(call_type, 0),
+                    "avg_tokens_saved": self.tokens_saved.get(call_type, 0) / calls,
+                    "compacted": self.compacted.get(call_type, 0),
+                }
+                for call_type, calls in self.calls.items()
+            },
+            "summary_hits": self.summary_hits,
+            "summary_misses": self.summary_misses,
+        }
+
+
+def _raw_size(value: Any) -> int:
+    if isinstance(value, SpilledValue):
+        return value.size
+    return len(str(value)) if value is not None else 0
+
+
+# 在 token 预算内组织提示词上下文：始终保留原始请求，优先放入最近且与请求最相关的结果，
+# 放不下的结果用（缓存的）摘要或首尾摘录代替
+class PromptBuilder:
+    def __init__(self, budgets: Optional[Dict[str, int]] = None,
+                 token_counter: Callable[[str], int] = estimate_tokens,
+                 summarizer: Optional[Callable[[str, int], str]] = None,
+                 recent_results: int = 3, excerpt_tokens: int = 120, summary_entries: int = 1024) -> None:
+        self.budgets = dict(DEFAULT_BUDGETS if budgets is None else budgets)
+        self.count_tokens = token_counter
+        self.summarizer = summarizer
+        self.recent_results = recent_results
+        self.excerpt_tokens = excerpt_tokens
+        self.summary_entries = summary_entries
+        self.stats = PromptStats()
+        self._summaries: "OrderedDict[Tuple[str, int], str]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def budget(self, call_type: str) -> Optional[int]:
+        return self.budgets.get(call_type)
+
+    @staticmethod
+    def excerpt(text: str, max_chars: int) -> str:
+        if len(text) <= max_chars:
+            return text
+        head = max_chars * 2 // 3
+        tail = max(0, max_chars - head)
+        omitted = len(text) - head - tail
+        return f"{text[:head]} ...[{omitted} chars omitted]... {text[len(text) - tail:] if tail else ''}"
+
+    def summarize(self, text: str, max_tokens: int) -> str:
+        if self.count_tokens(text) <= max_tokens:
+            return text
+        key = (hashlib.sha1(text.encode("utf-8")).hexdigest(), max_tokens)
+        with self._lock:
+            summary = self._summaries.get(key)
+            if summary is not None:
+                self._summaries.move_to_end(key)
+                self.stats.summary_hits += 1
+                return summary
+            self.stats.summary_misses += 1
+        if self.summarizer is not None:
+            summary = self.summarizer(text, max_tokens)
+        else:
+            # estimate_tokens 按 4 个字符一个 token 估算
+            summary = self.excerpt(text, max_tokens * 4)
+        with self._lock:
+            self._summaries[key] = summary
+            while len(self._summaries) > self.summary_entries:
+                self._summaries.popitem(last=False)
+        return summary
+
+    def _rank_results(self, entries: List[Dict[str, Any]], request_terms: set) -> List[int]:
+        recent_from = len(entries) - self.recent_results
+
+        def score(index: int) -> Tuple[bool, float, int]:
+            terms = set(tokenize(entries[index]["task"]))
+            relevance = len(terms & request_terms) / len(terms) if terms else 0.0
+            return index >= recent_from, relevance, index
+
+        return sorted(range(len(entries)), key=score, reverse=True)
+
+    def render_context(self, context: Dict[str, Any], budget_tokens: int) -> str:
+        original_request = str(context.get("original_request", ""))
+        lines = [f"Original request: {self.summarize(original_request, budget_tokens // 2)}"]
+        used = self.count_tokens(lines[0])
+        entries = context.get("agent_results") or []
+        rendered: Dict[int, str] = {}
+        omitted = 0
+        for index in self._rank_results(entries, set(tokenize(original_request))):
+            entry = entries[index]
+            prefix = f"- [{entry.get('agent')}] {entry.get('task')}: "
+            remaining = budget_tokens - used - self.count_tokens(prefix)
+            if remaining < 16:
+                omitted += 1
+                continue
+            text = str(ContextStore.resolve(entry.get("result")))
+            if self.count_tokens(text) > remaining:
+                text = self.summarize(text, min(self.excerpt_tokens, remaining))
+            rendered[index] = prefix + text
+            used += self.count_tokens(rendered[index])
+        if rendered:
+            lines.append("Previous results:")
+            lines.extend(rendered[index] for index in sorted(rendered))
+        if omitted:
+            lines.append(f"({omitted} earlier results omitted)")
+        return "\n".join(lines)
+
+    # 未压缩时 str(context) 的大致长度，只用于统计节省的 token，溢出到磁盘的结果按记录的大小计算
+    @staticmethod
+    def raw_context_tokens(context: Dict[str, Any]) -> int:
+        size = len(str(context.get("original_request", ""))) + _raw_size(context.get("prev_result")) \
+            + _raw_size(context.get("final_result"))
+        for entry in context.get("agent_results") or []:
+            size += len(str(entry.get("task", ""))) + len(str(entry.get("agent", ""))) + _raw_size(entry.get("result")) + 64
+        for entry in context.get("subtasks") or []:
+            size += len(str(entry))
+        return max(1, size // 4)
+
+    def fit_text(self, text: str, budget_tokens: int) -> str:
+        return self.summarize(text, max(16, budget_tokens))
+
+    def record(self, call_type: str, original_tokens: int, prompt: str) -> None:
+        self.stats.record(call_type, original_tokens, self.count_tokens(prompt))
+
+
+_default_builder: Optional[PromptBuilder] = None
+
+
+def configure_prompt_builder(**kwargs: Any) -> PromptBuilder:
+    global _default_builder
+    _default_builder = PromptBuilder(**kwargs)
+    return _default_builder
+
+
+def get_default_prompt_builder() -> PromptBuilder:
+    global _default_builder
+    if _default_builder is None:
+        _default_builder = PromptBuilder()
+    return _default_builder
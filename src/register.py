@@ -2,37 +2,134 @@
 
 DEFAULT_TOPIC = "DefaultTopic"
 
-from typing import Any, Dict, Optional, List, Set, Tuple
+import logging
+import threading
+from types import MappingProxyType
+from typing import Any, Callable, Dict, Iterable, Mapping, Optional, List, Set, Tuple
+
+from routing_index import RoutingIndex
+
+logger = logging.getLogger(__name__)
+
+
+# 注册表的不可变快照：读取方拿到同一个快照后看到的 agent 集合和提示词始终一致，读取不加锁
+class RegistrySnapshot:
+    __slots__ = ("version", "agents", "_prompt")
+
+    def __init__(self, version: int, agents: Dict[str, Dict]) -> None:
+        self.version = version
+        self.agents: Mapping[str, Dict] = MappingProxyType(agents)
+        self._prompt: Optional[str] = None
+
+    @property
+    def prompt(self) -> str:
+        if self._prompt is None:
+            self._prompt = "\n".join([f"AgentName: {name}, Description: {info['description']}" for name, info in self.agents.items()])
+        return self._prompt
 
 
 class Register:
-    _agents: Dict[str, Dict] = {}
+    _snapshot: RegistrySnapshot = RegistrySnapshot(0, {})
+    _lock = threading.RLock()
     _external_agents: List[Any] = []
+    _routing_index: RoutingIndex = RoutingIndex()
+    _remote_agents: Set[str] = set()
+    _remote_version: int = 0
+
+    # 写入方在锁内复制 agent 表并整体替换快照，没有实际变化时版本号不变
+    @classmethod
+    def _publish(cls, updates: Dict[str, Dict], removals: Iterable[str] = ()) -> None:
+        agents = dict(cls._snapshot.agents)
+        for name in removals:
+            agents.pop(name, None)
+        agents.update(updates)
+        cls._snapshot = RegistrySnapshot(cls._snapshot.version + 1, agents)
+
+    @classmethod
+    def register_agents(cls, entries: Iterable[Tuple[str, str, Optional[str]]], removals: Iterable[str] = ()) -> int:
+        with cls._lock:
+            current = cls._snapshot.agents
+            removals = [name for name in removals if name in current]
+            for name in removals:
+                cls._routing_index.remove(name)
+            updates: Dict[str, Dict] = {}
+            for agent_name, description, topic in entries:
+                info = {"description": description, "topic": topic if topic is not None else DEFAULT_TOPIC}
+                previous = updates.get(agent_name) or (None if agent_name in removals else current.get(agent_name))
+                if previous == info:
+                    continue
+                if previous is None or previous["description"] != description:
+                    cls._routing_index.add(agent_name, description)
+                updates[agent_name] = info
+                logger.debug("Registered agent %s, description: %s, topic: %s", agent_name, description, info["topic"])
+            if updates or removals:
+                cls._publish(updates, removals)
+            return cls._snapshot.version
 
     @classmethod
     def register_agent(cls, agent_name: str, description: str, topic: Optional[str] = None):
-        topic = topic if topic is not None else DEFAULT_TOPIC
-        cls._agents[agent_name] = {"description": description, "topic": topic}
-        # print(f"[Register] Registered agent {agent_name}, description: {description}, topic: {topic}")
+        cls.register_agents([(agent_name, description, topic)])
+
+    # agent 实例化时调用：已经按相同描述注册过的 agent 只做一次无锁读取
+    @classmethod
+    def ensure_agent(cls, agent_name: str, description: str, topic: Optional[str] = None):
+        info = cls._snapshot.agents.get(agent_name)
+        if info is None or info["description"] != description or info["topic"] != (topic if topic is not None else DEFAULT_TOPIC):
+            cls.register_agent(agent_name, description, topic)
 
     @classmethod
     def remove_agent(cls, agent_name: str):
-        if agent_name in cls._agents:
-            del cls._agents[agent_name]
-            print(f"[Register] Removed agent {agent_name}")
-        else:
-            print(f"[Register] Agent {agent_name} not found")
+        with cls._lock:
+            if agent_name in cls._snapshot.agents:
+                cls._routing_index.remove(agent_name)
+                cls._publish({}, [agent_name])
+                logger.info("Removed agent %s", agent_name)
+            else:
+                logger.warning("Agent %s not found", agent_name)
 
     @classmethod
     def register_external_agent(cls, agent: Any, name: str, description: str, topic: Optional[str] = None):
         topic = topic if topic is not None else DEFAULT_TOPIC
-        cls._external_agents.append(agent)
-        cls.register_agent(name, description, topic)
-        print(f"[Register] Custom agent registered: {name}")
+        with cls._lock:
+            cls._external_agents = cls._external_agents + [agent]
+            cls.register_agent(name, description, topic)
+        logger.info("Custom agent registered: %s", name)
+
+    # 多进程部署时用 broker 推送的注册表快照同步远端 agent，本进程注册的 agent 不受影响
+    @classmethod
+    def sync_remote_agents(cls, agents: Dict[str, Dict], version: int):
+        with cls._lock:
+            if version <= cls._remote_version:
+                return
+            cls.register_agents([(name, info["description"], info.get("topic")) for name, info in agents.items()],
+                                removals=cls._remote_agents - set(agents))
+            cls._remote_agents = set(agents)
+            cls._remote_version = version
+
+    @classmethod
+    def snapshot(cls) -> RegistrySnapshot:
+        return cls._snapshot
+
+    @classmethod
+    def get_agents_desc(cls) -> Mapping[str, Dict]:
+        return cls._snapshot.agents
+
+    @classmethod
+    def get_agents_prompt(cls) -> str:
+        return cls._snapshot.prompt
+
+    @classmethod
+    def configure_routing(cls, embedder: Optional[Callable[[str], List[float]]] = None,
+                          threshold: float = 0.2, margin: float = 0.05):
+        with cls._lock:
+            routing_index = RoutingIndex(embedder=embedder, threshold=threshold, margin=margin)
+            for name, info in cls._snapshot.agents.items():
+                routing_index.add(name, info["description"])
+            cls._routing_index = routing_index
 
     @classmethod
-    def get_agents_desc(cls) -> Dict[str, Dict]:
-        return cls._agents
+    def get_routing_index(cls) -> RoutingIndex:
+        return cls._routing_index
 
     @classmethod
     def get_agent_list(cls) -> List[Any]:
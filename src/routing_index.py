@@ -0,0 +1,144 @@
+import math
+import re
+import threading
+from collections import Counter
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+STOP_WORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "for", "from", "has", "in", "is", "it", "its",
+    "of", "on", "or", "that", "the", "this", "to", "was", "were", "will", "with", "which",
+    "agent", "task", "tasks", "once", "last",
+}
+
+_CAMEL_CASE = re.compile(r"(?<=[a-z0-9])(?=[A-Z])")
+_TOKEN = re.compile(r"[a-z0-9]+")
+
+
+def _stem(token: str) -> str:
+    for suffix in ("ations", "ation", "ings", "ing", "ers", "er", "es", "ed", "s"):
+        if token.endswith(suffix) and len(token) - len(suffix) >= 3:
+            return token[:-len(suffix)]
+    return token
+
+
+def tokenize(text: str) -> List[str]:
+    text = _CAMEL_CASE.sub(" ", text).lower()
+    return [_stem(token) for token in _TOKEN.findall(text) if token not in STOP_WORDS]
+
+
+def _cosine(a: Dict[str, float], b: Dict[str, float]) -> float:
+    if len(a) > len(b):
+        a, b = b, a
+    return sum(weight * b.get(term, 0.0) for term, weight in a.items())
+
+
+def _normalize(vector: Dict[str, float]) -> Dict[str, float]:
+    norm = math.sqrt(sum(weight * weight for weight in vector.values()))
+    return {term: weight / norm for term, weight in vector.items()} if norm else {}
+
+
+class RoutingStats:
+    def __init__(self) -> None:
+        self.local_hits = 0
+        self.llm_fallbacks = 0
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.local_hits + self.llm_fallbacks
+        return self.local_hits / total if total else 0.0
+
+    def snapshot(self) -> Dict[str, float]:
+        return {"local_hits": self.local_hits, "llm_fallbacks": self.llm_fallbacks, "hit_rate": self.hit_rate}
+
+
+class RoutingIndex:
+    def __init__(self, embedder: Optional[Callable[[str], List[float]]] = None,
+                 threshold: float = 0.2, margin: float = 0.05) -> None:
+        self.embedder = embedder
+        self.threshold = threshold
+        self.margin = margin
+        self.stats = RoutingStats()
+        self._term_counts: Dict[str, Counter] = {}
+        self._document_frequency: Counter = Counter()
+        self._embeddings: Dict[str, List[float]] = {}
+        self._vectors: Optional[Dict[str, Dict[str, float]]] = None
+        # 写入与向量重建互斥；已经建好的向量表只会被整体替换，查询时直接读取
+        self._lock = threading.Lock()
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._term_counts
+
+    def __len__(self) -> int:
+        return len(self._term_counts)
+
+    def add(self, name: str, description: str) -> None:
+        terms = Counter(tokenize(f"{name} {description}"))
+        embedding = self.embedder(f"{name}: {description}") if self.embedder is not None else None
+        with self._lock:
+            self._remove(name)
+            self._term_counts[name] = terms
+            self._document_frequency.update(terms.keys())
+            if embedding is not None:
+                self._embeddings[name] = embedding
+            self._vectors = None
+
+    def remove(self, name: str) -> None:
+        with self._lock:
+            self._remove(name)
+
+    def _remove(self, name: str) -> None:
+        terms = self._term_counts.pop(name, None)
+        if terms is None:
+            return
+        self._document_frequency.subtract(terms.keys())
+        self._document_frequency += Counter()
+        self._embeddings.pop(name, None)
+        self._vectors = None
+
+    def _idf(self, term: str) -> float:
+        return math.log((1 + len(self._term_counts)) / (1 + self._document_frequency.get(term, 0))) + 1.0
+
+    def _tfidf(self, terms: Counter) -> Dict[str, float]:
+        return _normalize({term: (1.0 + math.log(count)) * self._idf(term) for term, count in terms.items()})
+
+    # idf 随 agent 数量变化，向量在索引变更后的第一次查询时统一重建
+    def _agent_vectors(self) -> Dict[str, Dict[str, float]]:
+        vectors = self._vectors
+        if vectors is None:
+            with self._lock:
+                if self._vectors is None:
+                    self._vectors = {name: self._tfidf(terms) for name, terms in self._term_counts.items()}
+                vectors = self._vectors
+        return vectors
+
+    def query(self, text: str, exclude: Optional[Iterable[str]] = None) -> List[Tuple[str, float]]:
+        exclude = set(exclude or ())
+        if self.embedder is not None:
+            query_vector = self.embedder(text)
+            with self._lock:
+                embeddings = list(self._embeddings.items())
+            scores = [(name, self._embedding_similarity(query_vector, vector))
+                      for name, vector in embeddings if name not in exclude]
+        else:
+            query_vector = self._tfidf(Counter(tokenize(text)))
+            scores = [(name, _cosine(query_vector, vector))
+                      for name, vector in self._agent_vectors().items() if name not in exclude]
+        return sorted(scores, key=lambda item: item[1], reverse=True)
+
+    @staticmethod
+    def _embedding_similarity(a: List[float], b: List[float]) -> float:
+        dot = sum(x * y for x, y in zip(a, b))
+        norm = math.sqrt(sum(x * x for x in a)) * math.sqrt(sum(y * y for y in b))
+        return dot / norm if norm else 0.0
+
+    # 置信度足够时返回 agent 名称，否则返回 None 交给 LLM 决定
+    def route(self, text: str, exclude: Optional[Iterable[str]] = None) -> Optional[str]:
+        ranked = self.query(text, exclude)
+        if ranked:
+            best_name, best_score = ranked[0]
+            runner_up = ranked[1][1] if len(ranked) > 1 else 0.0
+            if best_score >= self.threshold and best_score - runner_up >= self.margin:
+                self.stats.local_hits += 1
+                return best_name
+        self.stats.llm_fallbacks += 1
+        return None
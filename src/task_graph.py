@@ -0,0 +1,122 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+
+class TaskNode:
+    def __init__(self, node_id: str, task: str, depends_on: Optional[List[str]] = None) -> None:
+        self.id = node_id
+        self.task = task
+        self.depends_on = list(depends_on or [])
+
+    def __repr__(self) -> str:
+        return f"TaskNode(id={self.id!r}, task={self.task!r}, depends_on={self.depends_on!r})"
+
+
+class TaskGraph:
+    def __init__(self, nodes: List[TaskNode]) -> None:
+        self.nodes: Dict[str, TaskNode] = {}
+        for node in nodes:
+            if node.id in self.nodes:
+                raise ValueError(f"Duplicate subtask id: {node.id}")
+            self.nodes[node.id] = node
+        for node in self.nodes.values():
+            unknown = [dep for dep in node.depends_on if dep not in self.nodes]
+            if unknown:
+                raise ValueError(f"Subtask {node.id} depends on unknown subtasks: {unknown}")
+        self.order = self._topological_order()
+
+    @classmethod
+    def serial(cls, tasks: List[str]) -> "TaskGraph":
+        return cls([TaskNode(str(i + 1), task, [str(i)] if i else []) for i, task in enumerate(tasks)])
+
+    @classmethod
+    def parallel(cls, tasks: List[str]) -> "TaskGraph":
+        return cls([TaskNode(str(i + 1), task) for i, task in enumerate(tasks)])
+
+    def _topological_order(self) -> List[str]:
+        indegree = {node_id: len(node.depends_on) for node_id, node in self.nodes.items()}
+        ready = [node_id for node_id, degree in indegree.items() if degree == 0]
+        order = []
+        while ready:
+            node_id = ready.pop(0)
+            order.append(node_id)
+            for other in self.nodes.values():
+                if node_id in other.depends_on:
+                    indegree[other.id] -= 1
+                    if indegree[other.id] == 0:
+                        ready.append(other.id)
+        if len(order) != len(self.nodes):
+            raise ValueError("Subtask dependencies contain a cycle")
+        return order
+
+    def dependents(self, node_id: str) -> List[str]:
+        return [other.id for other in self.nodes.values() if node_id in other.depends_on]
+
+    def sinks(self) -> List[str]:
+        return [node_id for node_id in self.order if not self.dependents(node_id)]
+
+    def __len__(self) -> int:
+        return len(self.nodes)
+
+    def __repr__(self) -> str:
+        return f"TaskGraph({[self.nodes[node_id] for node_id in self.order]!r})"
+
+
+# 每行格式为 `<id> | <subtask> | <deps or none>`，兼容旧的 `task1; task2 | serial` 格式
+def parse_task_graph(response: str) -> TaskGraph:
+    lines = [line.strip() for line in response.strip().splitlines() if line.strip()]
+    nodes = []
+    for line in lines:
+        parts = [part.strip() for part in line.split("|")]
+        if len(parts) != 3:
+            continue
+        node_id, task, deps = parts
+        node_id = node_id.rstrip(".").strip()
+        if not node_id or not task:
+            continue
+        depends_on = [] if deps.lower() in ("", "none", "-") else [d.strip().rstrip(".") for d in deps.split(",") if d.strip()]
+        nodes.append(TaskNode(node_id, task, depends_on))
+    if nodes:
+        return TaskGraph(nodes)
+
+    tasks_part, mode = response.rsplit("|", 1)
+    subtasks = [s.strip() for s in tasks_part.split(";") if s.strip()]
+    if not subtasks:
+        raise ValueError("No subtasks found in breakdown response")
+    if mode.strip().lower() == "parallel":
+        return TaskGraph.parallel(subtasks)
+    return TaskGraph.serial(subtasks)
+
+
+class DagScheduler:
+    def __init__(self, max_concurrency: int = 4) -> None:
+        if max_concurrency < 1:
+            raise ValueError("max_concurrency must be at least 1")
+        self.max_concurrency = max_concurrency
+
+    async def run(self, graph: TaskGraph,
+                  runner: Callable[[TaskNode, Dict[str, Any]], Awaitable[Any]]) -> Dict[str, Any]:
+        results: Dict[str, Any] = {}
+        waiting = {node_id: set(graph.nodes[node_id].depends_on) for node_id in graph.order}
+        running: Dict[asyncio.Future, str] = {}
+        try:
+            while waiting or running:
+                ready = [node_id for node_id, deps in waiting.items() if not deps]
+                for node_id in ready:
+                    if len(running) >= self.max_concurrency:
+                        break
+                    del waiting[node_id]
+                    node = graph.nodes[node_id]
+                    upstream = {dep: results[dep] for dep in node.depends_on}
+                    running[asyncio.ensure_future(runner(node, upstream))] = node_id
+                done, _ = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+                for future in done:
+                    node_id = running.pop(future)
+                    results[node_id] = future.result()
+                    for deps in waiting.values():
+                        deps.discard(node_id)
+        except BaseException:
+            for future in running:
+                future.cancel()
+            raise
+        return results
@@ -0,0 +1,227 @@
+import contextvars
+import itertools
+import json
+import os
+import threading
+import time
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional
+
+from metrics import LatencyHistogram, StageMetrics, get_stage_metrics
+
+_span_ids = itertools.count(1)
+_span_prefix = f"{os.getpid():x}"
+_current_span: contextvars.ContextVar[Optional["Span"]] = contextvars.ContextVar("current_span", default=None)
+
+
+class Span:
+    __slots__ = ("name", "correlation_id", "span_id", "parent_id", "start_ns", "end_ns", "attributes", "status")
+
+    def __init__(self, name: str, correlation_id: Optional[str], parent: Optional["Span"],
+                 attributes: Dict[str, Any]) -> None:
+        self.name = name
+        self.correlation_id = correlation_id if correlation_id is not None or parent is None else parent.correlation_id
+        self.span_id = f"{_span_prefix}-{next(_span_ids)}"
+        self.parent_id = parent.span_id if parent is not None else None
+        self.start_ns = time.time_ns()
+        self.end_ns: Optional[int] = None
+        self.attributes = attributes
+        self.status = "ok"
+
+    def set(self, key: str, value: Any) -> None:
+        self.attributes[key] = value
+
+    @property
+    def duration(self) -> float:
+        return ((self.end_ns or time.time_ns()) - self.start_ns) / 1e9
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "correlation_id": self.correlation_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "start_ns": self.start_ns,
+            "end_ns": self.end_ns,
+            "duration": self.duration,
+            "status": self.status,
+            "attributes": self.attributes,
+        }
+
+
+class _NoopSpan:
+    def set(self, key: str, value: Any) -> None:
+        pass
+
+    def __enter__(self) -> "_NoopSpan":
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        return None
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+# 关闭追踪时的阶段计时：只记录阶段耗时，返回空 span 以便调用方照常 set 属性
+class _StageTimer:
+    __slots__ = ("stage_metrics", "name", "started")
+
+    def __init__(self, stage_metrics: StageMetrics, name: str) -> None:
+        self.stage_metrics = stage_metrics
+        self.name = name
+
+    def __enter__(self) -> _NoopSpan:
+        self.started = time.perf_counter()
+        return _NOOP_SPAN
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.stage_metrics.record(self.name, time.perf_counter() - self.started)
+
+
+class _SpanScope:
+    __slots__ = ("tracer", "name", "correlation_id", "attributes", "stage", "span", "token")
+
+    def __init__(self, tracer: "Tracer", name: str, correlation_id: Optional[str], attributes: Dict[str, Any],
+                 stage: bool) -> None:
+        self.tracer = tracer
+        self.name = name
+        self.correlation_id = correlation_id
+        self.attributes = attributes
+        self.stage = stage
+
+    def __enter__(self) -> Span:
+        self.span = Span(self.name, self.correlation_id, _current_span.get(), self.attributes)
+        self.token = _current_span.set(self.span)
+        return self.span
+
+    def __exit__(self, exc_type: Any, exc: Any, traceback: Any) -> None:
+        span = self.span
+        span.end_ns = time.time_ns()
+        if exc_type is not None:
+            span.status = "cancelled" if exc_type.__name__ == "CancelledError" else "error"
+            span.attributes["error"] = f"{exc_type.__name__}: {exc}"
+        _current_span.reset(self.token)
+        self.tracer.finish(span, self.stage)
+
+
+class InMemoryExporter:
+    def __init__(self, max_spans: int = 100000) -> None:
+        self.spans: Deque[Dict[str, Any]] = deque(maxlen=max_spans)
+
+    def export(self, span: Dict[str, Any]) -> None:
+        self.spans.append(span)
+
+    def for_correlation(self, correlation_id: str) -> List[Dict[str, Any]]:
+        return [span for span in self.spans if span["correlation_id"] == correlation_id]
+
+    def close(self) -> None:
+        pass
+
+
+class JsonLinesExporter:
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._file = open(path, "a", encoding="utf-8")
+        self._lock = threading.Lock()
+
+    def export(self, span: Dict[str, Any]) -> None:
+        line = json.dumps(span, default=str, separators=(",", ":"))
+        with self._lock:
+            self._file.write(line + "\n")
+
+    def close(self) -> None:
+        with self._lock:
+            self._file.close()
+
+
+# 关闭时 span/count/observe/gauge 只做一次布尔判断；阶段耗时（StageMetrics）无论开关都会记录
+class Tracer:
+    def __init__(self, enabled: bool = False, exporter: Any = None,
+                 stage_metrics: Optional[StageMetrics] = None) -> None:
+        self.enabled = enabled
+        self.exporter = exporter if exporter is not None else InMemoryExporter()
+        self.stage_metrics = stage_metrics if stage_metrics is not None else get_stage_metrics()
+        self.counters: Dict[str, float] = {}
+        self.histograms: Dict[str, LatencyHistogram] = {}
+        self.gauges: Dict[str, Dict[str, float]] = {}
+        self._lock = threading.Lock()
+
+    def span(self, name: str, correlation_id: Optional[str] = None, **attributes: Any):
+        if not self.enabled:
+            return _NOOP_SPAN
+        return _SpanScope(self, name, correlation_id, attributes, False)
+
+    # 编排阶段（breakdown/routing/execution/evaluation）：始终计入阶段耗时，开启时同时产生 span
+    def stage(self, name: str, correlation_id: Optional[str] = None, **attributes: Any):
+        if not self.enabled:
+            return _StageTimer(self.stage_metrics, name)
+        return _SpanScope(self, name, correlation_id, attributes, True)
+
+    # 不对应一段代码块的阶段耗时（例如首个输出的耗时 ttft），与 stage() 一样始终计入阶段耗时
+    def record_stage(self, name: str, seconds: float) -> None:
+        self.stage_metrics.record(name, seconds)
+        self.observe(f"stage.{name}", seconds)
+
+    def finish(self, span: Span, stage: bool) -> None:
+        if stage:
+            self.stage_metrics.record(span.name, span.duration)
+        self.observe(f"span.{span.name}", span.duration)
+        self.exporter.export(span.to_dict())
+
+    def count(self, name: str, value: float = 1) -> None:
+        if not self.enabled:
+            return
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def observe(self, name: str, value: float) -> None:
+        if not self.enabled:
+            return
+        with self._lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = LatencyHistogram()
+            histogram.add(value)
+
+    def gauge(self, name: str, value: float) -> None:
+        if not self.enabled:
+            return
+        with self._lock:
+            gauge = self.gauges.get(name)
+            if gauge is None:
+                self.gauges[name] = {"last": value, "max": value}
+            else:
+                gauge["last"] = value
+                gauge["max"] = max(gauge["max"], value)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "counters": dict(self.counters),
+                "histograms": {name: histogram.summary() for name, histogram in self.histograms.items()},
+                "gauges": {name: dict(gauge) for name, gauge in self.gauges.items()},
+            }
+
+    def close(self) -> None:
+        self.exporter.close()
+
+
+_tracer: Optional[Tracer] = None
+
+
+def configure_tracing(enabled: bool = True, exporter: Any = None, path: Optional[str] = None) -> Tracer:
+    global _tracer
+    if _tracer is not None:
+        _tracer.close()
+    if exporter is None and path is not None:
+        exporter = JsonLinesExporter(path)
+    _tracer = Tracer(enabled=enabled, exporter=exporter)
+    return _tracer
+
+
+def get_tracer() -> Tracer:
+    global _tracer
+    if _tracer is None:
+        _tracer = Tracer(enabled=os.environ.get("AGENT_TRACING", "") not in ("", "0"))
+    return _tracer
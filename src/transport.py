@@ -0,0 +1,161 @@
+import asyncio
+import itertools
+import json
+import struct
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from message import (
+    AgentResultChunkMessage,
+    AgentResultMessage,
+    AgentTaskMessage,
+    BaseMessage,
+    ErrorNotificationMessage,
+    EvaluationResultMessage,
+    UserRequestMessage,
+)
+
+MESSAGE_TYPES = {cls.__name__: cls for cls in (UserRequestMessage, AgentTaskMessage, AgentResultMessage, AgentResultChunkMessage,
+                                               EvaluationResultMessage, ErrorNotificationMessage)}
+_FRAME_HEADER = struct.Struct(">I")
+MAX_FRAME_BYTES = 64 * 1024 * 1024
+
+
+class RemoteError(RuntimeError):
+    pass
+
+
+def encode_message(message: BaseMessage) -> Dict[str, Any]:
+    return {"type": type(message).__name__, "header": dict(message.header.__dict__),
+            "payload": message.payload, "metadata": message.metadata}
+
+
+# 帧只来自本机 Unix socket 上的本系统进程，按受信任的内部消息重建，不再走 pydantic 校验
+def decode_message(data: Dict[str, Any]) -> BaseMessage:
+    cls = MESSAGE_TYPES.get(data["type"])
+    if cls is None:
+        raise ValueError(f"Unknown message type: {data['type']}")
+    return cls.restore(data["header"], data["payload"], data.get("metadata"))
+
+
+async def read_frame(reader: asyncio.StreamReader) -> Optional[Dict[str, Any]]:
+    try:
+        size, = _FRAME_HEADER.unpack(await reader.readexactly(_FRAME_HEADER.size))
+        if size > MAX_FRAME_BYTES:
+            raise ValueError(f"Frame of {size} bytes exceeds the {MAX_FRAME_BYTES} byte limit")
+        return json.loads(await reader.readexactly(size))
+    except (asyncio.IncompleteReadError, ConnectionResetError):
+        return None
+
+
+def write_frame(writer: asyncio.StreamWriter, frame: Dict[str, Any]) -> None:
+    body = json.dumps(frame, separators=(",", ":")).encode("utf-8")
+    writer.write(_FRAME_HEADER.pack(len(body)) + body)
+
+
+# 每个进程到 broker 只有一条连接：发出的请求按 id 复用，broker 投递来的消息交给 on_deliver 处理并回复
+class BrokerClient:
+    def __init__(self, path: str, worker_id: str,
+                 on_deliver: Optional[Callable[[str, str, BaseMessage], Awaitable[BaseMessage]]] = None,
+                 on_registry: Optional[Callable[[int, Dict[str, Dict[str, Any]]], Awaitable[None]]] = None) -> None:
+        self.path = path
+        self.worker_id = worker_id
+        self.on_deliver = on_deliver
+        self.on_registry = on_registry
+        self.registry: Dict[str, Dict[str, Any]] = {}
+        self.registry_version = 0
+        self._ids = itertools.count(1)
+        self._pending: Dict[int, asyncio.Future] = {}
+        self._reader: Optional[asyncio.StreamReader] = None
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._read_task: Optional[asyncio.Task] = None
+        self._handlers: set = set()
+        self._registry_changed: Optional[asyncio.Event] = None
+
+    async def connect(self, retries: int = 50, delay: float = 0.1) -> None:
+        for attempt in range(retries):
+            try:
+                self._reader, self._writer = await asyncio.open_unix_connection(self.path)
+                break
+            except (FileNotFoundError, ConnectionRefusedError):
+                if attempt == retries - 1:
+                    raise
+                await asyncio.sleep(delay)
+        self._registry_changed = asyncio.Event()
+        self._read_task = asyncio.create_task(self._read_loop())
+
+    async def hello(self, agents: Dict[str, Dict[str, Any]]) -> None:
+        write_frame(self._writer, {"op": "hello", "worker_id": self.worker_id, "agents": agents})
+        await self._writer.drain()
+
+    async def send(self, agent_type: str, key: str, message: BaseMessage) -> BaseMessage:
+        request_id = next(self._ids)
+        future = asyncio.get_running_loop().create_future()
+        self._pending[request_id] = future
+        write_frame(self._writer, {"op": "send", "id": request_id, "agent_type": agent_type, "key": key,
+                                   "message": encode_message(message)})
+        try:
+            await self._writer.drain()
+            return await future
+        finally:
+            self._pending.pop(request_id, None)
+
+    async def wait_for_agents(self, names: List[str], timeout: float = 30.0) -> None:
+        async def wait() -> None:
+            while not all(name in self.registry for name in names):
+                self._registry_changed.clear()
+                await self._registry_changed.wait()
+        await asyncio.wait_for(wait(), timeout)
+
+    async def closed(self) -> None:
+        if self._read_task is not None:
+            await asyncio.shield(self._read_task)
+
+    async def _handle_deliver(self, frame: Dict[str, Any]) -> None:
+        try:
+            reply = await self.on_deliver(frame["agent_type"], frame["key"], decode_message(frame["message"]))
+            response = {"op": "reply", "id": frame["id"], "message": encode_message(reply)}
+        except Exception as e:
+            response = {"op": "error", "id": frame["id"], "error": f"{type(e).__name__}: {e}"}
+        if self._writer is not None and not self._writer.is_closing():
+            write_frame(self._writer, response)
+            await self._writer.drain()
+
+    async def _read_loop(self) -> None:
+        try:
+            while True:
+                frame = await read_frame(self._reader)
+                if frame is None:
+                    break
+                op = frame["op"]
+                if op == "deliver":
+                    task = asyncio.create_task(self._handle_deliver(frame))
+                    self._handlers.add(task)
+                    task.add_done_callback(self._handlers.discard)
+                elif op in ("reply", "error"):
+                    future = self._pending.get(frame["id"])
+                    if future is None or future.done():
+                        continue
+                    if op == "reply":
+                        future.set_result(decode_message(frame["message"]))
+                    else:
+                        future.set_exception(RemoteError(frame["error"]))
+                elif op == "registry":
+                    self.registry = frame["agents"]
+                    self.registry_version = frame["version"]
+                    if self.on_registry is not None:
+                        await self.on_registry(self.registry_version, self.registry)
+                    self._registry_changed.set()
+        finally:
+            for future in self._pending.values():
+                if not future.done():
+                    future.set_exception(RemoteError("Connection to broker closed"))
+
+    async def close(self) -> None:
+        if self._writer is not None:
+            self._writer.close()
+            try:
+                await self._writer.wait_closed()
+            except (ConnectionResetError, BrokenPipeError):
+                pass
+        if self._read_task is not None:
+            await asyncio.gather(self._read_task, return_exceptions=True)
@@ -0,0 +1,141 @@
+import asyncio
+import multiprocessing
+import os
+from typing import TYPE_CHECKING, Any, Awaitable, Callable, Dict, List, Optional, Sequence
+
+from autogen_core import AgentId, SingleThreadedAgentRuntime
+from autogen_core import BaseAgent as RuntimeAgent
+
+from base_agent import BaseAgent
+from context_store import ContextStore, get_default_context_store
+from executor import AgentExecutor
+from llm_client import get_default_dispatcher
+from message import AgentResultMessage, AgentTaskMessage, BaseMessage
+from transport import BrokerClient, RemoteError
+
+if TYPE_CHECKING:
+    from agent_core.agents import Agent
+
+
+# 编排进程内代表远端 agent 类型的占位 agent：把上下文引用展开成内联切片后经 broker 转发，并把回复原样返回
+class RemoteAgentProxy(RuntimeAgent):
+    def __init__(self, agent_type: str, client: BrokerClient, context_store: ContextStore) -> None:
+        super().__init__(f"Remote agent {agent_type}")
+        self.agent_type = agent_type
+        self.client = client
+        self.context_store = context_store
+
+    async def on_message_impl(self, message: Any, ctx) -> Any:
+        if isinstance(message, AgentTaskMessage) and message.payload.get("context_ref") is not None:
+            # 上下文存储只存在于编排进程中，远端 worker 只能拿到它声明需要的切片
+            needs = self.client.registry.get(self.agent_type, {}).get("context_needs") or BaseAgent.context_needs
+            payload = dict(message.payload)
+            payload["context"] = self.context_store.load_slices(payload.pop("context_ref"), needs)
+            message = AgentTaskMessage.build(payload, sender=message.header.sender, recipient=message.header.recipient,
+                                             message_type=message.header.message_type,
+                                             correlation_id=message.header.correlation_id, trusted=True)
+        try:
+            return await self.client.send(self.agent_type, self.id.key, message)
+        except RemoteError as e:
+            if not isinstance(message, AgentTaskMessage):
+                raise
+            return AgentResultMessage.create(sender=self.agent_type, correlation_id=message.header.correlation_id,
+                                             result=f"Execution error: {e}", success=False, trusted=True)
+
+    async def save_state(self) -> Dict[str, Any]:
+        return {}
+
+    async def load_state(self, state: Dict[str, Any]) -> None:
+        pass
+
+
+# 独立进程中托管一组 agent 类型，通过 broker 接收任务；同一类型可以由多个 worker 同时托管。
+# 这里只把 agent 的执行卸载到其他进程：编排者、评估器、LLM 调度器和上下文存储仍在控制进程中，每一跳都经过同一个 broker，
+# 增加 worker 只能分担 agent 自身的 CPU 工作，整体吞吐的上限由控制进程和 broker 决定
+class AgentWorker:
+    def __init__(self, broker_path: str, worker_id: Optional[str] = None) -> None:
+        self.worker_id = worker_id if worker_id is not None else f"worker-{os.getpid()}"
+        self.runtime = SingleThreadedAgentRuntime()
+        self.client = BrokerClient(broker_path, self.worker_id, on_deliver=self._deliver)
+        self.agents: Dict[str, Dict[str, Any]] = {}
+        self.executors: Dict[str, AgentExecutor] = {}
+
+    # 传入 agent_factory 时 agent 和执行器在第一次收到任务时才创建，worker 可以先向 broker 报到
+    async def register_agent(self, agent_name: str, description: str, topic: Optional[str],
+                             source_agent: Optional["Agent"] = None, execution_backend: str = "auto",
+                             max_concurrency: int = 4, agent_factory: Optional[Callable[[], "Agent"]] = None) -> None:
+        if source_agent is None and agent_factory is None:
+            raise ValueError("register_agent requires source_agent or agent_factory")
+        store = get_default_context_store()
+
+        def factory() -> BaseAgent:
+            executor = self.executors.get(agent_name)
+            if executor is None:
+                agent = source_agent if source_agent is not None else agent_factory()
+                executor = self.executors[agent_name] = AgentExecutor(agent, backend=execution_backend,
+                                                                      max_concurrency=max_concurrency, name=agent_name)
+            return BaseAgent(agent_name, description, topic, executor.agent, executor, store)
+
+        await BaseAgent.register(self.runtime, type=agent_name, factory=factory)
+        self.agents[agent_name] = {"description": description, "topic": topic,
+                                   "context_needs": list(BaseAgent.context_needs)}
+
+    async def _deliver(self, agent_type: str, key: str, message: BaseMessage) -> BaseMessage:
+        return await self.runtime.send_message(message, AgentId(type=agent_type, key=key))
+
+    async def start(self) -> None:
+        self.runtime.start()
+        get_default_dispatcher().start()
+        await self.client.connect()
+        await self.client.hello(self.agents)
+
+    async def serve_until_closed(self) -> None:
+        await self.client.closed()
+
+    async def stop(self) -> None:
+        await self.client.close()
+        await self.runtime.stop_when_idle()
+        for executor in self.executors.values():
+            executor.shutdown()
+        await get_default_dispatcher().close()
+
+
+WorkerSetup = Callable[[AgentWorker], Awaitable[None]]
+
+
+async def _serve_worker(broker_path: str, setup: WorkerSetup, worker_id: Optional[str]) -> None:
+    worker = AgentWorker(broker_path, worker_id)
+    await setup(worker)
+    await worker.start()
+    try:
+        await worker.serve_until_closed()
+    finally:
+        await worker.stop()
+
+
+# 子进程入口：setup 必须是模块级的 async 函数，在 worker 中完成 agent 注册
+def run_worker(broker_path: str, setup: WorkerSetup, worker_id: Optional[str] = None) -> None:
+    try:
+        asyncio.run(_serve_worker(broker_path, setup, worker_id))
+    except KeyboardInterrupt:
+        pass
+
+
+def start_worker_processes(broker_path: str, setup: WorkerSetup, count: int,
+                           name: str = "agent-worker") -> List[multiprocessing.Process]:
+    context = multiprocessing.get_context("spawn")
+    processes = []
+    for index in range(count):
+        worker_id = f"{name}-{index}"
+        process = context.Process(target=run_worker, args=(broker_path, setup, worker_id), daemon=True, name=worker_id)
+        process.start()
+        processes.append(process)
+    return processes
+
+
+def stop_processes(processes: Sequence[multiprocessing.Process], timeout: float = 5.0) -> None:
+    for process in processes:
+        if process.is_alive():
+            process.terminate()
+    for process in processes:
+        process.join(timeout)
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# 模块之间按 src 目录下的顶层模块名互相导入
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
@@ -0,0 +1,133 @@
+import asyncio
+import time
+
+import pytest
+from autogen_core import AgentId, AgentInstantiationContext, SingleThreadedAgentRuntime
+
+from admission import AdmissionController, AdmissionRejected
+from message import UserRequestMessage
+from orchestrator import Orchestrator
+
+
+def test_queue_policy_admits_waiter_on_release():
+    async def scenario():
+        admission = AdmissionController(max_in_flight=1, max_queue=4, policy="queue")
+        assert await admission.acquire("a") == 0.0
+        waiter = asyncio.ensure_future(admission.acquire("b"))
+        await asyncio.sleep(0)
+        assert admission.queue_depth == 1 and not waiter.done()
+        admission.release("a")
+        assert await asyncio.wait_for(waiter, 1) >= 0.0
+        assert admission.snapshot()["in_flight"] == 1
+        assert admission.stats.queued == 1 and admission.stats.rejected == 0
+
+    asyncio.run(scenario())
+
+
+def test_queue_policy_rejects_when_queue_is_full():
+    async def scenario():
+        admission = AdmissionController(max_in_flight=1, max_queue=1, policy="queue")
+        await admission.acquire("a")
+        waiter = asyncio.ensure_future(admission.acquire("b"))
+        await asyncio.sleep(0)
+        with pytest.raises(AdmissionRejected):
+            await admission.acquire("c")
+        admission.release("a")
+        await waiter
+        assert admission.stats.rejected == 1
+
+    asyncio.run(scenario())
+
+
+def test_shed_policy_rejects_instead_of_queueing():
+    async def scenario():
+        admission = AdmissionController(max_in_flight=1, policy="shed")
+        await admission.acquire("a")
+        with pytest.raises(AdmissionRejected):
+            await admission.acquire("b")
+        assert admission.queue_depth == 0
+        assert admission.stats.queued == 0 and admission.stats.rejected == 1
+        admission.release("a")
+        await admission.acquire("b")
+
+    asyncio.run(scenario())
+
+
+def test_deadline_expires_while_queued():
+    async def scenario():
+        admission = AdmissionController(max_in_flight=1, policy="queue")
+        await admission.acquire("a")
+        with pytest.raises(AdmissionRejected):
+            await admission.acquire("b", deadline=time.time() + 0.01)
+        assert admission.queue_depth == 0
+        assert admission.stats.expired == 1
+        # 过期的等待者不能在之后占用名额
+        admission.release("a")
+        assert admission.in_flight == 0
+
+    asyncio.run(scenario())
+
+
+def test_slot_is_handed_on_when_admitted_waiter_is_cancelled():
+    async def scenario():
+        admission = AdmissionController(max_in_flight=1, policy="queue")
+        await admission.acquire("a")
+        first = asyncio.ensure_future(admission.acquire("b"))
+        second = asyncio.ensure_future(admission.acquire("c"))
+        await asyncio.sleep(0)
+        # b 已经分到名额，但在恢复执行之前被取消
+        admission.release("a")
+        first.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await first
+        await asyncio.wait_for(second, 1)
+        assert admission.snapshot()["in_flight"] == 1
+        admission.release("c")
+        assert admission.in_flight == 0 and admission.queue_depth == 0
+
+    asyncio.run(scenario())
+
+
+def _make_orchestrator(runtime, **kwargs) -> Orchestrator:
+    with AgentInstantiationContext.populate_context((runtime, AgentId("Orchestrator", "default"))):
+        return Orchestrator(**kwargs)
+
+
+def test_duplicate_correlation_id_is_rejected():
+    async def scenario():
+        admission = AdmissionController(max_in_flight=1, policy="queue")
+        rejected = []
+        orchestrator = _make_orchestrator(SingleThreadedAgentRuntime(), admission=admission,
+                                          on_reject=lambda correlation_id, reason: rejected.append(correlation_id))
+        await admission.acquire("busy")
+        request = UserRequestMessage.create(sender="User", request_content="task", correlation_id="dup")
+        queued = asyncio.ensure_future(orchestrator.handle_user_request(request, None))
+        await asyncio.sleep(0)
+        assert "dup" in orchestrator.admitting and admission.queue_depth == 1
+
+        # 等待准入期间和执行期间，相同 correlation id 的请求都直接丢弃，不排队也不通知 on_reject
+        await orchestrator.handle_user_request(request, None)
+        assert admission.queue_depth == 1 and admission.stats.queued == 1
+        orchestrator.active.add("running")
+        running = UserRequestMessage.create(sender="User", request_content="task", correlation_id="running")
+        await orchestrator.handle_user_request(running, None)
+        assert admission.stats.queued == 1
+        assert rejected == []
+
+        queued.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await queued
+        assert "dup" not in orchestrator.admitting
+
+    asyncio.run(scenario())
+
+
+def test_published_retry_is_dropped():
+    async def scenario():
+        admission = AdmissionController(max_in_flight=1)
+        orchestrator = _make_orchestrator(SingleThreadedAgentRuntime(), admission=admission)
+        retry = UserRequestMessage.create(sender="User", request_content="task", correlation_id="r", retry=True)
+        await orchestrator.handle_user_request(retry, None)
+        assert admission.stats.admitted == 0 and "r" not in orchestrator.active
+
+    asyncio.run(scenario())
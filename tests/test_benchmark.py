@@ -0,0 +1,47 @@
+import asyncio
+
+import benchmark
+
+
+def test_benchmark_smoke():
+    args = benchmark.build_parser().parse_args(["--requests", "5", "--llm-latency", "constant:0",
+                                                "--agent-latency", "constant:0"])
+    report = asyncio.run(benchmark.run_benchmark(args))
+    assert report["outcomes"] == {"completed": 5, "failed": 0, "rejected": 0}
+    assert report["end_to_end"]["max"] > 0
+    assert report["llm_calls"]
+
+
+def test_benchmark_main_exit_code(capsys):
+    assert benchmark.main(["--requests", "5", "--llm-latency", "constant:0", "--agent-latency", "constant:0"]) == 0
+    assert "outcomes" in capsys.readouterr().out
+
+
+def test_benchmark_pooled_agents():
+    args = benchmark.build_parser().parse_args(["--requests", "5", "--llm-latency", "constant:0",
+                                                "--agent-latency", "constant:0", "--pool-size", "3"])
+    report = asyncio.run(benchmark.run_benchmark(args))
+    assert report["outcomes"] == {"completed": 5, "failed": 0, "rejected": 0}
+
+
+def test_benchmark_worker_processes():
+    args = benchmark.build_parser().parse_args(["--requests", "5", "--llm-latency", "constant:0",
+                                                "--agent-latency", "constant:0", "--workers", "1"])
+    report = asyncio.run(benchmark.run_benchmark(args))
+    assert report["outcomes"] == {"completed": 5, "failed": 0, "rejected": 0}
+
+
+def test_benchmark_streaming():
+    args = benchmark.build_parser().parse_args(["--requests", "5", "--llm-latency", "constant:0",
+                                                "--agent-latency", "constant:0", "--stream", "--async-agents"])
+    report = asyncio.run(benchmark.run_benchmark(args))
+    assert report["outcomes"] == {"completed": 5, "failed": 0, "rejected": 0}
+    assert report["stages"]["ttft"]["count"] == 5
+
+
+def test_benchmark_speculative_batched_evaluation():
+    args = benchmark.build_parser().parse_args(["--requests", "5", "--llm-latency", "constant:0",
+                                                "--agent-latency", "constant:0", "--speculative", "--cache",
+                                                "--eval-batch-size", "4"])
+    report = asyncio.run(benchmark.run_benchmark(args))
+    assert report["outcomes"] == {"completed": 5, "failed": 0, "rejected": 0}
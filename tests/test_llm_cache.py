@@ -0,0 +1,93 @@
+import asyncio
+import os
+
+from llm_cache import LLMCache, make_cache_key
+
+
+def test_key_ignores_whitespace_but_not_call_type():
+    assert make_cache_key("select_agent", "pick  an\nagent ") == make_cache_key("select_agent", "pick an agent")
+    assert make_cache_key("select_agent", "pick an agent") != make_cache_key("breakdown_task", "pick an agent")
+
+
+def test_memory_tier_hits_and_misses():
+    cache = LLMCache()
+    assert cache.get("select_agent", "prompt") is None
+    cache.put("select_agent", "prompt", "DevAgent")
+    assert cache.get("select_agent", "prompt") == "DevAgent"
+    stats = cache.stats.snapshot()
+    assert (stats["memory_hits"], stats["misses"], stats["stores"]) == (1, 1, 1)
+    assert stats["hit_rate"] == 0.5
+
+
+def test_memory_tier_evicts_least_recently_used():
+    cache = LLMCache(memory_entries=2)
+    cache.put("t", "a", "1")
+    cache.put("t", "b", "2")
+    assert cache.get("t", "a") == "1"
+    cache.put("t", "c", "3")
+    assert cache.get("t", "b") is None
+    assert cache.get("t", "a") == "1" and cache.get("t", "c") == "3"
+    assert cache.stats.evictions == 1
+
+
+def test_expired_entries_are_not_returned(monkeypatch):
+    cache = LLMCache(ttl=10)
+    now = 1000.0
+    monkeypatch.setattr("llm_cache.time.time", lambda: now)
+    cache.put("t", "prompt", "response")
+    now += 11
+    assert cache.get("t", "prompt") is None
+
+
+def test_disabled_call_types_bypass_the_cache():
+    cache = LLMCache(disabled_call_types=("evaluate_result",))
+    cache.put("evaluate_result", "prompt", "True")
+    assert cache.get("evaluate_result", "prompt") is None
+    assert cache.stats.snapshot()["stores"] == 0 and cache.stats.misses == 0
+
+
+def test_disk_tier_is_shared_between_instances(tmp_path):
+    path = str(tmp_path / "cache" / "llm.sqlite")
+    writer = LLMCache(path=path)
+    writer.put("select_agent", "prompt", "DevAgent")
+    writer.close()
+
+    reader = LLMCache(path=path)
+    assert reader.get("select_agent", "prompt") == "DevAgent"
+    assert reader.stats.disk_hits == 1
+    # 磁盘命中后提升到内存层
+    assert reader.get("select_agent", "prompt") == "DevAgent"
+    assert reader.stats.memory_hits == 1
+    reader.clear()
+    assert LLMCache(path=path).get("select_agent", "prompt") is None
+    reader.close()
+
+
+def test_disk_tier_evicts_least_recently_accessed_over_budget(tmp_path):
+    path = str(tmp_path / "llm.sqlite")
+    cache = LLMCache(path=path, memory_entries=1, max_disk_bytes=100 * 10)
+    for i in range(40):
+        cache.put("t", f"prompt {i}", "x" * 100)
+    rows = cache._db().execute("SELECT COUNT(*), SUM(size) FROM llm_cache").fetchone()
+    # 每 32 次写入检查一次预算：第 32 次写入后裁剪到 10 条，之后又写入 8 条
+    assert rows == (18, 1800)
+    assert cache.stats.evictions > 0
+    assert cache.get("t", "prompt 0") is None
+    cache.close()
+    assert os.path.exists(path)
+
+
+def test_async_path_uses_both_tiers(tmp_path):
+    path = str(tmp_path / "llm.sqlite")
+
+    async def scenario():
+        cache = LLMCache(path=path)
+        assert await cache.aget("t", "prompt") is None
+        await cache.aput("t", "prompt", "response")
+        cache.close()
+        fresh = LLMCache(path=path)
+        assert await fresh.aget("t", "prompt") == "response"
+        assert fresh.stats.disk_hits == 1
+        fresh.close()
+
+    asyncio.run(scenario())
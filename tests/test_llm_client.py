@@ -0,0 +1,31 @@
+from llm_client import LLMClient
+from prompt_builder import PromptBuilder
+
+
+def _words(text: str) -> int:
+    return len(text.split())
+
+
+def test_template_overhead_matches_the_template_text():
+    builder = PromptBuilder(budgets={}, token_counter=len)
+    client = LLMClient(prompt_builder=builder)
+    client._evaluate_result_prompt("write a sorting function", "def sort(items): return sorted(items)")
+    assert builder.stats.snapshot()["call_types"]["evaluate_result"]["tokens_saved"] == 0
+    client._evaluate_results_prompt([("write code", "done"), ("write docs", "the docs are written")])
+    assert builder.stats.snapshot()["call_types"]["evaluate_result"]["tokens_saved"] == 0
+
+
+def test_template_tokens_follow_the_builder_counter():
+    counted = []
+
+    def counter(text: str) -> int:
+        counted.append(text)
+        return _words(text)
+
+    client = LLMClient(prompt_builder=PromptBuilder(token_counter=counter))
+    template = client._breakdown_instructions("", "")
+    assert client._template_tokens("breakdown_task", template) == _words(template)
+    assert client._template_tokens("breakdown_task", template) == _words(template)
+    assert counted.count(template) == 1
+    client._prompt_builder = PromptBuilder(token_counter=lambda text: len(text))
+    assert client._template_tokens("breakdown_task", template) == len(template)
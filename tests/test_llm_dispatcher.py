@@ -0,0 +1,67 @@
+import asyncio
+import threading
+
+import pytest
+
+from llm_dispatcher import LLMDispatcher
+
+
+def test_coalesces_identical_calls():
+    calls = []
+
+    def process(prompt):
+        calls.append(prompt)
+        return prompt.upper()
+
+    async def scenario():
+        dispatcher = LLMDispatcher(process, max_workers=2)
+        results = await asyncio.gather(*(dispatcher.submit("same", call_type="select_agent") for _ in range(3)))
+        await dispatcher.close()
+        return results, dispatcher.stats.snapshot()
+
+    results, stats = asyncio.run(scenario())
+    assert results == ["SAME"] * 3 and calls == ["same"]
+    assert stats["coalesced"] == 2
+
+
+def test_rejects_a_second_live_event_loop():
+    dispatcher = LLMDispatcher(lambda prompt: prompt, max_workers=1)
+    first = asyncio.new_event_loop()
+    try:
+        assert first.run_until_complete(dispatcher.submit("a")) == "a"
+        with pytest.raises(RuntimeError, match="another event loop"):
+            asyncio.run(dispatcher.submit("b"))
+        first.run_until_complete(dispatcher.close())
+    finally:
+        first.close()
+    # close() 之后可以绑定到新的事件循环
+    assert asyncio.run(dispatcher.submit("c")) == "c"
+
+
+def test_rebinds_after_the_previous_loop_was_closed():
+    dispatcher = LLMDispatcher(lambda prompt: prompt, max_workers=1)
+    assert asyncio.run(dispatcher.submit("a")) == "a"
+    assert asyncio.run(dispatcher.submit("b")) == "b"
+    assert dispatcher.stats.queue_depth == 0
+
+
+def test_close_cancels_queued_calls():
+    release = threading.Event()
+
+    def process(prompt):
+        release.wait(5)
+        return prompt
+
+    async def scenario():
+        dispatcher = LLMDispatcher(process, max_workers=1)
+        running = asyncio.ensure_future(dispatcher.submit("running"))
+        queued = asyncio.ensure_future(dispatcher.submit("queued"))
+        await asyncio.sleep(0.05)
+        assert dispatcher.stats.queue_depth == 1
+        await dispatcher.close()
+        release.set()
+        results = await asyncio.wait_for(asyncio.gather(running, queued, return_exceptions=True), 1)
+        assert all(isinstance(result, asyncio.CancelledError) for result in results)
+        assert dispatcher.stats.queue_depth == 0 and dispatcher.stats.cancelled == 1
+
+    asyncio.run(scenario())
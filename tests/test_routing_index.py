@@ -0,0 +1,70 @@
+from routing_index import RoutingIndex, tokenize
+
+AGENTS = {
+    "DevAgent": "DevAgent generates the code implementation for the software system.",
+    "ReviewAgent": "ReviewAgent specialized in code review.",
+    "TestAgent": "TestAgent creates unit tests for the software system.",
+    "DocAgent": "DocAgent produces clear documentation for the software system.",
+}
+
+
+def make_index(**kwargs) -> RoutingIndex:
+    index = RoutingIndex(**kwargs)
+    for name, description in AGENTS.items():
+        index.add(name, description)
+    return index
+
+
+def test_tokenize_splits_camel_case_and_drops_stop_words():
+    assert tokenize("ReviewAgent reviews the code") == ["review", "review", "code"]
+    assert tokenize("Writing unit tests") == ["writ", "unit", "test"]
+
+
+def test_confident_match_is_routed_locally():
+    index = make_index()
+    assert index.route("Write unit tests for the login module") == "TestAgent"
+    assert index.route("Perform a code review of the sorting algorithm") == "ReviewAgent"
+    assert index.stats.snapshot() == {"local_hits": 2, "llm_fallbacks": 0, "hit_rate": 1.0}
+
+
+def test_unrelated_or_ambiguous_task_falls_back_to_llm():
+    index = make_index()
+    assert index.route("Book a flight to Paris") is None
+    # margin 大于任何可能的分差时，即使得分过了阈值也要交给 LLM
+    strict = make_index(margin=1.0)
+    assert strict.route("Write unit tests for the login module") is None
+    assert index.stats.llm_fallbacks == 1 and strict.stats.llm_fallbacks == 1
+
+
+def test_exclude_skips_agents():
+    index = make_index()
+    ranked = index.query("Write unit tests", exclude=["TestAgent"])
+    assert "TestAgent" not in [name for name, _ in ranked]
+    assert len(ranked) == len(AGENTS) - 1
+
+
+def test_add_replaces_and_remove_drops_agent():
+    index = make_index()
+    assert dict(index.query("unit"))["TestAgent"] > 0
+    index.add("TestAgent", "TestAgent translates documents into French.")
+    assert dict(index.query("unit"))["TestAgent"] == 0
+    assert index.route("Translate the README into French") == "TestAgent"
+    assert len(index) == len(AGENTS)
+    index.remove("DocAgent")
+    assert "DocAgent" not in index
+    assert all(name != "DocAgent" for name, _ in index.query("documentation"))
+    # 删除后文档频率不留下计数为 0 的词
+    assert all(count > 0 for count in index._document_frequency.values())
+
+
+def test_embedder_is_used_instead_of_tfidf():
+    vectors = {"alpha": [1.0, 0.0], "beta": [0.0, 1.0]}
+
+    def embedder(text: str):
+        return vectors["alpha"] if "alpha" in text else vectors["beta"]
+
+    index = RoutingIndex(embedder=embedder)
+    index.add("A", "alpha")
+    index.add("B", "beta")
+    assert index.query("alpha please")[0] == ("A", 1.0)
+    assert index.route("beta please") == "B"
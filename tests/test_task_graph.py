@@ -0,0 +1,112 @@
+import asyncio
+
+import pytest
+
+from task_graph import DagScheduler, TaskGraph, TaskNode, parse_task_graph
+
+
+def test_parse_dependency_lines():
+    graph = parse_task_graph("1 | write code | none\n"
+                             "2. | review code | 1\n"
+                             "3 | write tests | 1\n"
+                             "4 | write docs | 2, 3.\n")
+    assert graph.order == ["1", "2", "3", "4"]
+    assert graph.nodes["4"].depends_on == ["2", "3"]
+    assert graph.nodes["2"].task == "review code"
+    assert graph.sinks() == ["4"]
+
+
+def test_parse_legacy_serial_and_parallel_formats():
+    serial = parse_task_graph("write code; review code; write docs | serial")
+    assert [serial.nodes[node_id].depends_on for node_id in serial.order] == [[], ["1"], ["2"]]
+    parallel = parse_task_graph("write code; write docs | parallel")
+    assert all(not node.depends_on for node in parallel.nodes.values())
+    assert parallel.sinks() == ["1", "2"]
+
+
+def test_parse_rejects_empty_breakdown():
+    with pytest.raises(ValueError):
+        parse_task_graph(" ; | serial")
+
+
+def test_cycle_is_rejected():
+    with pytest.raises(ValueError, match="cycle"):
+        parse_task_graph("1 | a | 3\n2 | b | 1\n3 | c | 2\n")
+    with pytest.raises(ValueError, match="cycle"):
+        TaskGraph([TaskNode("1", "a", ["1"])])
+
+
+def test_unknown_and_duplicate_ids_are_rejected():
+    with pytest.raises(ValueError, match="unknown"):
+        TaskGraph([TaskNode("1", "a", ["9"])])
+    with pytest.raises(ValueError, match="Duplicate"):
+        TaskGraph([TaskNode("1", "a"), TaskNode("1", "b")])
+
+
+def test_scheduler_runs_nodes_after_their_dependencies():
+    graph = parse_task_graph("1 | a | none\n2 | b | 1\n3 | c | 1\n4 | d | 2, 3\n")
+    started = []
+    running = 0
+    max_running = 0
+
+    async def runner(node, upstream):
+        nonlocal running, max_running
+        started.append(node.id)
+        assert set(upstream) == set(node.depends_on)
+        running += 1
+        max_running = max(max_running, running)
+        await asyncio.sleep(0.01)
+        running -= 1
+        return f"{node.task}({','.join(upstream[dep] for dep in node.depends_on)})"
+
+    results = asyncio.run(DagScheduler(max_concurrency=4).run(graph, runner))
+    assert started[0] == "1" and started[-1] == "4"
+    assert set(started[1:3]) == {"2", "3"}
+    # 2 和 3 互不依赖，应当并行执行
+    assert max_running == 2
+    assert results["4"] == "d(b(a()),c(a()))"
+
+
+def test_scheduler_respects_max_concurrency():
+    graph = TaskGraph.parallel([f"task {i}" for i in range(6)])
+    running = 0
+    max_running = 0
+
+    async def runner(node, upstream):
+        nonlocal running, max_running
+        running += 1
+        max_running = max(max_running, running)
+        await asyncio.sleep(0.01)
+        running -= 1
+        return node.id
+
+    results = asyncio.run(DagScheduler(max_concurrency=2).run(graph, runner))
+    assert max_running == 2
+    assert sorted(results) == sorted(graph.nodes)
+
+
+def test_failure_cancels_siblings_and_skips_dependents():
+    graph = parse_task_graph("1 | fails | none\n2 | slow | none\n3 | after 1 | 1\n")
+    started = []
+    cancelled = []
+
+    async def runner(node, upstream):
+        started.append(node.id)
+        if node.id == "1":
+            await asyncio.sleep(0)
+            raise RuntimeError("subtask failed")
+        try:
+            await asyncio.sleep(1)
+        except asyncio.CancelledError:
+            cancelled.append(node.id)
+            raise
+        return node.id
+
+    async def scenario():
+        with pytest.raises(RuntimeError, match="subtask failed"):
+            await DagScheduler(max_concurrency=4).run(graph, runner)
+        await asyncio.sleep(0)
+
+    asyncio.run(scenario())
+    assert "3" not in started
+    assert cancelled == ["2"]